@@ -5,42 +5,103 @@ Endpoints REST pour l'extraction de DQE avec prévisualisation.
 
 Endpoints:
 - POST /dqe/upload      → Upload et analyse du fichier
-- GET  /dqe/{id}/sheets → Liste des onglets avec aperçu
+- GET  /dqe/{id}/sheets → Liste des onglets avec aperçu (?indices=... à la demande)
 - POST /dqe/{id}/select → Sélectionner les onglets
 - POST /dqe/{id}/extract → Extraire les données
+- POST /dqe/extract     → Upload + sélection + extraction en une requête
+- POST /dqe/batch/upload → Upload et analyse parallèle de plusieurs fichiers
+- GET  /dqe/batch/{id}/materials → Agrégat des matériaux de tout le lot
 - GET  /dqe/{id}/download → Télécharger le JSON
+- GET  /dqe/{id}/materials → Matériaux paginés (filtres, tri, curseur)
+- GET  /metrics         → Métriques Prometheus
 
 Installation:
     pip install fastapi uvicorn python-multipart pandas openpyxl
+    pip install brotli zstandard  # optionnel: compression br/zstd
+    pip install orjson            # optionnel: sérialisation JSON rapide
+    pip install prometheus_client # optionnel: endpoint /metrics
 
 Lancement:
     uvicorn dqe_api:app --reload --port 8000
+
+Variables d'environnement (charge):
+    DQE_WORKER_PROCESSES     Processus du pool d'analyse/extraction
+    DQE_WARM_UP              Préchauffe les workers au démarrage (1 par défaut)
+    DQE_MAX_CONCURRENT_JOBS  Tâches admises simultanément
+    DQE_MEMORY_BUDGET_MB     Budget mémoire estimé des tâches admises
+    DQE_MAX_QUEUED_JOBS      Taille de la file (au-delà: 429 + Retry-After)
+    DQE_CLIENT_SHARE         Part max. des places pour un client (X-Client-Id)
+    DQE_QUEUE_TIMEOUT        Attente max. en file, en secondes
+    DQE_UPLOAD_PREVIEW_BUDGET Temps d'aperçus à l'upload (s; < 0: tous les onglets)
+    DQE_AGING_RATE           Vieillissement de la file (lignes créditées par seconde)
+    DQE_BATCH_COST_OFFSET    Pénalité des traitements batch (X-Priority: batch)
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+from urllib.parse import quote
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import functools
 import tempfile
 import os
 import json
+import gzip
+import base64
+import hashlib
+import math
+import time
 import uuid
 from datetime import datetime, timedelta
 import asyncio
 
+# Compressions optionnelles (gzip est toujours disponible)
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Métriques optionnelles (sans prometheus_client, les métriques sont inertes)
+try:
+    from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+    METRICS_AVAILABLE = True
+except ImportError:
+    METRICS_AVAILABLE = False
+
 # Import du module d'extraction
-from dqe_extractor_v2 import DQEExtractorV2
+from dqe_extractor_v2 import (
+    DQEExtractorV2, MaterialsIndex, dumps_json, merge_aggregates,
+    quick_analyze, preview_job, extract_job, select_and_extract_job, timed_call, SheetType,
+    warm_up
+)
 
 
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
 
+class FastJSONResponse(JSONResponse):
+    """Réponse JSON sérialisée avec orjson (repli sur json de la stdlib)"""
+
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
+
 app = FastAPI(
     title="DQE Extractor API",
     description="API pour l'extraction de données DQE depuis des fichiers Excel",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # CORS pour le frontend
@@ -52,12 +113,168 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Stockage temporaire des sessions (en production: Redis/DB)
+# Stockage temporaire des sessions et lots d'imports (en production: Redis/DB)
 sessions: Dict[str, dict] = {}
+batches: Dict[str, dict] = {}
 
 # Configuration
 SESSION_EXPIRY_HOURS = 2
 UPLOAD_DIR = tempfile.gettempdir()
+COMPRESSION_MIN_SIZE = 1024  # En dessous, la compression ne vaut pas le coût
+MATERIALS_PAGE_SIZE = 200
+MATERIALS_MAX_PAGE_SIZE = 1000
+MAX_BATCH_FILES = 30
+# Processus d'analyse/extraction (0 = exécution dans un thread du processus API)
+WORKER_PROCESSES = int(os.getenv("DQE_WORKER_PROCESSES", os.cpu_count() or 1))
+# Préchauffage (pandas, openpyxl, regex) des workers dès le démarrage de l'API
+WARM_UP = os.getenv("DQE_WARM_UP", "1") != "0"
+# Contrôle d'admission: tâches simultanées, budget mémoire et file d'attente
+MAX_CONCURRENT_JOBS = int(os.getenv("DQE_MAX_CONCURRENT_JOBS", max(WORKER_PROCESSES, 1)))
+MEMORY_BUDGET_MB = int(os.getenv("DQE_MEMORY_BUDGET_MB", 1024))
+MAX_QUEUED_JOBS = int(os.getenv("DQE_MAX_QUEUED_JOBS", 64))
+CLIENT_SHARE = float(os.getenv("DQE_CLIENT_SHARE", 0.5))  # Part max. d'un client
+QUEUE_TIMEOUT = float(os.getenv("DQE_QUEUE_TIMEOUT", 120))
+XLSX_MEMORY_FACTOR = 12  # Mémoire pandas/openpyxl par octet de .xlsx
+JOB_BASE_MEMORY = 32 * 1024 * 1024
+# Aperçus: l'upload rend la main après ce budget (secondes), les aperçus
+# restants sont calculés en arrière-plan ou à la demande (/sheets?indices=)
+UPLOAD_PREVIEW_BUDGET = float(os.getenv("DQE_UPLOAD_PREVIEW_BUDGET", 0.5))
+PREVIEW_CHUNK_SIZE = 4
+# Ordonnancement de la file: coût estimé en lignes DQE, vieillissement
+# (lignes créditées par seconde d'attente) et pénalité des traitements batch
+XLSX_BYTES_PER_ITEM = 80
+AGING_RATE = float(os.getenv("DQE_AGING_RATE", 2000))
+BATCH_COST_OFFSET = float(os.getenv("DQE_BATCH_COST_OFFSET", 20000))
+
+
+# =============================================================================
+# MÉTRIQUES
+# =============================================================================
+
+class _NoopMetric:
+    """Métrique inerte utilisée quand prometheus_client est absent"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def _metric(cls_name: str, *args, **kwargs):
+    """Crée une métrique Prometheus, ou une métrique inerte"""
+    if not METRICS_AVAILABLE:
+        return _NoopMetric()
+    return {"counter": Counter, "gauge": Gauge, "histogram": Histogram}[cls_name](*args, **kwargs)
+
+
+HTTP_REQUEST_DURATION = _metric(
+    "histogram", "dqe_http_request_duration_seconds",
+    "Durée des requêtes HTTP par route", ["method", "route", "status"]
+)
+PHASE_DURATION = _metric(
+    "histogram", "dqe_phase_duration_seconds",
+    "Durée des phases de traitement (analyse, extraction, sérialisation...)", ["phase"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+QUEUE_WAIT = _metric(
+    "histogram", "dqe_worker_queue_wait_seconds",
+    "Attente dans la file du pool de traitement", ["phase"]
+)
+UPLOADED_BYTES = _metric("counter", "dqe_uploaded_bytes_total", "Octets reçus en upload")
+UPLOADED_FILES = _metric("counter", "dqe_uploaded_files_total", "Fichiers reçus en upload")
+ITEMS_EXTRACTED = _metric("counter", "dqe_items_extracted_total", "Lignes DQE extraites")
+SHEETS_EXTRACTED = _metric("counter", "dqe_sheets_extracted_total", "Onglets extraits")
+EXTRACTION_THROUGHPUT = _metric(
+    "histogram", "dqe_extraction_items_per_second",
+    "Débit d'extraction (lignes par seconde, par extraction)",
+    buckets=(10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+)
+WORKER_TASKS = _metric("gauge", "dqe_worker_tasks", "Tâches du pool de traitement", ["state"])
+COALESCED_REQUESTS = _metric(
+    "counter", "dqe_coalesced_requests_total",
+    "Traitements identiques rattachés à un traitement déjà en cours", ["phase"]
+)
+CACHE_REQUESTS = _metric(
+    "counter", "dqe_cache_requests_total",
+    "Accès aux caches de session (hit/miss)", ["cache", "result"]
+)
+ADMISSION_JOBS = _metric("gauge", "dqe_admission_jobs", "Tâches admises ou en file", ["state"])
+ADMISSION_MEMORY = _metric(
+    "gauge", "dqe_admission_memory_bytes", "Mémoire estimée des tâches admises"
+)
+ADMISSION_WAIT = _metric(
+    "histogram", "dqe_admission_wait_seconds",
+    "Attente avant admission, par classe de traitement", ["job_class"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+ADMISSION_REJECTED = _metric(
+    "counter", "dqe_admission_rejected_total", "Requêtes refusées par l'admission", ["reason"]
+)
+ACTIVE_SESSIONS = _metric("gauge", "dqe_active_sessions", "Sessions actives")
+ACTIVE_BATCHES = _metric("gauge", "dqe_active_batches", "Lots actifs")
+SESSION_CACHED_BYTES = _metric(
+    "gauge", "dqe_session_cached_bytes",
+    "Octets des téléchargements sérialisés gardés en session"
+)
+
+_tasks_in_flight = 0
+
+
+def _session_cached_bytes() -> int:
+    """Taille des payloads de téléchargement (et variantes) en mémoire"""
+    total = 0
+    for session in list(sessions.values()):
+        payload = session.get("download_payload")
+        if payload:
+            total += len(payload["body"]) + sum(len(v) for v in payload["encoded"].values())
+    return total
+
+
+def _worker_capacity() -> int:
+    """Nombre de tâches exécutables simultanément"""
+    return WORKER_PROCESSES if WORKER_PROCESSES > 0 else (os.cpu_count() or 1) + 4
+
+
+# Les jauges d'état sont calculées au moment de la collecte
+ACTIVE_SESSIONS.set_function(lambda: len(sessions))
+ACTIVE_BATCHES.set_function(lambda: len(batches))
+SESSION_CACHED_BYTES.set_function(_session_cached_bytes)
+WORKER_TASKS.labels("running").set_function(lambda: min(_tasks_in_flight, _worker_capacity()))
+WORKER_TASKS.labels("queued").set_function(lambda: max(_tasks_in_flight - _worker_capacity(), 0))
+
+
+def record_cache(cache: str, hit: bool):
+    """Compte un accès à un cache de session"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_extraction(result: dict, duration: float):
+    """Comptabilise le volume et le débit d'une extraction"""
+    info = result.get("extraction_info", {})
+    items = info.get("total_items", 0)
+    ITEMS_EXTRACTED.inc(items)
+    SHEETS_EXTRACTED.inc(info.get("sheets_extracted", 0))
+    if duration > 0:
+        EXTRACTION_THROUGHPUT.observe(items / duration)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Mesure la durée de chaque requête, étiquetée par route (et non par URL)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.labels(
+            request.method,
+            route.path if route is not None else "unmatched",
+            str(status)
+        ).observe(time.perf_counter() - start)
 
 
 # =============================================================================
@@ -83,22 +300,33 @@ class SheetToggleRequest(BaseModel):
     sheet_name: str
 
 
+class BatchExtractRequest(ExtractRequest):
+    """Options d'extraction d'un lot, avec sélection commune optionnelle"""
+    selection: Optional[SelectSheetsRequest] = None
+
+
 # =============================================================================
 # GESTION DES SESSIONS
 # =============================================================================
 
-def create_session(file_path: str, original_filename: str) -> str:
+def create_session(file_path: str, original_filename: str, content_hash: str) -> str:
     """Crée une nouvelle session"""
     session_id = str(uuid.uuid4())
     sessions[session_id] = {
         "id": session_id,
         "file_path": file_path,
         "original_filename": original_filename,
+        "content_hash": content_hash,
         "created_at": datetime.now().isoformat(),
         "expires_at": (datetime.now() + timedelta(hours=SESSION_EXPIRY_HOURS)).isoformat(),
         "extractor": None,
         "analysis": None,
         "extraction_result": None,
+        "extraction_id": None,
+        "download_payload": None,
+        "materials_index": None,
+        "aggregate_index": None,
+        "preview_task": None,
         "status": "uploaded"
     }
     return session_id
@@ -123,12 +351,36 @@ def cleanup_session(session_id: str):
     """Nettoie une session"""
     if session_id in sessions:
         session = sessions[session_id]
+        if session.get("preview_task") is not None:
+            session["preview_task"].cancel()
         # Supprimer le fichier temporaire
         if os.path.exists(session.get("file_path", "")):
             os.remove(session["file_path"])
         del sessions[session_id]
 
 
+async def save_upload(file: UploadFile) -> Tuple[str, str]:
+    """
+    Vérifie le format et enregistre le fichier uploadé.
+    
+    Returns:
+        (chemin du fichier, empreinte SHA-256 du contenu)
+    """
+    if not file.filename.endswith(('.xlsx', '.xls', '.xlsm')):
+        raise HTTPException(
+            status_code=400, 
+            detail="Format de fichier non supporté. Utilisez .xlsx ou .xls"
+        )
+    
+    file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}_{file.filename}")
+    content = await file.read()
+    UPLOADED_BYTES.inc(len(content))
+    UPLOADED_FILES.inc()
+    with open(file_path, 'wb') as f:
+        f.write(content)
+    return file_path, hashlib.sha256(content).hexdigest()
+
+
 async def cleanup_expired_sessions():
     """Tâche de nettoyage des sessions expirées"""
     while True:
@@ -139,69 +391,864 @@ async def cleanup_expired_sessions():
         ]
         for sid in expired:
             cleanup_session(sid)
+        for bid in [bid for bid, b in batches.items()
+                    if datetime.fromisoformat(b["expires_at"]) < datetime.now()]:
+            del batches[bid]
+
+
+# =============================================================================
+# CONTRÔLE D'ADMISSION
+# =============================================================================
+# Limite le nombre de tâches d'analyse/extraction simultanées et la mémoire
+# qu'elles sont censées consommer. Au-delà, les tâches attendent dans une
+# file bornée; une file pleine répond 429 avec Retry-After. Tant que
+# d'autres clients attendent, un client ne peut occuper plus de
+# CLIENT_SHARE des places, pour qu'un import massif n'affame pas les
+# utilisateurs interactifs.
+#
+# La file est servie par coût estimé croissant (plus court d'abord): un
+# classeur de 2 onglets n'attend pas derrière un de 150. Le vieillissement
+# réduit le coût effectif avec l'attente, pour que les gros traitements
+# passent malgré tout; les traitements batch/CLI portent une pénalité.
+#
+# Même algorithme que ControleurAdmission de l'extracteur PDF
+# (scripts/btp_pdf_extractor/admission.py), lancé et déployé à part: voir
+# sa docstring. Une modification se reporte dans les deux.
+
+class _Waiter:
+    """Tâche en attente d'admission"""
+
+    __slots__ = ("client", "weight", "cost", "batch", "enqueued_at", "future")
+
+    def __init__(self, client: str, weight: int, cost: float, batch: bool,
+                 future: asyncio.Future):
+        self.client = client
+        self.weight = weight
+        self.cost = cost
+        self.batch = batch
+        self.enqueued_at = time.monotonic()
+        self.future = future
+
+
+class AdmissionController:
+    """Admission pondérée par la mémoire, avec file bornée et part par client"""
+
+    def __init__(self, max_concurrent: int, memory_budget: int, max_queue: int,
+                 client_share: float, queue_timeout: float,
+                 aging_rate: float = AGING_RATE, batch_offset: float = BATCH_COST_OFFSET):
+        self.max_concurrent = max(max_concurrent, 1)
+        self.memory_budget = memory_budget
+        self.max_queue = max_queue
+        self.client_limit = max(1, math.ceil(self.max_concurrent * client_share))
+        self.client_queue_limit = max(1, math.ceil(max_queue * client_share))
+        self.queue_timeout = queue_timeout
+        self.aging_rate = aging_rate
+        self.batch_offset = batch_offset
+        self.active = 0
+        self.memory = 0
+        self._running: Dict[str, int] = {}
+        self._waiters: List[_Waiter] = []
+        self._avg_duration = 1.0  # Moyenne glissante des durées, pour Retry-After
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _fits(self, weight: int) -> bool:
+        # Une tâche seule est toujours admise, même au-delà du budget
+        if self.active >= self.max_concurrent:
+            return False
+        return self.active == 0 or self.memory + weight <= self.memory_budget
+
+    def _over_share(self, client: str) -> bool:
+        return self._running.get(client, 0) >= self.client_limit
+
+    def _start(self, client: str, weight: int):
+        self.active += 1
+        self.memory += weight
+        self._running[client] = self._running.get(client, 0) + 1
+
+    def _priority(self, waiter: _Waiter, now: float) -> float:
+        """Coût effectif: estimation + pénalité batch - crédit d'attente"""
+        cost = waiter.cost + (self.batch_offset if waiter.batch else 0.0)
+        return cost - (now - waiter.enqueued_at) * self.aging_rate
+
+    def _pick(self) -> Optional[_Waiter]:
+        """
+        Prochaine tâche à admettre: la moins coûteuse parmi les clients sous
+        leur part. Si elle ne tient pas dans le budget mémoire, rien n'est
+        admis: les tâches plus légères ne la doublent pas indéfiniment.
+        """
+        fair = [w for w in self._waiters if not self._over_share(w.client)]
+        candidates = fair or self._waiters
+        if not candidates:
+            return None
+        now = time.monotonic()
+        best = min(candidates, key=lambda w: self._priority(w, now))
+        return best if self._fits(best.weight) else None
+
+    def _dispatch(self):
+        """Admet les tâches en attente tant que les ressources le permettent"""
+        while self._waiters:
+            waiter = self._pick()
+            if waiter is None:
+                break
+            self._waiters.remove(waiter)
+            self._start(waiter.client, waiter.weight)
+            ADMISSION_WAIT.labels("batch" if waiter.batch else "interactive").observe(
+                time.monotonic() - waiter.enqueued_at
+            )
+            waiter.future.set_result(None)
+
+    def retry_after(self) -> int:
+        """Délai conseillé (secondes) avant de soumettre à nouveau"""
+        rounds = (self.queued + 1) / self.max_concurrent
+        return max(1, math.ceil(rounds * self._avg_duration))
+
+    def _reject(self, reason: str, status_code: int, detail: str):
+        ADMISSION_REJECTED.labels(reason).inc()
+        raise HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after())}
+        )
+
+    def ensure_capacity(self, client: str, count: int = 1):
+        """Refuse (429) si la file ne peut accueillir `count` tâches du client"""
+        if self.queued + count > self.max_queue:
+            self._reject("queue_full", 429, "Serveur saturé, réessayez plus tard")
+        client_queued = sum(1 for w in self._waiters if w.client == client)
+        if client_queued + count > self.client_queue_limit:
+            self._reject("client_quota", 429, "Trop de traitements en attente pour ce client")
+
+    async def acquire(self, client: str, weight: int, cost: float = 0.0,
+                      batch: bool = False, check_queue: bool = True):
+        """Attend une place; lève 429 si la file est pleine, 503 après QUEUE_TIMEOUT"""
+        weight = min(weight, self.memory_budget)
+        if not self._waiters and self._fits(weight):
+            self._start(client, weight)
+            ADMISSION_WAIT.labels("batch" if batch else "interactive").observe(0.0)
+            return
+        if check_queue:
+            self.ensure_capacity(client)
+        
+        waiter = _Waiter(client, weight, cost, batch, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done():
+                # Admise entre-temps: rendre la place
+                self.release(client, weight, 0.0)
+            else:
+                self._waiters.remove(waiter)
+                waiter.future.cancel()
+                # Elle pouvait bloquer la file (trop lourde pour le budget): admettre les suivantes
+                self._dispatch()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._reject("timeout", 503, "Délai d'attente dépassé, réessayez plus tard")
+
+    def release(self, client: str, weight: int, duration: float):
+        """Libère une place et admet les tâches suivantes"""
+        self.active -= 1
+        self.memory -= weight
+        self._running[client] -= 1
+        if not self._running[client]:
+            del self._running[client]
+        if duration > 0:
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def admit(self, client: str, weight: int, cost: float = 0.0,
+                    batch: bool = False, check_queue: bool = True):
+        """Contexte d'exécution d'une tâche admise"""
+        weight = min(weight, self.memory_budget)
+        await self.acquire(client, weight, cost, batch, check_queue)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(client, weight, time.perf_counter() - start)
+
+
+admission = AdmissionController(
+    max_concurrent=MAX_CONCURRENT_JOBS,
+    memory_budget=MEMORY_BUDGET_MB * 1024 * 1024,
+    max_queue=MAX_QUEUED_JOBS,
+    client_share=CLIENT_SHARE,
+    queue_timeout=QUEUE_TIMEOUT
+)
+
+ADMISSION_JOBS.labels("running").set_function(lambda: admission.active)
+ADMISSION_JOBS.labels("queued").set_function(lambda: admission.queued)
+ADMISSION_MEMORY.set_function(lambda: admission.memory)
+
+
+def client_id(request: Request) -> str:
+    """Identifiant du client pour le partage équitable (X-Client-Id, sinon IP)"""
+    client = request.headers.get("x-client-id")
+    if client:
+        return client[:64]
+    return request.client.host if request.client else "anonymous"
+
+
+def is_batch_request(request: Request) -> bool:
+    """Traitement non interactif (en-tête X-Priority: batch, ex. scripts/CLI)"""
+    return request.headers.get("x-priority", "").lower() == "batch"
+
+
+def estimate_job_cost(file_path: str, extractor: Optional[DQEExtractorV2] = None) -> float:
+    """
+    Coût estimé d'une tâche, en lignes DQE: lignes estimées des onglets
+    sélectionnés une fois l'analyse faite, sinon d'après la taille du fichier.
+    """
+    if extractor is not None and extractor.previews:
+        selected = [p for p in extractor.previews if p.name in set(extractor.selected_sheets)]
+        if all(p.is_analyzed for p in selected):
+            return float(sum(p.estimated_items for p in selected))
+        share = len(selected) / len(extractor.previews)
+        return os.path.getsize(file_path) / XLSX_BYTES_PER_ITEM * share
+    return os.path.getsize(file_path) / XLSX_BYTES_PER_ITEM
+
+
+def estimate_job_memory(file_path: str, sheets: Optional[int] = None,
+                        total_sheets: Optional[int] = None) -> int:
+    """
+    Estime la mémoire d'une analyse/extraction: le classeur est chargé en
+    entier, puis seuls les onglets traités sont convertis en DataFrames.
+    """
+    size = os.path.getsize(file_path) * XLSX_MEMORY_FACTOR
+    if sheets and total_sheets:
+        size = size * (1 + sheets / total_sheets) / 2
+    return JOB_BASE_MEMORY + int(size)
+
+
+# =============================================================================
+# POOL DE TRAITEMENT
+# =============================================================================
+# L'analyse et l'extraction (pandas/openpyxl) sont liées au CPU: elles
+# tournent dans un pool de processus pour ne pas bloquer la boucle asyncio
+# et pour traiter plusieurs fichiers en parallèle.
+
+_worker_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_worker_pool() -> Optional[ProcessPoolExecutor]:
+    """Pool de processus partagé, créé au premier usage"""
+    global _worker_pool
+    if _worker_pool is None and WORKER_PROCESSES > 0:
+        # Chaque worker charge pandas/openpyxl une fois, à son démarrage
+        _worker_pool = ProcessPoolExecutor(max_workers=WORKER_PROCESSES, initializer=warm_up)
+    return _worker_pool
+
+
+async def warm_up_workers():
+    """
+    Démarre et préchauffe les workers en arrière-plan: la première requête
+    ne paie ni le lancement des processus ni l'import de pandas.
+    """
+    started = time.perf_counter()
+    pool = get_worker_pool()
+    if pool is None:
+        await asyncio.to_thread(warm_up)
+    else:
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(pool, os.getpid) for _ in range(WORKER_PROCESSES)
+        ))
+    PHASE_DURATION.labels("warm_up").observe(time.perf_counter() - started)
+
+
+async def run_in_worker(phase: str, fn, *args, **kwargs):
+    """
+    Exécute une tâche du module d'extraction hors de la boucle asyncio.
+
+    La durée d'exécution est mesurée dans le worker; l'écart avec la durée
+    totale correspond à l'attente dans la file du pool.
+    """
+    global _tasks_in_flight
+    pool = get_worker_pool()
+    call = functools.partial(timed_call, fn, *args, **kwargs)
+    start = time.perf_counter()
+    _tasks_in_flight += 1
+    try:
+        if pool is None:
+            result, elapsed = await asyncio.to_thread(call)
+        else:
+            result, elapsed = await asyncio.get_running_loop().run_in_executor(pool, call)
+    finally:
+        _tasks_in_flight -= 1
+    PHASE_DURATION.labels(phase).observe(elapsed)
+    QUEUE_WAIT.labels(phase).observe(max(time.perf_counter() - start - elapsed, 0.0))
+    return result, elapsed
+
+
+# Traitements en cours, par empreinte du contenu et paramètres: plusieurs
+# personnes qui envoient le même DQE au même moment partagent un seul
+# traitement (chacune garde sa session). Pendant de partager_extraction()
+# dans l'API de l'extracteur PDF.
+_in_flight: Dict[tuple, asyncio.Future] = {}
+
+
+async def single_flight(key: tuple, factory):
+    """
+    Exécute factory() ou, si un traitement de même clé est déjà en cours,
+    attend son résultat. L'annulation d'un demandeur n'interrompt pas le
+    traitement partagé.
+    """
+    future = _in_flight.get(key)
+    if future is not None:
+        COALESCED_REQUESTS.labels(key[0]).inc()
+    else:
+        future = asyncio.ensure_future(factory())
+        _in_flight[key] = future
+        
+        def _done(f: asyncio.Future):
+            _in_flight.pop(key, None)
+            if not f.cancelled():
+                f.exception()  # Évite l'avertissement si personne n'attend plus
+        
+        future.add_done_callback(_done)
+    return await asyncio.shield(future)
+
+
+def _own_analysis(shared: dict, file_path: str) -> dict:
+    """Copie d'une analyse (éventuellement partagée) propre à une session"""
+    return {**shared, "file_info": {**shared["file_info"], "path": file_path}}
+
+
+def _own_result(shared: dict, file_path: str) -> dict:
+    """Copie d'un résultat d'extraction propre à une session"""
+    return {**shared, "data": {**shared["data"], "source_file": file_path}}
+
+
+async def analyze_session(session: dict, client: str, batch: bool = False,
+                          check_queue: bool = True,
+                          time_budget: Optional[float] = None) -> dict:
+    """
+    Analyse le fichier d'une session dans le pool et stocke le résultat.
+    
+    Avec un time_budget, les onglets non prévisualisés dans le temps
+    imparti sont complétés en arrière-plan (voir complete_previews).
+    """
+    file_path = session["file_path"]
+    
+    async def analyze():
+        weight = estimate_job_memory(file_path)
+        cost = estimate_job_cost(file_path)
+        async with admission.admit(client, weight, cost, batch, check_queue):
+            analysis, _ = await run_in_worker("analyze", quick_analyze, file_path, time_budget)
+        return analysis
+    
+    shared = await single_flight(("analyze", session["content_hash"], time_budget), analyze)
+    analysis = _own_analysis(shared, file_path)
+    
+    extractor = DQEExtractorV2(filepath=session["file_path"])
+    extractor.load_analysis(analysis)
+    
+    session["extractor"] = extractor
+    session["analysis"] = analysis
+    session["status"] = "analyzed"
+    if extractor.pending_previews():
+        session["preview_task"] = asyncio.create_task(complete_previews(session, client))
+    return analysis
+
+
+async def load_previews(session: dict, indices: List[int], client: str,
+                        batch: bool = False, check_queue: bool = True):
+    """Calcule dans le pool les aperçus manquants parmi `indices`"""
+    extractor = session["extractor"]
+    pending = set(extractor.pending_previews())
+    missing = sorted(i for i in set(indices) if i in pending)
+    if not missing:
+        return
+    
+    file_path = session["file_path"]
+    
+    async def compute():
+        share = len(missing) / max(len(extractor.previews), 1)
+        weight = estimate_job_memory(file_path, len(missing), len(extractor.previews))
+        cost = estimate_job_cost(file_path) * share
+        async with admission.admit(client, weight, cost, batch, check_queue):
+            previews, _ = await run_in_worker("preview", preview_job, file_path, missing)
+        return previews
+    
+    previews = await single_flight(("preview", session["content_hash"], tuple(missing)), compute)
+    extractor.update_previews(previews)
+    session["analysis"] = extractor.get_analysis()
+
+
+async def complete_previews(session: dict, client: str):
+    """Complète en arrière-plan, par petits groupes, les aperçus manquants"""
+    extractor = session["extractor"]
+    try:
+        while extractor.pending_previews() and session["id"] in sessions:
+            chunk = extractor.pending_previews()[:PREVIEW_CHUNK_SIZE]
+            await load_previews(session, chunk, client, batch=True, check_queue=False)
+    except HTTPException as e:
+        session["preview_error"] = e.detail
+    except Exception as e:
+        session["preview_error"] = f"Erreur d'analyse: {e}"
+    finally:
+        session["preview_task"] = None
+
+
+async def ensure_typed_previews(session: dict, sheet_types: Optional[List[str]], client: str):
+    """Avant une sélection par type, calcule les aperçus dont le type est inconnu"""
+    if not sheet_types:
+        return
+    extractor = session["extractor"]
+    unknown = [
+        p.index for p in extractor.previews
+        if not p.is_analyzed and p.sheet_type == SheetType.UNKNOWN.value
+    ]
+    await load_previews(session, unknown, client)
+
+
+async def run_extraction(session: dict, options: "ExtractRequest", client: str,
+                         batch: bool = False, check_queue: bool = True) -> dict:
+    """Extrait les onglets sélectionnés (dans le pool) et met à jour la session"""
+    extractor = session["extractor"]
+    weight = estimate_job_memory(
+        session["file_path"],
+        sheets=len(extractor.selected_sheets),
+        total_sheets=len(extractor.previews)
+    )
+    cost = estimate_job_cost(session["file_path"], extractor)
+    
+    async def extract():
+        async with admission.admit(client, weight, cost, batch, check_queue):
+            (result, sheets), elapsed = await run_in_worker(
+                "extract",
+                extract_job,
+                session["file_path"],
+                extractor.get_analysis(),
+                include_metadata=options.include_metadata
+            )
+        record_extraction(result, elapsed)
+        return result, sheets
+    
+    key = ("extract", session["content_hash"], tuple(extractor.selected_sheets),
+           options.include_metadata)
+    shared, extractor.results = await single_flight(key, extract)
+    result = _own_result(shared, session["file_path"])
+    store_extraction(session, result, options)
+    return result
+
+
+def store_extraction(session: dict, result: dict, options: "ExtractRequest"):
+    """Enregistre un résultat d'extraction dans la session"""
+    extractor = session["extractor"]
+    
+    # Ajouter l'agrégation si demandée
+    if options.aggregate_materials:
+        result["aggregated_materials"] = extractor.aggregate_by_material()
+    
+    session["extraction_result"] = result
+    session["extraction_id"] = uuid.uuid4().hex[:8]  # Invalide l'agrégat du lot (get_batch_materials)
+    session["download_payload"] = None  # Resérialisé au prochain téléchargement
+    session["materials_index"] = None
+    session["aggregate_index"] = None
+    start = time.perf_counter()
+    get_materials_index(session, aggregate=False)
+    PHASE_DURATION.labels("index").observe(time.perf_counter() - start)
+    session["status"] = "extracted"
+
+
+# =============================================================================
+# RÉPONSES HTTP (compression, ETag, Range)
+# =============================================================================
+
+def _supported_encodings() -> List[str]:
+    """Encodages disponibles, par ordre de préférence serveur"""
+    encodings = []
+    if ZSTD_AVAILABLE:
+        encodings.append("zstd")
+    if BROTLI_AVAILABLE:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> str:
+    """
+    Choisit l'encodage de réponse à partir de l'en-tête Accept-Encoding.
+
+    Respecte les q-values du client; à qualité égale, la préférence
+    serveur (zstd > br > gzip) l'emporte. Retourne 'identity' sinon.
+    """
+    if not accept_encoding:
+        return "identity"
+
+    qualities = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qualities[token] = q
+
+    best, best_q = "identity", 0.0
+    for encoding in _supported_encodings():
+        q = qualities.get(encoding, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    """Compresse un corps de réponse avec l'encodage négocié"""
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(body)
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def build_json_response(request: Request, content, status_code: int = 200) -> Response:
+    """Sérialise un corps JSON et le compresse si le client l'accepte"""
+    body = dumps_json(content)
+    headers = {"Vary": "Accept-Encoding"}
+
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        if encoding != "identity":
+            body = compress_body(body, encoding)
+            headers["Content-Encoding"] = encoding
+
+    return Response(
+        content=body,
+        status_code=status_code,
+        media_type="application/json",
+        headers=headers
+    )
+
+
+def get_download_payload(session: dict) -> dict:
+    """
+    Retourne le JSON téléchargeable de la session, sérialisé une seule fois
+    par extraction. Les variantes compressées sont mises en cache au fil
+    des demandes.
+    """
+    payload = session.get("download_payload")
+    record_cache("download", payload is not None)
+    if payload is None:
+        start = time.perf_counter()
+        body = dumps_json(session["extraction_result"], indent=True)
+        PHASE_DURATION.labels("serialize").observe(time.perf_counter() - start)
+        payload = {
+            "body": body,
+            "etag": hashlib.sha256(body).hexdigest()[:32],
+            "encoded": {}
+        }
+        session["download_payload"] = payload
+    return payload
+
+
+def _encoded_variant(payload: dict, encoding: str) -> bytes:
+    """Variante compressée du payload (calculée une fois par encodage)"""
+    if encoding == "identity":
+        return payload["body"]
+    record_cache("download_" + encoding, encoding in payload["encoded"])
+    if encoding not in payload["encoded"]:
+        start = time.perf_counter()
+        payload["encoded"][encoding] = compress_body(payload["body"], encoding)
+        PHASE_DURATION.labels("compress").observe(time.perf_counter() - start)
+    return payload["encoded"][encoding]
+
+
+def _etag_matches(header: Optional[str], etag: str, weak: bool = True) -> bool:
+    """
+    Compare If-None-Match (comparaison faible) ou If-Range (weak=False:
+    comparaison forte, cf. RFC 9110) à l'ETag de la représentation servie.
+    Les étiquettes sont comparées entières: une variante compressée
+    ("<empreinte>-gzip") ne valide ni la représentation identité ni une
+    autre variante, et inversement.
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return weak   # If-Range n'accepte pas "*"
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            if not weak:
+                continue
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse un en-tête Range simple ('bytes=a-b', 'bytes=a-', 'bytes=-n').
+
+    Returns:
+        (début, fin incluse), ou None si la plage est invalide ou multiple
+        (la réponse complète est alors servie).
+
+    Raises:
+        HTTPException 416 si la plage est hors du contenu
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    start_str, _, end_str = spec.strip().partition("-")
+    try:
+        if not start_str:
+            length = int(end_str)
+            if length <= 0:
+                raise ValueError
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Plage demandée non satisfaisable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+
+def _content_disposition(filename: str) -> str:
+    """En-tête Content-Disposition compatible avec les noms non ASCII"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+
+# =============================================================================
+# PAGINATION DES MATÉRIAUX
+# =============================================================================
+
+def get_materials_index(session: dict, aggregate: bool):
+    """Index des matériaux de la session, construit une fois par extraction"""
+    key = "aggregate_index" if aggregate else "materials_index"
+    record_cache(key, session.get(key) is not None)
+    if session.get(key) is None:
+        session[key] = session["extractor"].build_materials_index(aggregate=aggregate)
+    return session[key]
+
+
+def _query_fingerprint(params: dict) -> str:
+    """Empreinte des paramètres de requête liés à un curseur"""
+    raw = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(version: str, offset: int, params: dict) -> str:
+    """Curseur opaque: version de l'index, position et empreinte de la requête"""
+    raw = json.dumps({"v": version, "o": offset, "f": _query_fingerprint(params)})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, version: str, params: dict) -> int:
+    """Décode un curseur et retourne l'offset; 400 s'il est invalide ou périmé"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        offset = int(data["o"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+    if data.get("v") != version or data.get("f") != _query_fingerprint(params):
+        raise HTTPException(
+            status_code=400,
+            detail="Curseur périmé: relancez la requête sans curseur"
+        )
+    return max(offset, 0)
 
 
 # =============================================================================
 # ENDPOINTS
 # =============================================================================
 
+def resolve_preview_budget(preview_budget: Optional[float]) -> Optional[float]:
+    """Budget d'aperçus de l'upload: paramètre de requête, sinon configuration"""
+    budget = preview_budget if preview_budget is not None else UPLOAD_PREVIEW_BUDGET
+    return budget if budget >= 0 else None
+
+
 @app.post("/dqe/upload", summary="Upload et analyse d'un fichier DQE")
-async def upload_dqe(file: UploadFile = File(...)):
+async def upload_dqe(
+    request: Request,
+    file: UploadFile = File(...),
+    preview_budget: Optional[float] = Query(
+        default=None,
+        description="Secondes consacrées aux aperçus avant de répondre (défaut: DQE_UPLOAD_PREVIEW_BUDGET)"
+    )
+):
     """
     Upload un fichier Excel DQE et retourne un aperçu des onglets.
     
+    Tous les onglets (nom, index) sont listés immédiatement; les aperçus
+    non calculés dans le budget (`is_analyzed: false`, `complete: false`)
+    sont complétés en arrière-plan ou à la demande via
+    `/dqe/{id}/sheets?indices=...`.
+    
     - **file**: Fichier Excel (.xlsx, .xls)
+    - **preview_budget**: Budget d'aperçus en secondes (négatif: tous)
     
     Returns:
         - session_id: ID de session pour les opérations suivantes
         - analysis: Aperçu de tous les onglets
     """
-    # Vérifier le type de fichier
-    if not file.filename.endswith(('.xlsx', '.xls', '.xlsm')):
-        raise HTTPException(
-            status_code=400, 
-            detail="Format de fichier non supporté. Utilisez .xlsx ou .xls"
-        )
+    file_path, content_hash = await save_upload(file)
     
-    # Sauvegarder le fichier
-    file_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}_{file.filename}")
+    # Créer la session
+    session_id = create_session(file_path, file.filename, content_hash)
+    session = sessions[session_id]
     
     try:
-        content = await file.read()
-        with open(file_path, 'wb') as f:
-            f.write(content)
-        
-        # Créer la session
-        session_id = create_session(file_path, file.filename)
-        session = sessions[session_id]
-        
         # Analyser le fichier
-        extractor = DQEExtractorV2(filepath=file_path)
-        analysis = extractor.analyze()
-        
-        # Stocker dans la session
-        session["extractor"] = extractor
-        session["analysis"] = analysis
-        session["status"] = "analyzed"
+        analysis = await analyze_session(
+            session, client_id(request), is_batch_request(request),
+            time_budget=resolve_preview_budget(preview_budget)
+        )
         
-        return {
+        return build_json_response(request, {
             "status": "success",
             "session_id": session_id,
             "message": f"Fichier '{file.filename}' analysé avec succès",
             "analysis": analysis
-        }
+        })
         
+    except HTTPException:
+        cleanup_session(session_id)
+        raise
     except Exception as e:
         # Nettoyer en cas d'erreur
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        cleanup_session(session_id)
         raise HTTPException(status_code=500, detail=f"Erreur d'analyse: {str(e)}")
 
 
+@app.post("/dqe/extract", summary="Upload, sélection et extraction en une requête")
+async def upload_and_extract(
+    request: Request,
+    file: UploadFile = File(...),
+    sheet_names: Optional[List[str]] = Form(default=None),
+    sheet_indices: Optional[List[int]] = Form(default=None),
+    sheet_types: Optional[List[str]] = Form(default=None),
+    exclude_names: Optional[List[str]] = Form(default=None),
+    include_metadata: bool = Form(default=True),
+    aggregate_materials: bool = Form(default=False)
+):
+    """
+    Enchaîne /upload, /select et /extract en un seul aller-retour.
+    
+    Seuls les onglets retenus par les critères sont analysés en détail;
+    chaque onglet n'est lu qu'une fois. La session créée reste utilisable
+    (/download, /materials...).
+    
+    - **file**: Fichier Excel (.xlsx, .xls)
+    - **sheet_names**, **sheet_indices**, **sheet_types**, **exclude_names**:
+      critères de /select (champs répétables)
+    - **include_metadata**, **aggregate_materials**: options de /extract
+    """
+    selection_request = SelectSheetsRequest(
+        sheet_names=sheet_names,
+        sheet_indices=sheet_indices,
+        sheet_types=sheet_types,
+        exclude_names=exclude_names
+    )
+    extract_request = ExtractRequest(
+        include_metadata=include_metadata,
+        aggregate_materials=aggregate_materials
+    )
+    
+    file_path, content_hash = await save_upload(file)
+    session_id = create_session(file_path, file.filename, content_hash)
+    session = sessions[session_id]
+    
+    criteria = {
+        "sheet_names": selection_request.sheet_names,
+        "sheet_indices": selection_request.sheet_indices,
+        "sheet_types": selection_request.sheet_types,
+        "exclude_names": selection_request.exclude_names
+    }
+    client = client_id(request)
+    batch = is_batch_request(request)
+    
+    async def select_and_extract():
+        async with admission.admit(client, estimate_job_memory(file_path),
+                                   estimate_job_cost(file_path), batch):
+            outcome, elapsed = await run_in_worker(
+                "select_extract",
+                select_and_extract_job,
+                file_path,
+                criteria,
+                include_metadata=extract_request.include_metadata
+            )
+        if outcome[2] is not None:
+            record_extraction(outcome[2], elapsed)
+        return outcome
+    
+    try:
+        key = ("select_extract", content_hash, json.dumps(criteria, sort_keys=True),
+               extract_request.include_metadata)
+        shared_analysis, selection, shared, sheets = await single_flight(key, select_and_extract)
+        
+        if shared is None:
+            raise HTTPException(status_code=400, detail="Aucun onglet ne correspond aux critères")
+        analysis = _own_analysis(shared_analysis, file_path)
+        result = _own_result(shared, file_path)
+        
+        extractor = DQEExtractorV2(filepath=file_path)
+        extractor.load_analysis(analysis)
+        extractor.results = sheets
+        session["extractor"] = extractor
+        session["analysis"] = analysis
+        store_extraction(session, result, extract_request)
+        
+    except HTTPException:
+        cleanup_session(session_id)
+        raise
+    except Exception as e:
+        cleanup_session(session_id)
+        raise HTTPException(status_code=500, detail=f"Erreur d'extraction: {str(e)}")
+    
+    return build_json_response(request, {
+        "session_id": session_id,
+        "selection": selection,
+        **result
+    })
+
+
 @app.get("/dqe/{session_id}/sheets", summary="Liste des onglets disponibles")
-async def get_sheets(session_id: str):
+async def get_sheets(
+    session_id: str,
+    request: Request,
+    indices: Optional[str] = Query(
+        default=None,
+        description="Indices d'onglets séparés par des virgules: aperçus calculés à la demande"
+    )
+):
     """
     Retourne la liste des onglets avec leur aperçu.
+    
+    Avec **indices**, seuls ces onglets sont retournés et leurs aperçus
+    manquants sont calculés avant de répondre (ex. onglets visibles à
+    l'écran). Sinon, tous les onglets sont retournés en l'état:
+    `pending_previews` indique combien d'aperçus restent à calculer.
     """
     session = get_session(session_id)
     
@@ -210,15 +1257,27 @@ async def get_sheets(session_id: str):
     
     extractor = session["extractor"]
     
+    if indices is not None:
+        try:
+            wanted = {int(i) for i in indices.split(",") if i.strip()}
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Paramètre indices invalide")
+        await load_previews(session, list(wanted), client_id(request), is_batch_request(request))
+        sheets = [s for s in session["analysis"]["sheets"] if s["index"] in wanted]
+    else:
+        sheets = session["analysis"]["sheets"]
+    
     return {
         "session_id": session_id,
-        "sheets": session["analysis"]["sheets"],
+        "sheets": sheets,
+        "complete": session["analysis"]["complete"],
+        "pending_previews": len(extractor.pending_previews()),
         "selection_status": extractor.get_selection_status()
     }
 
 
 @app.post("/dqe/{session_id}/select", summary="Sélectionner les onglets à extraire")
-async def select_sheets(session_id: str, request: SelectSheetsRequest):
+async def select_sheets(session_id: str, request: SelectSheetsRequest, http_request: Request):
     """
     Sélectionne les onglets à extraire.
     
@@ -229,6 +1288,7 @@ async def select_sheets(session_id: str, request: SelectSheetsRequest):
     """
     session = get_session(session_id)
     extractor = session["extractor"]
+    await ensure_typed_previews(session, request.sheet_types, client_id(http_request))
     
     result = extractor.select_sheets(
         sheet_names=request.sheet_names,
@@ -280,7 +1340,8 @@ async def toggle_sheet(session_id: str, request: SheetToggleRequest):
 
 
 @app.post("/dqe/{session_id}/extract", summary="Extraire les données")
-async def extract_data(session_id: str, request: ExtractRequest = ExtractRequest()):
+async def extract_data(session_id: str, http_request: Request,
+                       request: ExtractRequest = ExtractRequest()):
     """
     Extrait les données des onglets sélectionnés.
     
@@ -298,24 +1359,25 @@ async def extract_data(session_id: str, request: ExtractRequest = ExtractRequest
         )
     
     try:
-        result = extractor.extract(include_metadata=request.include_metadata)
-        
-        # Ajouter l'agrégation si demandée
-        if request.aggregate_materials:
-            result["aggregated_materials"] = extractor.aggregate_by_material()
-        
-        session["extraction_result"] = result
-        session["status"] = "extracted"
-        
-        return result
+        result = await run_extraction(session, request, client_id(http_request),
+                                      is_batch_request(http_request))
+        return build_json_response(http_request, result)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur d'extraction: {str(e)}")
 
 
 @app.get("/dqe/{session_id}/download", summary="Télécharger le JSON extrait")
-async def download_json(session_id: str):
-    """Télécharge le résultat de l'extraction au format JSON."""
+async def download_json(session_id: str, request: Request):
+    """
+    Télécharge le résultat de l'extraction au format JSON.
+
+    Le JSON est sérialisé une seule fois par extraction puis servi depuis
+    la session: compression négociée (Accept-Encoding), ETag fort avec
+    réponse 304 sur If-None-Match, et reprise partielle via Range.
+    """
     session = get_session(session_id)
     
     if not session.get("extraction_result"):
@@ -324,27 +1386,74 @@ async def download_json(session_id: str):
             detail="Aucune extraction effectuée. Utilisez /extract d'abord."
         )
     
-    # Créer le fichier JSON
-    json_path = os.path.join(UPLOAD_DIR, f"dqe_extract_{session_id}.json")
-    with open(json_path, 'w', encoding='utf-8') as f:
-        json.dump(session["extraction_result"], f, ensure_ascii=False, indent=2)
+    payload = get_download_payload(session)
+    filename = f"dqe_extract_{session['original_filename'].replace('.xlsx', '')}.json"
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+        "Content-Disposition": _content_disposition(filename)
+    }
+    
+    # Les plages portent sur la représentation non compressée
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or _etag_matches(if_range, f'"{payload["etag"]}"', weak=False)):
+        body = payload["body"]
+        byte_range = parse_range(range_header, len(body))
+        if byte_range:
+            start, end = byte_range
+            headers["ETag"] = f'"{payload["etag"]}"'
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            return Response(
+                content=body[start:end + 1],
+                status_code=206,
+                media_type="application/json",
+                headers=headers
+            )
+    
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding == "identity":
+        headers["ETag"] = f'"{payload["etag"]}"'
+    else:
+        headers["ETag"] = f'"{payload["etag"]}-{encoding}"'
+        headers["Content-Encoding"] = encoding
+    
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
     
-    return FileResponse(
-        path=json_path,
-        filename=f"dqe_extract_{session['original_filename'].replace('.xlsx', '')}.json",
-        media_type="application/json"
+    return Response(
+        content=_encoded_variant(payload, encoding),
+        media_type="application/json",
+        headers=headers
     )
 
 
 @app.get("/dqe/{session_id}/materials", summary="Liste des matériaux extraits")
-async def get_materials(session_id: str, aggregate: bool = False):
+async def get_materials(
+    session_id: str,
+    request: Request,
+    aggregate: bool = False,
+    sheet: Optional[str] = None,
+    category: Optional[str] = None,
+    unite: Optional[str] = None,
+    q: Optional[str] = Query(default=None, description="Texte contenu dans la désignation"),
+    sort: Optional[str] = Query(default=None, enum=["quantite", "montant"]),
+    order: str = Query(default="desc", enum=["asc", "desc"]),
+    limit: int = Query(default=MATERIALS_PAGE_SIZE, ge=1, le=MATERIALS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
     """
-    Retourne la liste des matériaux extraits.
+    Retourne une page des matériaux extraits.
     
     - **aggregate**: Agréger les matériaux similaires
+    - **sheet**, **category**, **unite**: Filtres exacts
+    - **q**: Recherche dans la désignation
+    - **sort** / **order**: Tri par quantité ou montant
+    - **limit**: Taille de page
+    - **cursor**: Curseur `next_cursor` de la page précédente
     """
     session = get_session(session_id)
-    extractor = session["extractor"]
     
     if not session.get("extraction_result"):
         raise HTTPException(
@@ -352,10 +1461,258 @@ async def get_materials(session_id: str, aggregate: bool = False):
             detail="Aucune extraction effectuée. Utilisez /extract d'abord."
         )
     
-    if aggregate:
-        return {"materials": extractor.aggregate_by_material()}
-    else:
-        return {"materials": extractor.get_all_materials()}
+    if aggregate and (category or sort == "montant"):
+        raise HTTPException(
+            status_code=400,
+            detail="Les agrégats ne se filtrent pas par catégorie ni ne se trient par montant"
+        )
+    
+    index = get_materials_index(session, aggregate)
+    filters = {"sheet": sheet, "unite": unite}
+    if not aggregate:
+        filters["category"] = category
+    params = {"aggregate": aggregate, "q": q, "sort": sort, "order": order, "limit": limit, **filters}
+    offset = decode_cursor(cursor, index.version, params) if cursor else 0
+    
+    materials, total, next_offset = index.query(
+        filters=filters,
+        search=q,
+        sort=sort,
+        descending=(order == "desc"),
+        offset=offset,
+        limit=limit
+    )
+    
+    return build_json_response(request, {
+        "materials": materials,
+        "total": total,
+        "limit": limit,
+        "next_cursor": encode_cursor(index.version, next_offset, params) if next_offset is not None else None
+    })
+
+
+# =============================================================================
+# IMPORTS PAR LOTS (plusieurs fichiers)
+# =============================================================================
+
+def get_batch(batch_id: str) -> dict:
+    """Récupère un lot et ses sessions encore actives"""
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="Lot non trouvé")
+    return batches[batch_id]
+
+
+def _batch_sessions(batch: dict) -> List[dict]:
+    """Sessions du lot qui existent encore"""
+    return [sessions[sid] for sid in batch["session_ids"] if sid in sessions]
+
+
+def _unique_filenames(batch_sessions: List[dict]) -> List[str]:
+    """Noms de fichiers des sessions, rendus uniques dans le lot ("devis (2).xlsx")"""
+    names, seen = [], set()
+    for session in batch_sessions:
+        stem, ext = os.path.splitext(session["original_filename"])
+        name, n = session["original_filename"], 1
+        while name in seen:
+            n += 1
+            name = f"{stem} ({n}){ext}"
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+@app.post("/dqe/batch/upload", summary="Upload et analyse de plusieurs fichiers DQE")
+async def upload_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    preview_budget: Optional[float] = Query(
+        default=None,
+        description="Secondes consacrées aux aperçus de chaque fichier (voir /dqe/upload)"
+    )
+):
+    """
+    Upload plusieurs fichiers Excel (un par lot ou par bâtiment) et les
+    analyse en parallèle dans le pool de traitement.
+    
+    Chaque fichier reçoit sa propre session, utilisable avec les endpoints
+    /dqe/{id}/...; le lot regroupe ces sessions.
+    """
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Trop de fichiers ({len(files)}), maximum {MAX_BATCH_FILES}"
+        )
+    
+    # Le lot est admis en entier ou refusé avant tout traitement
+    client = client_id(request)
+    admission.ensure_capacity(client, len(files))
+    
+    session_ids = []
+    try:
+        for file in files:
+            file_path, content_hash = await save_upload(file)
+            session_ids.append(create_session(file_path, file.filename, content_hash))
+    except HTTPException:
+        for sid in session_ids:
+            cleanup_session(sid)
+        raise
+    
+    analyses = await asyncio.gather(
+        *(analyze_session(sessions[sid], client, batch=True, check_queue=False,
+                          time_budget=resolve_preview_budget(preview_budget))
+          for sid in session_ids),
+        return_exceptions=True
+    )
+    
+    batch_id = str(uuid.uuid4())
+    batches[batch_id] = {
+        "id": batch_id,
+        "session_ids": session_ids,
+        "created_at": datetime.now().isoformat(),
+        "expires_at": (datetime.now() + timedelta(hours=SESSION_EXPIRY_HOURS)).isoformat(),
+        "aggregate_index": None,
+        "aggregate_members": None   # (session, extraction) indexées dans aggregate_index
+    }
+    
+    results = []
+    for sid, analysis in zip(session_ids, analyses):
+        entry = {"session_id": sid, "filename": sessions[sid]["original_filename"]}
+        if isinstance(analysis, Exception):
+            entry.update(status="error", error=f"Erreur d'analyse: {analysis}")
+            cleanup_session(sid)
+        else:
+            entry.update(status="analyzed", analysis=analysis)
+        results.append(entry)
+    
+    return build_json_response(request, {
+        "status": "success",
+        "batch_id": batch_id,
+        "files": results
+    })
+
+
+@app.post("/dqe/batch/{batch_id}/extract", summary="Extraire tous les fichiers d'un lot")
+async def extract_batch(batch_id: str, http_request: Request,
+                        request: BatchExtractRequest = BatchExtractRequest()):
+    """
+    Extrait en parallèle les onglets sélectionnés de chaque fichier du lot.
+    
+    - **selection**: Critères de /select appliqués à tous les fichiers
+      (sinon la sélection propre à chaque session est conservée)
+    - **include_metadata**, **aggregate_materials**: options de /extract
+    """
+    batch = get_batch(batch_id)
+    batch_sessions = _batch_sessions(batch)
+    
+    if request.selection:
+        client = client_id(http_request)
+        await asyncio.gather(*(
+            ensure_typed_previews(session, request.selection.sheet_types, client)
+            for session in batch_sessions
+        ))
+        for session in batch_sessions:
+            session["extractor"].select_sheets(
+                sheet_names=request.selection.sheet_names,
+                sheet_indices=request.selection.sheet_indices,
+                sheet_types=request.selection.sheet_types,
+                exclude_names=request.selection.exclude_names
+            )
+            session["status"] = "selected"
+    
+    to_extract = [s for s in batch_sessions if s["extractor"].selected_sheets]
+    client = client_id(http_request)
+    admission.ensure_capacity(client, len(to_extract))
+    outcomes = await asyncio.gather(
+        *(run_extraction(session, request, client, batch=True, check_queue=False)
+          for session in to_extract),
+        return_exceptions=True
+    )
+    
+    files = []
+    for session, outcome in zip(to_extract, outcomes):
+        entry = {"session_id": session["id"], "filename": session["original_filename"]}
+        if isinstance(outcome, Exception):
+            entry.update(status="error", error=f"Erreur d'extraction: {outcome}")
+        else:
+            entry.update(status="extracted", extraction_info=outcome["extraction_info"])
+        files.append(entry)
+    
+    return build_json_response(http_request, {"batch_id": batch_id, "files": files})
+
+
+@app.get("/dqe/batch/{batch_id}/materials", summary="Agrégat des matériaux de tout le lot")
+async def get_batch_materials(
+    batch_id: str,
+    request: Request,
+    unite: Optional[str] = None,
+    q: Optional[str] = Query(default=None, description="Texte contenu dans la désignation"),
+    limit: int = Query(default=MATERIALS_PAGE_SIZE, ge=1, le=MATERIALS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """
+    Agrège les matériaux de tous les fichiers extraits du lot
+    (quantités cumulées, fichiers et onglets d'origine), paginé comme
+    /dqe/{id}/materials.
+    """
+    batch = get_batch(batch_id)
+    extracted = [s for s in _batch_sessions(batch) if s.get("extraction_result")]
+    
+    if not extracted:
+        raise HTTPException(
+            status_code=400,
+            detail="Aucune extraction effectuée. Utilisez /dqe/batch/{id}/extract d'abord."
+        )
+    
+    # Reconstruit dès qu'une session du lot a été extraite à nouveau (par le
+    # lot ou seule via /dqe/{id}/extract) ou n'existe plus
+    members = [(s["id"], s["extraction_id"]) for s in extracted]
+    if batch["aggregate_index"] is None or batch["aggregate_members"] != members:
+        merged = merge_aggregates({
+            name: s["extractor"].aggregate_by_material()
+            for name, s in zip(_unique_filenames(extracted), extracted)
+        })
+        batch["aggregate_index"] = MaterialsIndex(
+            merged,
+            facets={'unite': 'unite'},
+            sort_fields={'quantite': 'total_quantite'}
+        )
+        batch["aggregate_members"] = members
+    index = batch["aggregate_index"]
+    
+    params = {"batch": batch_id, "unite": unite, "q": q, "limit": limit}
+    offset = decode_cursor(cursor, index.version, params) if cursor else 0
+    materials, total, next_offset = index.query(
+        filters={"unite": unite}, search=q, offset=offset, limit=limit
+    )
+    
+    return build_json_response(request, {
+        "batch_id": batch_id,
+        "files_count": len(extracted),
+        "materials": materials,
+        "total": total,
+        "limit": limit,
+        "next_cursor": encode_cursor(index.version, next_offset, params) if next_offset is not None else None
+    })
+
+
+@app.get("/dqe/batch/{batch_id}", summary="Statut d'un lot")
+async def get_batch_status(batch_id: str):
+    """Retourne le statut de chaque session du lot."""
+    batch = get_batch(batch_id)
+    
+    return {
+        "batch_id": batch_id,
+        "created_at": batch["created_at"],
+        "expires_at": batch["expires_at"],
+        "files": [
+            {
+                "session_id": s["id"],
+                "filename": s["original_filename"],
+                "status": s["status"]
+            }
+            for s in _batch_sessions(batch)
+        ]
+    }
 
 
 @app.delete("/dqe/{session_id}", summary="Supprimer une session")
@@ -379,6 +1736,8 @@ async def get_status(session_id: str):
         "created_at": session["created_at"],
         "expires_at": session["expires_at"],
         "has_analysis": session.get("analysis") is not None,
+        "pending_previews": len(session["extractor"].pending_previews()) if session.get("extractor") else None,
+        "preview_error": session.get("preview_error"),
         "has_extraction": session.get("extraction_result") is not None
     }
 
@@ -393,10 +1752,27 @@ async def health_check():
     return {
         "status": "healthy",
         "version": "2.0.0",
-        "active_sessions": len(sessions)
+        "active_sessions": len(sessions),
+        "running_jobs": admission.active,
+        "queued_jobs": admission.queued
     }
 
 
+@app.get("/metrics", summary="Métriques Prometheus", include_in_schema=False)
+async def metrics():
+    """
+    Expose les métriques au format Prometheus: latences par route et par
+    phase, volumes traités, file du pool, sessions, caches et mémoire du
+    processus (process_resident_memory_bytes).
+    """
+    if not METRICS_AVAILABLE:
+        raise HTTPException(
+            status_code=503,
+            detail="Métriques indisponibles: installez prometheus_client"
+        )
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 # =============================================================================
 # STARTUP
 # =============================================================================
@@ -405,6 +1781,15 @@ async def health_check():
 async def startup_event():
     """Démarre les tâches de fond."""
     asyncio.create_task(cleanup_expired_sessions())
+    if WARM_UP:
+        asyncio.create_task(warm_up_workers())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Arrête le pool de traitement."""
+    if _worker_pool is not None:
+        _worker_pool.shutdown(wait=False, cancel_futures=True)
 
 
 # =============================================================================
@@ -435,4 +1820,10 @@ curl -X POST "http://localhost:8000/dqe/abc-123/extract" \
 
 # 5. Télécharger le JSON
 curl "http://localhost:8000/dqe/abc-123/download" -o extraction.json
+
+# Variante en une requête (étapes 1 à 4)
+curl -X POST "http://localhost:8000/dqe/extract" \
+     -F "file=@DQE_ACHAT_CHINE.xlsx" \
+     -F "sheet_types=detailed" \
+     -F "aggregate_materials=true"
 """
@@ -5,6 +5,7 @@ Module avec prévisualisation et sélection des onglets avant extraction.
 
 Workflow:
 1. analyze() → Retourne la liste des onglets avec aperçu
+   (analyze(time_budget=...) → aperçus partiels, complétés par compute_previews())
 2. select_sheets() → Choisir les onglets à extraire
 3. extract() → Extraire uniquement les onglets sélectionnés
 
@@ -12,14 +13,57 @@ Auteur: Claude pour Studia Lab / Franck
 Version: 2.0
 """
 
-import pandas as pd
+from __future__ import annotations
+
+import importlib
+import io
+import os
 import json
 import re
+import time
+import uuid
+import zipfile
+import posixpath
+import xml.etree.ElementTree as ET
 from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass, asdict, field
 from enum import Enum
 from datetime import datetime
 
+class _LazyModule:
+    """Module importé au premier accès à l'un de ses attributs"""
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr: str):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+# pandas (~0.5 s d'import) n'est chargé qu'au premier onglet lu: l'API
+# démarre sans lui, les workers le préchargent via warm_up()
+pd = _LazyModule("pandas")
+
+# Sérialisation rapide optionnelle (repli sur json de la stdlib)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Métadonnées techniques (niveau, dosage, dimensions, épaisseur): détecteur
+# de l'extracteur PDF, module sans dépendance importé comme sous-module du
+# dépôt (sans les autres modules du service PDF). Optionnel: sans le
+# répertoire du service PDF, les articles ne sont pas enrichis.
+try:
+    from scripts.btp_pdf_extractor.metadonnees import detecter_metadonnees
+    METADONNEES_AVAILABLE = True
+except ImportError:
+    METADONNEES_AVAILABLE = False
+
 
 # =============================================================================
 # STRUCTURES DE DONNÉES
@@ -59,6 +103,7 @@ class SheetPreview:
     sample_categories: List[str] = field(default_factory=list)
     sample_items: List[str] = field(default_factory=list)
     is_selected: bool = True  # Par défaut, tous sélectionnés
+    is_analyzed: bool = True  # False: aperçu non calculé (nom et index seulement)
 
 
 @dataclass
@@ -72,6 +117,11 @@ class DQEItem:
     montant_total: Optional[float] = None
     category: Optional[str] = None
     subcategory: Optional[str] = None
+    # Métadonnées techniques détectées dans la désignation
+    niveau: Optional[str] = None
+    dosage: Optional[str] = None
+    dimensions: Optional[str] = None
+    epaisseur: Optional[str] = None
 
 
 @dataclass
@@ -141,42 +191,79 @@ class DQEExtractorV2:
             filepath: Chemin vers le fichier Excel
             file_content: Contenu binaire du fichier (pour upload)
         """
+        if not filepath and not file_content:
+            raise ValueError("filepath ou file_content requis")
+        
         self.filepath = filepath
         self.file_content = file_content
-        self.xlsx = None
+        self._xlsx = None
+        self._sheet_names: Optional[List[str]] = None
         self.previews: List[SheetPreview] = []
         self.selected_sheets: List[str] = []
         self.results: List[DQESheet] = []
         self._is_analyzed = False
-        
-        # Charger le fichier
-        self._load_file()
+        self._frames: Dict[str, pd.DataFrame] = {}  # Onglets déjà lus, consommés par extract()
+    
+    @property
+    def xlsx(self) -> pd.ExcelFile:
+        """Classeur Excel, ouvert au premier accès"""
+        if self._xlsx is None:
+            self._load_file()
+        return self._xlsx
+    
+    @property
+    def sheet_names(self) -> List[str]:
+        """Noms des onglets, lus sans charger le classeur quand c'est possible"""
+        if self._sheet_names is None:
+            source = self.filepath or io.BytesIO(self.file_content)
+            self._sheet_names = list_sheet_names(source)
+            if self._sheet_names is None:
+                self._sheet_names = list(self.xlsx.sheet_names)
+        return self._sheet_names
     
     def _load_file(self):
         """Charge le fichier Excel"""
         if self.filepath:
-            self.xlsx = pd.ExcelFile(self.filepath)
-        elif self.file_content:
-            import io
-            self.xlsx = pd.ExcelFile(io.BytesIO(self.file_content))
+            self._xlsx = pd.ExcelFile(self.filepath)
         else:
-            raise ValueError("filepath ou file_content requis")
+            self._xlsx = pd.ExcelFile(io.BytesIO(self.file_content))
+    
+    def load_analysis(self, analysis: Dict):
+        """
+        Restaure l'état d'analyse et de sélection à partir d'un résultat
+        d'analyze() (par exemple calculé dans un autre processus).
+        """
+        self.previews = [SheetPreview(**sheet) for sheet in analysis["sheets"]]
+        self.selected_sheets = [p.name for p in self.previews if p.is_selected]
+        self._is_analyzed = True
     
     # =========================================================================
     # ÉTAPE 1: ANALYSE ET PRÉVISUALISATION
     # =========================================================================
     
-    def analyze(self) -> Dict:
+    def analyze(self, time_budget: Optional[float] = None) -> Dict:
         """
         Analyse le fichier et retourne un aperçu de tous les onglets.
         
+        Args:
+            time_budget: Durée max. (secondes) consacrée aux aperçus. Une fois
+                dépassée, les onglets restants n'ont qu'un aperçu minimal
+                (nom, index, type déduit du nom; is_analyzed=False), à
+                compléter avec compute_previews(). None: pas de limite.
+        
         Returns:
             Dict avec la liste des onglets et leurs caractéristiques
         """
+        start = time.perf_counter()
         self.previews = []
         
-        for idx, sheet_name in enumerate(self.xlsx.sheet_names):
-            preview = self._analyze_sheet(idx, sheet_name)
+        for idx, sheet_name in enumerate(self.sheet_names):
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                preview = self._skeleton_preview(idx, sheet_name)
+                preview.is_selected = True
+            else:
+                preview = self._analyze_sheet(idx, sheet_name)
+                self._frames.pop(sheet_name, None)  # Ne pas garder tout le classeur en mémoire
             self.previews.append(preview)
         
         self._is_analyzed = True
@@ -184,9 +271,106 @@ class DQEExtractorV2:
         
         return self._get_analysis_result()
     
+    def analyze_for_selection(self,
+                              sheet_names: List[str] = None,
+                              sheet_indices: List[int] = None,
+                              sheet_types: List[str] = None,
+                              exclude_names: List[str] = None) -> Dict:
+        """
+        Analyse minimale pour une extraction directe: seuls les onglets
+        retenus par les critères reçoivent un aperçu complet. Les autres
+        ne sont lus que si leur type ne se déduit pas du nom.
+        
+        Les critères sont ceux de select_sheets(), qui est appliqué ensuite.
+        Les onglets lus sont conservés pour l'extraction qui suit.
+        
+        Returns:
+            Dict de sélection (comme select_sheets())
+        """
+        no_criteria = not sheet_names and not sheet_indices and not sheet_types
+        self.previews = []
+        
+        for idx, sheet_name in enumerate(self.sheet_names):
+            if exclude_names and sheet_name in exclude_names:
+                wanted = False
+            elif no_criteria:
+                wanted = True
+            elif (sheet_names and sheet_name in sheet_names) or (sheet_indices and idx in sheet_indices):
+                wanted = True
+            elif sheet_types:
+                sheet_type = self._detect_sheet_type_from_name(sheet_name)
+                if sheet_type is None:
+                    sheet_type = self._detect_sheet_type(sheet_name, self._read_sheet(sheet_name))
+                wanted = sheet_type.value in sheet_types
+                if not wanted:
+                    self._frames.pop(sheet_name, None)
+                    self.previews.append(self._skeleton_preview(idx, sheet_name, sheet_type))
+                    continue
+            else:
+                wanted = False
+            
+            if wanted:
+                self.previews.append(self._analyze_sheet(idx, sheet_name))
+            else:
+                self.previews.append(self._skeleton_preview(idx, sheet_name))
+        
+        self._is_analyzed = True
+        return self.select_sheets(
+            sheet_names=sheet_names,
+            sheet_indices=sheet_indices,
+            sheet_types=sheet_types,
+            exclude_names=exclude_names
+        )
+    
+    def compute_previews(self, indices: List[int]) -> List[SheetPreview]:
+        """Calcule les aperçus complets des onglets demandés (indices invalides ignorés)"""
+        names = self.sheet_names
+        previews = []
+        for idx in sorted(set(indices)):
+            if 0 <= idx < len(names):
+                previews.append(self._analyze_sheet(idx, names[idx]))
+                self._frames.pop(names[idx], None)
+        return previews
+    
+    def update_previews(self, previews: List[Dict]):
+        """
+        Intègre des aperçus calculés à part (compute_previews, autre
+        processus). Les aperçus déjà complets et la sélection sont conservés.
+        """
+        for data in previews:
+            idx = data["index"]
+            if 0 <= idx < len(self.previews) and not self.previews[idx].is_analyzed:
+                data = {**data, "is_selected": self.previews[idx].is_selected}
+                self.previews[idx] = SheetPreview(**data)
+    
+    def pending_previews(self) -> List[int]:
+        """Indices des onglets dont l'aperçu n'est pas encore calculé"""
+        return [p.index for p in self.previews if not p.is_analyzed]
+    
+    def _skeleton_preview(self, index: int, sheet_name: str,
+                          sheet_type: Optional[SheetType] = None) -> SheetPreview:
+        """Aperçu non calculé: nom, index et type s'il est connu"""
+        sheet_type = sheet_type or self._detect_sheet_type_from_name(sheet_name) or SheetType.UNKNOWN
+        return SheetPreview(
+            index=index,
+            name=sheet_name,
+            sheet_type=sheet_type.value,
+            rows_count=0,
+            cols_count=0,
+            estimated_items=0,
+            is_selected=False,
+            is_analyzed=False
+        )
+    
+    def _read_sheet(self, sheet_name: str) -> pd.DataFrame:
+        """Lit un onglet (une seule fois entre l'analyse et l'extraction directe)"""
+        if sheet_name not in self._frames:
+            self._frames[sheet_name] = pd.read_excel(self.xlsx, sheet_name=sheet_name, header=None)
+        return self._frames[sheet_name]
+    
     def _analyze_sheet(self, index: int, sheet_name: str) -> SheetPreview:
         """Analyse un onglet et génère son aperçu"""
-        df = pd.read_excel(self.xlsx, sheet_name=sheet_name, header=None)
+        df = self._read_sheet(sheet_name)
         
         # Détecter le type
         sheet_type = self._detect_sheet_type(sheet_name, df)
@@ -215,8 +399,8 @@ class DQEExtractorV2:
             is_selected=True
         )
     
-    def _detect_sheet_type(self, sheet_name: str, df: pd.DataFrame) -> SheetType:
-        """Détecte le type d'onglet"""
+    def _detect_sheet_type_from_name(self, sheet_name: str) -> Optional[SheetType]:
+        """Détecte le type d'onglet à partir de son seul nom (None si indéterminé)"""
         name_lower = sheet_name.lower()
         
         if 'recap' in name_lower:
@@ -225,6 +409,13 @@ class DQEExtractorV2:
             return SheetType.DETAILED
         elif any(x in name_lower for x in ['type', 'achat', 'pog', 'ages']):
             return SheetType.SUMMARY
+        return None
+    
+    def _detect_sheet_type(self, sheet_name: str, df: pd.DataFrame) -> SheetType:
+        """Détecte le type d'onglet"""
+        sheet_type = self._detect_sheet_type_from_name(sheet_name)
+        if sheet_type is not None:
+            return sheet_type
         
         # Analyse du contenu
         content_str = df.head(50).to_string().lower()
@@ -278,10 +469,16 @@ class DQEExtractorV2:
         
         return categories, items
     
+    def get_analysis(self) -> Dict:
+        """Retourne l'analyse courante (aperçus calculés ou non)"""
+        return self._get_analysis_result()
+    
     def _get_analysis_result(self) -> Dict:
         """Formate le résultat de l'analyse"""
+        pending = len(self.pending_previews())
         return {
             "status": "analyzed",
+            "complete": pending == 0,
             "file_info": {
                 "path": self.filepath,
                 "total_sheets": len(self.previews)
@@ -291,7 +488,8 @@ class DQEExtractorV2:
                 "detailed_sheets": len([p for p in self.previews if p.sheet_type == "detailed"]),
                 "summary_sheets": len([p for p in self.previews if p.sheet_type == "summary"]),
                 "recap_sheets": len([p for p in self.previews if p.sheet_type == "recap"]),
-                "total_estimated_items": sum(p.estimated_items for p in self.previews)
+                "total_estimated_items": sum(p.estimated_items for p in self.previews),
+                "pending_previews": pending
             }
         }
     
@@ -459,7 +657,13 @@ class DQEExtractorV2:
     
     def _extract_sheet(self, sheet_name: str, sheet_type: str) -> Optional[DQESheet]:
         """Extrait les données d'un onglet spécifique"""
-        df = pd.read_excel(self.xlsx, sheet_name=sheet_name, header=None)
+        df = self._read_sheet(sheet_name)
+        self._frames.pop(sheet_name, None)
+        
+        # Aperçu pas encore calculé (analyse avec time_budget): le type ne se
+        # déduisait pas du nom, on le détermine ici sur le contenu
+        if sheet_type == SheetType.UNKNOWN.value:
+            sheet_type = self._detect_sheet_type(sheet_name, df).value
         
         if sheet_type == "recap":
             return self._extract_recap_sheet(sheet_name, df)
@@ -710,7 +914,8 @@ class DQEExtractorV2:
                 quantite=self._safe_float(row.iloc[col_mapping['quantite']]) or 0,
                 prix_unitaire=self._safe_float(row.iloc[col_mapping['pu']]),
                 montant_total=self._safe_float(row.iloc[col_mapping['montant']]),
-                category=category
+                category=category,
+                **self._metadonnees(designation)
             )
         except Exception:
             return None
@@ -728,11 +933,25 @@ class DQEExtractorV2:
                 unite=self._normalize_unit(str(row.iloc[col_mapping['unite']])),
                 quantite=self._safe_float(row.iloc[col_mapping['quantite']]) or 0,
                 montant_total=self._safe_float(row.iloc[col_mapping.get('total', 4)]),
-                category=category
+                category=category,
+                **self._metadonnees(designation)
             )
         except Exception:
             return None
     
+    @staticmethod
+    def _metadonnees(designation: str) -> Dict[str, Optional[str]]:
+        """Niveau, dosage, dimensions et épaisseur (comme les éléments PDF)"""
+        if not METADONNEES_AVAILABLE:
+            return {}
+        meta = detecter_metadonnees(designation)
+        return {
+            'niveau': meta.niveau,
+            'dosage': meta.dosage,
+            'dimensions': meta.dimensions,
+            'epaisseur': meta.epaisseur,
+        }
+
     def _normalize_unit(self, unit: str) -> str:
         """Normalise les unités"""
         unit = unit.upper().strip()
@@ -771,8 +990,10 @@ class DQEExtractorV2:
     
     def _format_extraction_result(self, include_metadata: bool, stats: Dict) -> Dict:
         """Formate le résultat de l'extraction"""
+        # vars() plutôt qu'asdict(): les items sont plats, la copie
+        # récursive d'asdict() coûte cher sur des milliers de lignes
         def convert_item(item: DQEItem) -> Dict:
-            return {k: v for k, v in asdict(item).items() if v is not None}
+            return {k: v for k, v in vars(item).items() if v is not None}
         
         def convert_category(cat: DQECategory) -> Dict:
             result = {
@@ -879,15 +1100,342 @@ class DQEExtractorV2:
         normalized = re.sub(r'[^\w\s]', '', normalized)
         return normalized[:100]
 
+    def build_materials_index(self, aggregate: bool = False) -> 'MaterialsIndex':
+        """Construit l'index de requête des matériaux (liste plate ou agrégée)"""
+        if aggregate:
+            return MaterialsIndex(
+                self.aggregate_by_material(),
+                facets={'sheet': 'sheets', 'unite': 'unite'},
+                sort_fields={'quantite': 'total_quantite'}
+            )
+        return MaterialsIndex(self.get_all_materials())
+
+
+# =============================================================================
+# INDEX DES MATÉRIAUX (pagination et filtres côté serveur)
+# =============================================================================
+
+class MaterialsIndex:
+    """
+    Index en mémoire des matériaux extraits, construit une fois après
+    l'extraction:
+    - un index exact par facette (onglet, catégorie, unité)
+    - un tableau trié par clé de tri (quantité, montant)
+    - un index inversé des tokens de désignation pour la recherche
+    """
+
+    def __init__(self,
+                 rows: List[Dict],
+                 facets: Dict[str, str] = None,
+                 sort_fields: Dict[str, str] = None):
+        """
+        Args:
+            rows: Lignes à indexer (ordre naturel conservé)
+            facets: Filtre exposé → champ de la ligne (scalaire ou liste)
+            sort_fields: Clé de tri exposée → champ numérique de la ligne
+        """
+        self.rows = rows
+        self.version = uuid.uuid4().hex[:8]  # Invalide les curseurs d'un index précédent
+        self.facets = facets or {'sheet': 'sheet', 'category': 'category', 'unite': 'unite'}
+        self.sort_fields = sort_fields or {'quantite': 'quantite', 'montant': 'montant_total'}
+
+        # Index exacts: facette → valeur → positions
+        self._facet_index: Dict[str, Dict[str, List[int]]] = {}
+        for name, row_field in self.facets.items():
+            index: Dict[str, List[int]] = {}
+            for pos, row in enumerate(rows):
+                values = row.get(row_field)
+                if not isinstance(values, list):
+                    values = [values]
+                for value in values:
+                    if value is not None:
+                        index.setdefault(str(value).upper(), []).append(pos)
+            self._facet_index[name] = index
+
+        # Ordres de tri: positions triées par valeur croissante, valeurs absentes à part
+        self._sorted: Dict[str, Tuple[List[int], List[int]]] = {}
+        for name, row_field in self.sort_fields.items():
+            present = [pos for pos, row in enumerate(rows) if row.get(row_field) is not None]
+            present.sort(key=lambda pos: rows[pos][row_field])
+            missing = [pos for pos, row in enumerate(rows) if row.get(row_field) is None]
+            self._sorted[name] = (present, missing)
+
+        # Index inversé des désignations
+        self._designations = [self._normalize(row.get('designation') or '') for row in rows]
+        self._tokens: Dict[str, List[int]] = {}
+        for pos, designation in enumerate(self._designations):
+            for token in set(re.findall(r'\w+', designation)):
+                self._tokens.setdefault(token, []).append(pos)
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return re.sub(r'\s+', ' ', text.lower()).strip()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _search(self, text: str) -> set:
+        """Positions dont la désignation contient le texte recherché"""
+        needle = self._normalize(text)
+        candidates = None
+        for token in set(re.findall(r'\w+', needle)):
+            # Le token peut n'être qu'un fragment d'un mot indexé
+            matched = set()
+            for indexed, positions in self._tokens.items():
+                if token in indexed:
+                    matched.update(positions)
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return set()
+
+        if candidates is None:
+            candidates = range(len(self.rows))
+        return {pos for pos in candidates if needle in self._designations[pos]}
+
+    def query(self,
+              filters: Dict[str, Optional[str]] = None,
+              search: Optional[str] = None,
+              sort: Optional[str] = None,
+              descending: bool = False,
+              offset: int = 0,
+              limit: int = 100) -> Tuple[List[Dict], int, Optional[int]]:
+        """
+        Filtre, trie et pagine les lignes indexées.
+
+        Args:
+            filters: Valeurs exactes par facette (insensibles à la casse)
+            search: Sous-chaîne recherchée dans la désignation
+            sort: Clé de tri (None = ordre naturel)
+            descending: Tri décroissant (valeurs absentes toujours en fin)
+            offset: Position de départ dans le résultat filtré
+            limit: Taille de page
+
+        Returns:
+            (lignes de la page, total filtré, offset suivant ou None)
+        """
+        if sort is not None and sort not in self._sorted:
+            raise ValueError(f"Clé de tri inconnue: {sort}")
+
+        selected = None
+        for name, value in (filters or {}).items():
+            if value is None:
+                continue
+            if name not in self._facet_index:
+                raise ValueError(f"Filtre inconnu: {name}")
+            positions = set(self._facet_index[name].get(value.upper(), ()))
+            selected = positions if selected is None else selected & positions
+
+        if search:
+            found = self._search(search)
+            selected = found if selected is None else selected & found
+
+        if sort is None:
+            ordered = range(len(self.rows)) if selected is None else sorted(selected)
+        else:
+            present, missing = self._sorted[sort]
+            ordered = (present[::-1] if descending else present) + missing
+            if selected is not None:
+                ordered = [pos for pos in ordered if pos in selected]
+
+        total = len(ordered)
+        page = [self.rows[pos] for pos in ordered[offset:offset + limit]]
+        next_offset = offset + limit if offset + limit < total else None
+        return page, total, next_offset
+
+
+# =============================================================================
+# SÉRIALISATION JSON
+# =============================================================================
+
+def _json_default(obj):
+    """Convertit les types non natifs JSON (Enum, numpy, dataclasses...)"""
+    if isinstance(obj, Enum):
+        return obj.value
+    if hasattr(obj, '__dataclass_fields__'):
+        return asdict(obj)
+    if hasattr(obj, 'item'):  # Scalaires numpy
+        return obj.item()
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Type non sérialisable: {type(obj).__name__}")
+
+
+def dumps_json(obj: Any, indent: bool = False) -> bytes:
+    """
+    Sérialise directement en bytes UTF-8.
+
+    Utilise orjson si disponible (sans passer par jsonable_encoder),
+    sinon json de la stdlib avec un rendu équivalent.
+    """
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_json_default, option=option)
+
+    if indent:
+        text = json.dumps(obj, ensure_ascii=False, indent=2, default=_json_default)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+    return text.encode('utf-8')
+
+
+# =============================================================================
+# AGRÉGATION MULTI-FICHIERS
+# =============================================================================
+
+def merge_aggregates(aggregates: Dict[str, List[Dict]]) -> List[Dict]:
+    """
+    Fusionne les agrégats de plusieurs fichiers (aggregate_by_material()).
+    
+    Args:
+        aggregates: Nom de fichier → agrégat du fichier
+    
+    Returns:
+        Agrégat inter-fichiers trié par quantité décroissante
+    """
+    merged: Dict[str, Dict] = {}
+    
+    for filename, rows in aggregates.items():
+        for row in rows:
+            entry = merged.get(row['key'])
+            if entry is None:
+                entry = merged[row['key']] = {
+                    'key': row['key'],
+                    'designation': row['designation'],
+                    'unite': row['unite'],
+                    'total_quantite': 0,
+                    'occurrences': 0,
+                    'files': [],
+                    'sheets': []
+                }
+            entry['total_quantite'] += row['total_quantite']
+            entry['occurrences'] += row['occurrences']
+            if filename not in entry['files']:
+                entry['files'].append(filename)
+            for sheet in row['sheets']:
+                if sheet not in entry['sheets']:
+                    entry['sheets'].append(sheet)
+    
+    return sorted(merged.values(), key=lambda x: x['total_quantite'], reverse=True)
+
 
 # =============================================================================
 # FONCTIONS UTILITAIRES POUR API
 # =============================================================================
+# Les fonctions *_job sont exécutées dans des processus de travail: elles
+# prennent et retournent des données sérialisables (pickle).
+
+def warm_up():
+    """
+    Précharge pandas/openpyxl et compile les expressions régulières en
+    exécutant l'analyse et l'extraction sur un mini-onglet. Prévu comme
+    initialiseur des processus de traitement: le coût est payé au démarrage
+    du worker plutôt qu'à la première requête. N'échoue jamais.
+    """
+    try:
+        import openpyxl  # noqa: F401  (lecteur de pd.read_excel)
+        
+        df = pd.DataFrame([
+            ["Libreville le 12 janvier 2024", None, None, None, None, None],
+            ["BAT : 12A", "Devis N° 2024-01", None, None, None, None],
+            ["N°", "DESIGNATION", "UNITE", "QUANTITE", "PRIX UNITAIRE", "MONTANT"],
+            [None, "MACONNERIE", None, None, None, None],
+            ["1", "Béton dosé à 350 kg/m3", "M3", 2, 100, 200],
+            [None, "SOUS TOTAL", None, None, None, 200],
+            ["12A", 200, None, None, None, None],
+        ])
+        extractor = DQEExtractorV2(file_content=b"warm-up")
+        extractor._frames["N° 1"] = df
+        extractor._analyze_sheet(0, "N° 1")
+        extractor._extract_detailed_sheet("N° 1", df)
+        extractor._extract_summary_sheet("SYNTHESE", df)
+        extractor._extract_recap_sheet("RECAP", df)
+    except Exception:
+        pass
 
-def quick_analyze(filepath: str) -> Dict:
-    """Analyse rapide d'un fichier DQE"""
+
+def timed_call(fn, *args, **kwargs) -> Tuple[Any, float]:
+    """Exécute fn et retourne (résultat, durée d'exécution en secondes)"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def list_sheet_names(source) -> Optional[List[str]]:
+    """
+    Noms des feuilles de calcul d'un .xlsx/.xlsm, dans l'ordre du classeur,
+    lus dans xl/workbook.xml sans charger les données (quelques ms, même
+    pour des classeurs de plusieurs centaines d'onglets). Les feuilles
+    graphiques sont ignorées, comme dans pandas.
+    
+    Returns:
+        La liste des noms, ou None si le fichier n'est pas un classeur
+        OOXML lisible (ex. .xls): utiliser alors pandas.
+    """
+    ns_main = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+    ns_rel = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+    ns_pkg = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+    try:
+        with zipfile.ZipFile(source) as archive:
+            workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+            rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    except (zipfile.BadZipFile, KeyError, ET.ParseError, OSError):
+        return None
+    
+    worksheet_ids = {
+        rel.get("Id") for rel in rels.iter(ns_pkg + "Relationship")
+        if posixpath.basename(rel.get("Type", "")) == "worksheet"
+    }
+    return [
+        sheet.get("name") for sheet in workbook.iter(ns_main + "sheet")
+        if sheet.get(ns_rel + "id") in worksheet_ids
+    ]
+
+
+def quick_analyze(filepath: str, time_budget: Optional[float] = None) -> Dict:
+    """Analyse rapide d'un fichier DQE (aperçus partiels si time_budget est fixé)"""
+    extractor = DQEExtractorV2(filepath=filepath)
+    return extractor.analyze(time_budget=time_budget)
+
+
+def preview_job(filepath: str, indices: List[int]) -> List[Dict]:
+    """Aperçus complets de quelques onglets, à intégrer avec update_previews()"""
+    extractor = DQEExtractorV2(filepath=filepath)
+    return [asdict(p) for p in extractor.compute_previews(indices)]
+
+
+def extract_job(filepath: str, analysis: Dict,
+                include_metadata: bool = True) -> Tuple[Dict, List[DQESheet]]:
+    """
+    Extrait les onglets sélectionnés dans une analyse existante.
+    
+    Returns:
+        (résultat formaté, onglets extraits à réinjecter dans extractor.results)
+    """
+    extractor = DQEExtractorV2(filepath=filepath)
+    extractor.load_analysis(analysis)
+    result = extractor.extract(include_metadata=include_metadata)
+    return result, extractor.results
+
+
+def select_and_extract_job(filepath: str, criteria: Dict,
+                           include_metadata: bool = True) -> Tuple[Dict, Dict, Dict, List[DQESheet]]:
+    """
+    Analyse minimale, sélection et extraction en une passe.
+    
+    Returns:
+        (analyse, sélection, résultat formaté, onglets extraits); le résultat
+        est None si aucun onglet ne correspond aux critères
+    """
     extractor = DQEExtractorV2(filepath=filepath)
-    return extractor.analyze()
+    selection = extractor.analyze_for_selection(**criteria)
+    if not extractor.selected_sheets:
+        return extractor.get_analysis(), selection, None, []
+    result = extractor.extract(include_metadata=include_metadata)
+    return extractor.get_analysis(), selection, result, extractor.results
 
 
 def quick_extract(filepath: str, sheet_names: List[str] = None) -> Dict:
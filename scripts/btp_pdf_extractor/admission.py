@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Contrôle d'admission des extractions PDF
+
+Limite le nombre d'extractions simultanées et la mémoire qu'elles sont
+censées consommer (estimée d'après le nombre de pages ou la taille du
+fichier). Au-delà, les requêtes attendent dans une file bornée; une file
+pleine est refusée (429 + Retry-After côté API). Tant que d'autres clients
+attendent, un client ne peut occuper plus d'une part des places, pour
+qu'un import massif n'affame pas les utilisateurs interactifs.
+
+La file est servie par coût estimé croissant (en pages): un devis de
+2 pages n'attend pas derrière un de 200. Le vieillissement réduit le coût
+effectif avec l'attente pour que les gros documents passent malgré tout;
+les soumissions batch/CLI portent une pénalité.
+
+L'API DQE (dqe_api.py, à la racine du dépôt) applique le même algorithme
+(AdmissionController). Les deux services se lancent chacun depuis son
+répertoire, avec ses dépendances, et se déploient séparément: aucun module
+n'est importable par les deux sans lier le démarrage de l'un aux fichiers
+de l'autre. Une modification se reporte donc dans les deux;
+tests/python/test_admission.py les vérifie ensemble.
+
+Usage:
+    controleur = ControleurAdmission(max_simultanees=4, budget_memoire=2 * 1024**3)
+    async with controleur.admettre(client, poids, cout=nb_pages):
+        ...
+"""
+
+import asyncio
+import math
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from metrics import ADMISSION_TACHES, ADMISSION_MEMOIRE, ADMISSION_REFUS, ADMISSION_ATTENTE
+
+
+# Estimations mémoire
+MEMOIRE_BASE = 32 * 1024 * 1024
+MEMOIRE_PAR_PAGE = 8 * 1024 * 1024   # pdfplumber: objets caractères/lignes d'une page
+FACTEUR_GEMINI = 4                   # PDF + requête encodée + réponse
+
+# Ordonnancement (coûts en pages équivalentes pdfplumber)
+COUT_PAGE_GEMINI = 5                 # Une page Gemini dure ~5 pages pdfplumber
+VIEILLISSEMENT = 2.0                 # Pages créditées par seconde d'attente
+PENALITE_BATCH = 50.0                # Pages ajoutées aux soumissions batch
+
+# Objets page d'un PDF non compressé (les flux d'objets ne sont pas visibles)
+_RE_PAGE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
+
+class AdmissionRefusee(Exception):
+    """Requête refusée par le contrôle d'admission"""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Attente:
+    """Extraction en attente d'admission"""
+
+    __slots__ = ('client', 'poids', 'cout', 'batch', 'depuis', 'future')
+
+    def __init__(self, client: str, poids: int, cout: float, batch: bool,
+                 future: asyncio.Future):
+        self.client = client
+        self.poids = poids
+        self.cout = cout
+        self.batch = batch
+        self.depuis = time.monotonic()
+        self.future = future
+
+
+class ControleurAdmission:
+    """Admission pondérée par la mémoire, avec file bornée et part par client"""
+
+    def __init__(self, max_simultanees: int, budget_memoire: int, max_file: int = 32,
+                 part_client: float = 0.5, delai_attente: float = 300,
+                 vieillissement: float = VIEILLISSEMENT, penalite_batch: float = PENALITE_BATCH):
+        self.max_simultanees = max(max_simultanees, 1)
+        self.budget_memoire = budget_memoire
+        self.max_file = max_file
+        self.limite_client = max(1, math.ceil(self.max_simultanees * part_client))
+        self.limite_file_client = max(1, math.ceil(max_file * part_client))
+        self.delai_attente = delai_attente
+        self.vieillissement = vieillissement
+        self.penalite_batch = penalite_batch
+        self.actives = 0
+        self.memoire = 0
+        self._par_client: Dict[str, int] = {}
+        self._attentes: List[_Attente] = []
+        self._duree_moyenne = 5.0  # Moyenne glissante, pour Retry-After
+
+        ADMISSION_TACHES.labels('running').set_function(lambda: self.actives)
+        ADMISSION_TACHES.labels('queued').set_function(lambda: self.en_attente)
+        ADMISSION_MEMOIRE.set_function(lambda: self.memoire)
+
+    @property
+    def en_attente(self) -> int:
+        return len(self._attentes)
+
+    def _tient(self, poids: int) -> bool:
+        # Une extraction seule est toujours admise, même au-delà du budget
+        if self.actives >= self.max_simultanees:
+            return False
+        return self.actives == 0 or self.memoire + poids <= self.budget_memoire
+
+    def _au_dela_part(self, client: str) -> bool:
+        return self._par_client.get(client, 0) >= self.limite_client
+
+    def _demarrer(self, client: str, poids: int):
+        self.actives += 1
+        self.memoire += poids
+        self._par_client[client] = self._par_client.get(client, 0) + 1
+
+    def _priorite(self, attente: _Attente, maintenant: float) -> float:
+        """Coût effectif: estimation + pénalité batch - crédit d'attente"""
+        cout = attente.cout + (self.penalite_batch if attente.batch else 0.0)
+        return cout - (maintenant - attente.depuis) * self.vieillissement
+
+    def _choisir(self) -> Optional[_Attente]:
+        """
+        Prochaine extraction à admettre: la moins coûteuse parmi les clients
+        sous leur part. Si elle ne tient pas dans le budget mémoire, rien
+        n'est admis: les plus légères ne la doublent pas indéfiniment.
+        """
+        equitables = [a for a in self._attentes if not self._au_dela_part(a.client)]
+        candidates = equitables or self._attentes
+        if not candidates:
+            return None
+        maintenant = time.monotonic()
+        meilleure = min(candidates, key=lambda a: self._priorite(a, maintenant))
+        return meilleure if self._tient(meilleure.poids) else None
+
+    def _distribuer(self):
+        """Admet les extractions en attente tant que les ressources le permettent"""
+        while self._attentes:
+            attente = self._choisir()
+            if attente is None:
+                break
+            self._attentes.remove(attente)
+            self._demarrer(attente.client, attente.poids)
+            ADMISSION_ATTENTE.labels('batch' if attente.batch else 'interactive').observe(
+                time.monotonic() - attente.depuis
+            )
+            attente.future.set_result(None)
+
+    def retry_after(self) -> int:
+        """Délai conseillé (secondes) avant de soumettre à nouveau"""
+        tours = (self.en_attente + 1) / self.max_simultanees
+        return max(1, math.ceil(tours * self._duree_moyenne))
+
+    def _refuser(self, raison: str, status_code: int, message: str):
+        ADMISSION_REFUS.labels(raison).inc()
+        raise AdmissionRefusee(message, status_code, self.retry_after())
+
+    def verifier_capacite(self, client: str, nombre: int = 1):
+        """Refuse (429) si la file ne peut accueillir `nombre` extractions du client"""
+        if self.en_attente + nombre > self.max_file:
+            self._refuser('queue_full', 429, "Serveur saturé, réessayez plus tard")
+        en_file = sum(1 for a in self._attentes if a.client == client)
+        if en_file + nombre > self.limite_file_client:
+            self._refuser('client_quota', 429, "Trop d'extractions en attente pour ce client")
+
+    async def acquerir(self, client: str, poids: int, cout: float = 0.0, batch: bool = False):
+        """Attend une place; refuse si la file est pleine ou l'attente trop longue"""
+        if not self._attentes and self._tient(poids):
+            self._demarrer(client, poids)
+            ADMISSION_ATTENTE.labels('batch' if batch else 'interactive').observe(0.0)
+            return
+        self.verifier_capacite(client)
+
+        attente = _Attente(client, poids, cout, batch, asyncio.get_running_loop().create_future())
+        self._attentes.append(attente)
+        try:
+            await asyncio.wait_for(asyncio.shield(attente.future), self.delai_attente)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if attente.future.done():
+                # Admise entre-temps: rendre la place
+                self.liberer(client, poids, 0.0)
+            else:
+                self._attentes.remove(attente)
+                attente.future.cancel()
+                # Elle pouvait bloquer la file (trop lourde pour le budget): admettre les suivantes
+                self._distribuer()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self._refuser('timeout', 503, "Délai d'attente dépassé, réessayez plus tard")
+
+    def liberer(self, client: str, poids: int, duree: float):
+        """Libère une place et admet les extractions suivantes"""
+        self.actives -= 1
+        self.memoire -= poids
+        self._par_client[client] -= 1
+        if not self._par_client[client]:
+            del self._par_client[client]
+        if duree > 0:
+            self._duree_moyenne = 0.8 * self._duree_moyenne + 0.2 * duree
+        self._distribuer()
+
+    @asynccontextmanager
+    async def admettre(self, client: str, poids: int, cout: float = 0.0, batch: bool = False):
+        """Contexte d'exécution d'une extraction admise"""
+        poids = min(poids, self.budget_memoire)
+        await self.acquerir(client, poids, cout, batch)
+        debut = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.liberer(client, poids, time.perf_counter() - debut)
+
+
+# ============================================================================
+# ESTIMATION DU POIDS
+# ============================================================================
+
+def compter_pages(contenu: bytes) -> int:
+    """Nombre de pages estimé sans ouvrir le PDF (0 si indéterminable)"""
+    return len(_RE_PAGE.findall(contenu))
+
+
+def estimer_pages(contenu: bytes) -> int:
+    """Nombre de pages, ou à défaut estimation d'après la taille (~50 Ko/page)"""
+    nb_pages = compter_pages(contenu)
+    if not nb_pages:
+        # PDF à flux d'objets compressés: objets page invisibles
+        nb_pages = max(1, len(contenu) // (50 * 1024))
+    return nb_pages
+
+
+def estimer_memoire(contenu: bytes, mode: str) -> int:
+    """Mémoire estimée d'une extraction selon le mode et le nombre de pages"""
+    if mode == 'gemini':
+        return MEMOIRE_BASE + FACTEUR_GEMINI * len(contenu)
+    return MEMOIRE_BASE + estimer_pages(contenu) * MEMOIRE_PAR_PAGE
+
+
+def estimer_cout(contenu: bytes, mode: str) -> float:
+    """Coût d'ordonnancement d'une extraction, en pages équivalentes pdfplumber"""
+    nb_pages = estimer_pages(contenu)
+    return float(nb_pages * COUT_PAGE_GEMINI if mode == 'gemini' else nb_pages)
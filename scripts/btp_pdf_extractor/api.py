@@ -6,33 +6,79 @@ Usage:
     uvicorn api:app --host 0.0.0.0 --port 8000 --reload
 
 Endpoints:
-    POST /extract - Extrait les données d'un PDF
+    POST /extract - Extrait les données d'un PDF (?stream=true: NDJSON au fil des pages,
+                    ?cache=bypass: ignore le cache de résultats)
     GET /health - Vérification de santé
+    GET /metrics - Métriques Prometheus
 """
 
 import os
+import asyncio
+import contextlib
 import tempfile
 import logging
-from typing import Optional
+import time
+from typing import AsyncIterator, Dict, Optional
 from pathlib import Path
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 
 from extractor import (
     ExtracteurGemini,
+    ExtracteurHybride,
     ExtracteurPDFPlumber,
+    MemoireDepassee,
     ResultatExtraction,
     GEMINI_AVAILABLE,
-    PDFPLUMBER_AVAILABLE
+    PDFPLUMBER_AVAILABLE,
+    dumps_json,
+    iter_json,
+    prechauffer,
+    arreter_pools,
+    version_extraction
+)
+from cache import CacheResultats
+from document import DocumentPDF, DocumentTropVolumineux
+from gemini_client import client_gemini, fermer_clients
+from admission import ControleurAdmission, AdmissionRefusee, estimer_memoire, estimer_cout
+from metrics import (
+    HTTP_DUREE,
+    OCTETS_RECUS,
+    ES_REQUETE,
+    EXTRACTIONS_EN_COURS,
+    EXTRACTIONS_PARTAGEES,
+    CACHE_REQUETES,
+    METRICS_AVAILABLE,
+    CONTENT_TYPE_LATEST,
+    exporter_metriques
 )
 
 # Configuration logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Contrôle d'admission (extractions simultanées, mémoire, file d'attente)
+admission = ControleurAdmission(
+    max_simultanees=int(os.getenv("BTP_MAX_EXTRACTIONS", os.cpu_count() or 2)),
+    budget_memoire=int(os.getenv("BTP_MEMORY_BUDGET_MB", 2048)) * 1024 * 1024,
+    max_file=int(os.getenv("BTP_MAX_QUEUED", 32)),
+    part_client=float(os.getenv("BTP_CLIENT_SHARE", 0.5)),
+    delai_attente=float(os.getenv("BTP_QUEUE_TIMEOUT", 300))
+)
+# Cache persistant des résultats (BTP_CACHE_MAX_MB=0 le désactive)
+cache_resultats = CacheResultats(
+    dossier=os.getenv("BTP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "btp_extractor_cache")),
+    taille_max=int(os.getenv("BTP_CACHE_MAX_MB", 512)) * 1024 * 1024,
+    ttl=float(os.getenv("BTP_CACHE_TTL_HOURS", 168)) * 3600
+)
+# Taille maximale d'un PDF reçu
+TAILLE_MAX = 20 * 1024 * 1024
+# Préchauffage (pdfplumber, regex) au démarrage plutôt qu'à la première extraction
+PRECHAUFFAGE = os.getenv("BTP_WARM_UP", "1") != "0"
+
 # Application FastAPI
 app = FastAPI(
     title="BTP PDF Extractor API",
@@ -52,10 +98,59 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def mesurer_requetes(request: Request, call_next):
+    """Mesure la durée de chaque requête, étiquetée par route"""
+    debut = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_DUREE.labels(
+            request.method,
+            route.path if route is not None else "unmatched",
+            str(status)
+        ).observe(time.perf_counter() - debut)
+
+
+def prechauffer_gemini():
+    """Crée le client Gemini partagé (import de google-generativeai, configuration)"""
+    if GEMINI_AVAILABLE and (os.getenv('GOOGLE_AI_API_KEY') or os.getenv('GEMINI_API_KEY')):
+        try:
+            client_gemini()
+        except Exception as e:
+            logger.warning(f"⚠️ Client Gemini non initialisé: {e}")
+
+
+@app.on_event("startup")
+async def demarrage():
+    """Préchauffe l'extracteur en arrière-plan, sans retarder le démarrage"""
+    if PRECHAUFFAGE:
+        asyncio.create_task(asyncio.to_thread(prechauffer))
+        asyncio.create_task(asyncio.to_thread(prechauffer_gemini))
+
+
+@app.on_event("shutdown")
+async def arret():
+    """Arrête les processus d'extraction par pages et les clients Gemini"""
+    arreter_pools()
+    fermer_clients()
+
+
 # ============================================================================
 # MODÈLES DE DONNÉES
 # ============================================================================
 
+class FastJSONResponse(JSONResponse):
+    """Réponse JSON sérialisée avec orjson (repli sur json de la stdlib)"""
+
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
+
 class ExtractionResponse(BaseModel):
     """Réponse de l'endpoint d'extraction"""
     success: bool
@@ -71,6 +166,7 @@ class ExtractionResponse(BaseModel):
     resume_lots: dict
     resume_niveaux: dict
     erreurs: list
+    memoire_pic_mo: Optional[float] = None
 
 
 class HealthResponse(BaseModel):
@@ -85,6 +181,166 @@ class HealthResponse(BaseModel):
 # ENDPOINTS
 # ============================================================================
 
+def identifiant_client(request: Request) -> str:
+    """Identifiant du client pour le partage équitable (X-Client-Id, sinon IP)"""
+    client = request.headers.get("x-client-id")
+    if client:
+        return client[:64]
+    return request.client.host if request.client else "anonymous"
+
+
+# Extractions en cours par (empreinte du PDF, mode): des envois simultanés
+# du même fichier partagent une seule extraction (appel Gemini compris).
+# Pendant de single_flight() dans l'API DQE (voir admission.py).
+_en_cours: Dict[tuple, asyncio.Future] = {}
+
+
+async def partager_extraction(cle: tuple, fabrique):
+    """
+    Lance fabrique() ou, si une extraction de même clé est déjà en cours,
+    attend son résultat. L'annulation d'un demandeur n'interrompt pas
+    l'extraction partagée.
+    """
+    future = _en_cours.get(cle)
+    if future is not None:
+        EXTRACTIONS_PARTAGEES.labels(cle[1]).inc()
+    else:
+        future = asyncio.ensure_future(fabrique())
+        _en_cours[cle] = future
+
+        def _terminee(f: asyncio.Future):
+            _en_cours.pop(cle, None)
+            if not f.cancelled():
+                f.exception()  # Évite l'avertissement si personne n'attend plus
+
+        future.add_done_callback(_terminee)
+    return await asyncio.shield(future)
+
+
+def reponse_extraction(resultat: ResultatExtraction, nom_fichier: str,
+                       statut_cache: str) -> Response:
+    """
+    Réponse sérialisée directement: évite la validation pydantic et
+    jsonable_encoder sur des milliers d'éléments (le schéma
+    ExtractionResponse reste celui documenté). Éléments rangés sur disque
+    (au-delà de BTP_DEBORDEMENT_ELEMENTS): corps envoyé par morceaux, au fil
+    de leur lecture.
+    """
+    champs = {
+        "success": True,
+        "fichier": nom_fichier,
+        "hash_fichier": resultat.hash_fichier,
+        "mode_extraction": resultat.mode_extraction,
+        "nb_pages": resultat.nb_pages,
+        "nb_elements": resultat.nb_elements,
+        "total_general": resultat.total_general,
+        "devise": resultat.devise,
+        "resume_categories": resultat.resume_categories,
+        "resume_lots": resultat.resume_lots,
+        "resume_niveaux": resultat.resume_niveaux,
+        "erreurs": resultat.erreurs,
+        "memoire_pic_mo": resultat.memoire_pic_mo
+    }
+    if not isinstance(resultat.elements, list):
+        return StreamingResponse(
+            iter_json(champs, "elements", resultat.elements),
+            media_type="application/json", headers={"X-Cache": statut_cache}
+        )
+    return FastJSONResponse({**champs, "elements": resultat.elements}, headers={"X-Cache": statut_cache})
+
+
+async def flux_resultat(resultat: ResultatExtraction, nom_fichier: str) -> AsyncIterator[bytes]:
+    """Résultat déjà connu (cache) au format NDJSON de flux_extraction"""
+    lignes = []
+    for e in resultat.elements:
+        lignes.append(dumps_json({"type": "element", "element": e}) + b"\n")
+        if len(lignes) == 500:
+            yield b"".join(lignes)
+            lignes = []
+    if lignes:
+        yield b"".join(lignes)
+    yield dumps_json({"type": "resume", "success": True, **resultat.resume(), "fichier": nom_fichier}) + b"\n"
+
+
+def creer_extracteur(document: DocumentPDF, mode: str):
+    """Extracteur du mode effectif (local, gemini ou hybrid)"""
+    if mode == "gemini":
+        return ExtracteurGemini(document)
+    if mode == "hybrid":
+        return ExtracteurHybride(document)
+    return ExtracteurPDFPlumber(document)
+
+
+def liberer_document(document: DocumentPDF):
+    """Ferme le PDF d'une requête et publie ses entrées/sorties"""
+    document.fermer()
+    for operation, octets in document.es.items():
+        ES_REQUETE.labels(operation).observe(octets)
+    logger.info(
+        f"💾 E/S {document.nom}: {document.es['lecture']} octets reçus, {document.es['ecriture']} écrits "
+        f"sur disque, {document.es['flux']} lus par pdfplumber"
+    )
+
+
+async def flux_extraction(document: DocumentPDF, nom_fichier: str, mode: str, client: str,
+                          batch: bool) -> AsyncIterator[bytes]:
+    """
+    Extraction en NDJSON: une ligne {"type": "element", "element": {...}}
+    par élément dès que sa page est traitée, puis une ligne
+    {"type": "resume", ...} (résumés, totaux, erreurs). Le statut HTTP étant
+    déjà envoyé, un échec produit une dernière ligne {"type": "erreur"}.
+    Pas de partage avec les extractions identiques en cours, ni d'écriture
+    dans le cache de résultats (les éléments ne sont pas conservés).
+    """
+    blocs = None
+    try:
+        async with admission.admettre(
+            client, estimer_memoire(document.tampon, mode), cout=estimer_cout(document.tampon, mode), batch=batch
+        ):
+            EXTRACTIONS_EN_COURS.inc()
+            try:
+                logger.info(f"🚀 Extraction en flux mode '{mode}' pour: {nom_fichier}")
+                extracteur = creer_extracteur(document, mode)
+
+                blocs = extracteur.iter_blocs()
+                while (bloc := await asyncio.to_thread(next, blocs, None)) is not None:
+                    if bloc:
+                        yield b"".join(
+                            dumps_json({"type": "element", "element": e}) + b"\n" for e in bloc
+                        )
+                resume = await asyncio.to_thread(extracteur.resume_final)
+            finally:
+                EXTRACTIONS_EN_COURS.dec()
+
+        logger.info(f"✅ Extraction en flux terminée: {resume['nb_elements']} éléments")
+        yield dumps_json({"type": "resume", "success": True, **resume, "fichier": nom_fichier}) + b"\n"
+
+    except AdmissionRefusee as e:
+        yield dumps_json({"type": "erreur", "detail": str(e), "retry_after": e.retry_after}) + b"\n"
+
+    except Exception as e:
+        logger.error(f"❌ Erreur extraction: {e}")
+        yield dumps_json({"type": "erreur", "detail": f"Erreur lors de l'extraction: {str(e)}"}) + b"\n"
+
+    finally:
+        if blocs is not None:
+            # Client déconnecté: libère le PDF et annule les tranches restantes
+            # (sauf si un bloc est encore en cours dans son thread)
+            with contextlib.suppress(ValueError):
+                blocs.close()
+        liberer_document(document)
+
+
+@app.exception_handler(AdmissionRefusee)
+async def admission_refusee(request: Request, exc: AdmissionRefusee):
+    """Traduit un refus d'admission en 429/503 avec Retry-After"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Vérifie l'état de l'API et des dépendances"""
@@ -100,17 +356,43 @@ async def health_check():
     )
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Métriques Prometheus: latence par route et par phase, pages et éléments
+    traités, appels Gemini (latence, erreurs), extractions en cours et
+    mémoire du processus.
+    """
+    if not METRICS_AVAILABLE:
+        raise HTTPException(
+            status_code=503,
+            detail="Métriques indisponibles: installez prometheus_client"
+        )
+    return Response(content=exporter_metriques(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/extract", response_model=ExtractionResponse)
 async def extract_pdf(
+    request: Request,
     file: UploadFile = File(..., description="Fichier PDF DQE à analyser"),
     mode: str = Query(
         default="auto",
-        enum=["auto", "local", "gemini"],
-        description="Mode d'extraction: auto (défaut), local (pdfplumber), gemini (API)"
+        enum=["auto", "local", "gemini", "hybrid"],
+        description="Mode d'extraction: auto (défaut), local (pdfplumber), gemini (API), "
+                    "hybrid (pdfplumber, Gemini pour les pages peu fiables)"
     ),
     sector: str = Query(
         default="btp",
         description="Secteur d'activité (btp, import, commerce, etc.)"
+    ),
+    stream: bool = Query(
+        default=False,
+        description="Réponse NDJSON: éléments au fil des pages, puis une ligne de résumé"
+    ),
+    cache: str = Query(
+        default="use",
+        enum=["use", "bypass"],
+        description="bypass: ignore le résultat en cache et réextrait (le nouveau résultat le remplace)"
     )
 ):
     """
@@ -118,10 +400,20 @@ async def extract_pdf(
 
     - **file**: Le fichier PDF à analyser (max 10MB recommandé)
     - **mode**: Le mode d'extraction à utiliser
-      - `auto`: Utilise Gemini si disponible, sinon pdfplumber
+      - `auto`: Hybride si Gemini est configuré et pdfplumber installé,
+        sinon Gemini ou pdfplumber
       - `local`: Force l'utilisation de pdfplumber
       - `gemini`: Force l'utilisation de l'API Gemini
+      - `hybrid`: pdfplumber, puis Gemini sur les seules pages dont
+        l'extraction locale est peu fiable
     - **sector**: Le secteur d'activité pour la catégorisation
+    - **stream**: Réponse NDJSON (`application/x-ndjson`): une ligne
+      `{"type": "element"}` par élément dès que sa page est traitée, puis
+      `{"type": "resume"}` avec les résumés et totaux
+    - **cache**: `use` (défaut) sert le résultat déjà extrait pour ce PDF
+      (même contenu, même mode, même version de l'extracteur); `bypass`
+      force une nouvelle extraction. L'en-tête `X-Cache` vaut `HIT`, `MISS`
+      ou `BYPASS`
     """
     # Vérifier le type de fichier
     if not file.filename.lower().endswith('.pdf'):
@@ -130,18 +422,13 @@ async def extract_pdf(
             detail="Seuls les fichiers PDF sont acceptés"
         )
 
-    # Vérifier la taille (limite à 20MB)
-    contents = await file.read()
-    if len(contents) > 20 * 1024 * 1024:
-        raise HTTPException(
-            status_code=400,
-            detail="Fichier trop volumineux (max 20MB)"
-        )
-
     # Déterminer le mode d'extraction
     actual_mode = mode
     if mode == "auto":
-        if GEMINI_AVAILABLE and (os.getenv('GOOGLE_AI_API_KEY') or os.getenv('GEMINI_API_KEY')):
+        gemini_configure = GEMINI_AVAILABLE and (os.getenv('GOOGLE_AI_API_KEY') or os.getenv('GEMINI_API_KEY'))
+        if gemini_configure and PDFPLUMBER_AVAILABLE:
+            actual_mode = "hybrid"
+        elif gemini_configure:
             actual_mode = "gemini"
         elif PDFPLUMBER_AVAILABLE:
             actual_mode = "local"
@@ -157,44 +444,111 @@ async def extract_pdf(
             detail="Mode gemini demandé mais google-generativeai n'est pas installé"
         )
 
-    if actual_mode == "local" and not PDFPLUMBER_AVAILABLE:
+    if actual_mode in ("local", "hybrid") and not PDFPLUMBER_AVAILABLE:
         raise HTTPException(
             status_code=503,
-            detail="Mode local demandé mais pdfplumber n'est pas installé"
+            detail=f"Mode {actual_mode} demandé mais pdfplumber n'est pas installé"
         )
 
-    # Sauvegarder temporairement le fichier
-    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as tmp_file:
-        tmp_file.write(contents)
-        tmp_path = tmp_file.name
-
+    # Lecture unique de l'envoi (limite à 20MB): empreinte calculée au
+    # passage, tampon partagé ensuite par l'admission et l'extracteur
     try:
-        logger.info(f"🚀 Extraction mode '{actual_mode}' pour: {file.filename}")
+        document = await DocumentPDF.depuis_envoi(file, file.filename, taille_max=TAILLE_MAX)
+    except DocumentTropVolumineux:
+        raise HTTPException(
+            status_code=400,
+            detail="Fichier trop volumineux (max 20MB)"
+        )
+    OCTETS_RECUS.inc(len(document))
+
+    client = identifiant_client(request)
+    batch = request.headers.get("x-priority", "").lower() == "batch"
+    empreinte = document.empreinte
+
+    # Résultat déjà extrait pour ce contenu, ce mode et cette version
+    cle_cache = cache_resultats.cle(empreinte, actual_mode, version_extraction(actual_mode))
+    statut_cache = "BYPASS" if cache == "bypass" else "MISS"
+    if cache_resultats.actif:
+        if cache == "bypass":
+            CACHE_REQUETES.labels(actual_mode, "bypass").inc()
+        else:
+            en_cache = await asyncio.to_thread(cache_resultats.lire, cle_cache)
+            CACHE_REQUETES.labels(actual_mode, "hit" if en_cache else "miss").inc()
+            if en_cache is not None:
+                logger.info(f"♻️ Résultat en cache pour: {file.filename}")
+                liberer_document(document)
+                if stream:
+                    return StreamingResponse(
+                        flux_resultat(en_cache, file.filename),
+                        media_type="application/x-ndjson",
+                        headers={"X-Cache": "HIT"}
+                    )
+                return reponse_extraction(en_cache, file.filename, "HIT")
+
+    if stream:
+        # File pleine: refus avant d'envoyer le statut 200 du flux
+        try:
+            admission.verifier_capacite(client)
+        except AdmissionRefusee:
+            liberer_document(document)
+            raise
+        # Le flux libère le document une fois terminé
+        return StreamingResponse(
+            flux_extraction(document, file.filename, actual_mode, client, batch),
+            media_type="application/x-ndjson",
+            headers={"X-Cache": statut_cache}
+        )
 
-        # Extraction selon le mode
-        if actual_mode == "gemini":
-            extracteur = ExtracteurGemini(tmp_path)
+    async def extraire() -> ResultatExtraction:
+        try:
+            async with admission.admettre(
+                client,
+                estimer_memoire(document.tampon, actual_mode),
+                cout=estimer_cout(document.tampon, actual_mode),
+                batch=batch
+            ):
+                EXTRACTIONS_EN_COURS.inc()
+                try:
+                    logger.info(f"🚀 Extraction mode '{actual_mode}' pour: {file.filename}")
+
+                    # Extraction selon le mode
+                    extracteur = creer_extracteur(document, actual_mode)
+
+                    # Hors de la boucle asyncio: les requêtes suivantes restent
+                    # acceptées (et mises en file) pendant l'extraction
+                    resultat = await asyncio.to_thread(extracteur.extraire)
+                finally:
+                    EXTRACTIONS_EN_COURS.dec()
+        finally:
+            # L'extraction partagée survit à l'annulation du demandeur: elle
+            # libère elle-même le document qu'elle lit
+            liberer_document(document)
+
+        # Repli local du mode hybride (Gemini absent ou en échec): résultat
+        # dégradé, pas mis en cache pour que les envois suivants retentent Gemini
+        if getattr(extracteur, "repli", False):
+            logger.info(f"Résultat hybride dégradé non mis en cache: {file.filename}")
         else:
-            extracteur = ExtracteurPDFPlumber(tmp_path)
+            # Hors admission: l'écriture ne retient pas de place d'extraction
+            await asyncio.to_thread(cache_resultats.ecrire, cle_cache, resultat)
+        return resultat
 
-        resultat: ResultatExtraction = extracteur.extraire()
+    # Rattachée à une extraction identique en cours: ce document ne sera pas lu
+    rattachee = (empreinte, actual_mode) in _en_cours
+    try:
+        resultat: ResultatExtraction = await partager_extraction((empreinte, actual_mode), extraire)
 
         logger.info(f"✅ Extraction terminée: {resultat.nb_elements} éléments")
+        return reponse_extraction(resultat, file.filename, statut_cache)
+
+    except AdmissionRefusee:
+        raise
 
-        return ExtractionResponse(
-            success=True,
-            fichier=file.filename,
-            hash_fichier=resultat.hash_fichier,
-            mode_extraction=resultat.mode_extraction,
-            nb_pages=resultat.nb_pages,
-            nb_elements=resultat.nb_elements,
-            total_general=resultat.total_general,
-            devise=resultat.devise,
-            elements=resultat.elements,
-            resume_categories=resultat.resume_categories,
-            resume_lots=resultat.resume_lots,
-            resume_niveaux=resultat.resume_niveaux,
-            erreurs=resultat.erreurs
+    except MemoireDepassee as e:
+        logger.error(f"❌ Extraction interrompue: {e}")
+        raise HTTPException(
+            status_code=413,
+            detail=f"Document trop volumineux pour le budget mémoire du serveur: {e}"
         )
 
     except Exception as e:
@@ -205,11 +559,8 @@ async def extract_pdf(
         )
 
     finally:
-        # Nettoyer le fichier temporaire
-        try:
-            os.unlink(tmp_path)
-        except:
-            pass
+        if rattachee:
+            liberer_document(document)
 
 
 @app.get("/categories")
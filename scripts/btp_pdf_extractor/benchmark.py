@@ -0,0 +1,831 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de l'extracteur BTP
+
+Usage:
+    python benchmark.py serialisation [--elements 10000] [--repeat 5]
+    python benchmark.py demarrage [--module api] [--budget-ms 500]
+    python benchmark.py pages [--pages 40] [--processus 1,2,4]
+    python benchmark.py moteurs [--pages 30] [--lignes 30]
+    python benchmark.py reconstruction [--pages 20] [--lignes 30]
+    python benchmark.py memoire [--pages 200] [--fenetre 50] [--fond-ko 200] [--budget-mo N]
+    python benchmark.py gemini [--pages 60] [--concurrence 1,4,8]
+    python benchmark.py gemini-client [--appels 200] [--echecs 20]
+    python benchmark.py fichiers [--pages 20] [--fond-ko 500] [--repeat 3]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from dataclasses import asdict
+from statistics import median
+
+import extractor
+from extractor import (
+    ElementBTP, ExtracteurGemini, ExtracteurHybride, ExtracteurPDFPlumber, categoriser_element,
+    CategorieBTP, KEYWORDS_CATEGORIES,
+    dumps_json, arreter_pools, decouper_pages, ORJSON_AVAILABLE
+)
+from gemini_client import ClientGemini
+from metadonnees import MOTIFS, detecter_metadonnees, detecteur_metadonnees
+from synthetic import TransportGeminiSimule, generer_pdf
+
+
+# ============================================================================
+# DONNÉES SYNTHÉTIQUES
+# ============================================================================
+
+DESIGNATIONS = [
+    "Béton armé dosé à 350 kg/m³ pour semelles filantes",
+    "Maçonnerie en agglos de 20x20x40 au RDC",
+    "Enduit ciment sur murs ép. 2 cm",
+    "Carrelage grès cérame 40x40 pose collée",
+    "Peinture acrylique deux couches sur murs intérieurs",
+    "Fourniture et pose de câble électrique 3G2,5",
+    "Tuyau PVC Ø110 pour évacuation des eaux usées",
+    "Faux plafond en plaques BA13 sur ossature",
+]
+
+
+def generer_elements(nb: int, seed: int = 42) -> list:
+    """Génère des éléments BTP réalistes"""
+    rnd = random.Random(seed)
+    elements = []
+    for i in range(nb):
+        designation = f"{rnd.choice(DESIGNATIONS)} - niveau R+{rnd.randint(1, 3)}"
+        categorie, sous_categorie = categoriser_element(designation)
+        quantite = rnd.uniform(1, 500)
+        prix_unitaire = rnd.uniform(1000, 150000)
+        elements.append(ElementBTP(
+            numero=f"{i // 50 + 1}.{i % 50 + 1}",
+            designation=designation,
+            categorie=categorie,
+            sous_categorie=sous_categorie,
+            unite=rnd.choice(['m²', 'm³', 'ml', 'u', 'kg']),
+            quantite=quantite,
+            prix_unitaire=prix_unitaire,
+            prix_total=quantite * prix_unitaire,
+            lot_numero=str(i // 500 + 1),
+            lot_nom="Gros œuvre",
+            niveau=f"R+{rnd.randint(1, 3)}",
+            dosage=None,
+            dimensions="20x20x40",
+            materiaux=None,
+            epaisseur=None
+        ))
+    return elements
+
+
+def mesurer(fn, *args, repeat: int = 5) -> float:
+    """Temps médian d'exécution en millisecondes"""
+    durees = []
+    for _ in range(repeat):
+        debut = time.perf_counter()
+        fn(*args)
+        durees.append((time.perf_counter() - debut) * 1000)
+    return median(durees)
+
+
+# ============================================================================
+# SÉRIALISATION DE LA RÉPONSE /extract
+# ============================================================================
+
+def _contenu_reponse(elements: list) -> dict:
+    return {
+        "success": True, "fichier": "synthetique.pdf", "hash_fichier": "0" * 16,
+        "mode_extraction": "pdfplumber", "nb_pages": 100, "nb_elements": len(elements),
+        "total_general": sum(e['prix_total'] for e in elements), "devise": "FCFA",
+        "elements": elements, "resume_categories": {}, "resume_lots": {},
+        "resume_niveaux": {}, "erreurs": []
+    }
+
+
+def chemin_historique(elements_btp: list) -> bytes:
+    """asdict() + modèle pydantic + jsonable_encoder + json (comportement d'origine)"""
+    from fastapi.encoders import jsonable_encoder
+    from api import ExtractionResponse
+
+    elements = [asdict(e) for e in elements_btp]
+    reponse = ExtractionResponse(**_contenu_reponse(elements))
+    return json.dumps(jsonable_encoder(reponse), ensure_ascii=False).encode('utf-8')
+
+
+def chemin_rapide(elements_btp: list) -> bytes:
+    """to_dict() + dumps_json (chemin actuel de l'API)"""
+    elements = [e.to_dict() for e in elements_btp]
+    return dumps_json(_contenu_reponse(elements))
+
+
+def bench_serialisation(args):
+    elements = generer_elements(args.elements)
+    taille = len(chemin_rapide(elements))
+
+    t_hist = mesurer(chemin_historique, elements, repeat=args.repeat)
+    t_rapide = mesurer(chemin_rapide, elements, repeat=args.repeat)
+
+    print(f"Éléments: {args.elements} | JSON: {taille / 1024:.0f} Ko | orjson: {ORJSON_AVAILABLE}")
+    print(f"  historique (asdict + pydantic + jsonable_encoder): {t_hist:8.1f} ms")
+    print(f"  rapide (to_dict + dumps_json):                     {t_rapide:8.1f} ms")
+    print(f"  gain: x{t_hist / t_rapide:.1f}")
+
+
+# ============================================================================
+# CATÉGORISATION
+# ============================================================================
+
+def categoriser_historique(designation: str) -> CategorieBTP:
+    """Recherche de chaque mot-clé de chaque catégorie (comportement d'origine)"""
+    designation_lower = designation.lower()
+    meilleur_score = 0
+    meilleure_categorie = CategorieBTP.DIVERS
+    for categorie, keywords in KEYWORDS_CATEGORIES.items():
+        score = sum(1 for kw in keywords if kw in designation_lower)
+        if score > meilleur_score:
+            meilleur_score = score
+            meilleure_categorie = categorie
+    return meilleure_categorie
+
+
+def generer_designations(nb: int, distinctes: int, seed: int = 42) -> list:
+    """Désignations mêlant mots-clés (souvent plusieurs catégories) et texte libre, répétées"""
+    rnd = random.Random(seed)
+    mots_cles = [kw for kws in KEYWORDS_CATEGORIES.values() for kw in kws]
+    libres = ['fourniture', 'pose', 'compris', 'toutes sujétions', 'au', 'niveau', 'R+1', 'ens', 'm²']
+    modeles = []
+    for _ in range(distinctes):
+        mots = rnd.sample(mots_cles, rnd.randint(0, 4)) + rnd.sample(libres, rnd.randint(1, 4))
+        rnd.shuffle(mots)
+        designation = ' '.join(m.upper() if rnd.random() < 0.2 else m for m in mots)
+        modeles.append(designation)
+    modeles += DESIGNATIONS
+    return [rnd.choice(modeles) for _ in range(nb)]
+
+
+def bench_categories(args):
+    designations = generer_designations(args.elements, args.distinctes)
+    moteur = extractor.moteur_categories()
+
+    differences = [d for d in set(designations)
+                   if categoriser_historique(d).value != categoriser_element.__wrapped__(d)[0]]
+
+    def historique():
+        for d in designations:
+            categoriser_historique(d)
+
+    def compile_seul():
+        for d in designations:
+            moteur.meilleure(d.lower())
+
+    def memorise():
+        categoriser_element.cache_clear()
+        for d in designations:
+            categoriser_element(d)
+
+    t_hist = mesurer(historique, repeat=args.repeat)
+    t_comp = mesurer(compile_seul, repeat=args.repeat)
+    t_memo = mesurer(memorise, repeat=args.repeat)
+    print(f"Désignations: {args.elements} dont {len(set(designations))} distinctes | "
+          f"{len(moteur.inclus)} mots-clés | différences: {len(differences)}")
+    for d in differences[:5]:
+        print(f"  ≠ {d!r}")
+    print(f"  historique (sous-chaîne par mot-clé): {t_hist:8.1f} ms")
+    print(f"  expression compilée:                  {t_comp:8.1f} ms  x{t_hist / t_comp:.1f}")
+    print(f"  compilée + mémoire LRU:               {t_memo:8.1f} ms  x{t_hist / t_memo:.1f}")
+
+
+# ============================================================================
+# MÉTADONNÉES TECHNIQUES
+# ============================================================================
+
+FRAGMENTS_METADONNEES = [
+    'R+1', 'r+2', 'RDC', 'rez-de-chaussée', 'Sous-sol', 'niveau -1', '2ème étage', 'ÉTAGE 3',
+    'toiture terrasse', 'dosé à 350', 'DOSAGE : 400', '300 kg/m3', '250KG/M³', '20x20x40',
+    '15 X 30', 'Ø12', 'D 10', '12 mm', 'ép. 15 cm', 'Epaisseur 20 mm', "10 cm d'épaisseur",
+    'e = 5 cm', 'ss', 'passe', '1er étage',
+]
+
+
+def detecter_historique(texte: str) -> tuple:
+    """Quatre détecteurs, motif par motif (comportement d'origine)"""
+    resultat = []
+    for famille, motifs in MOTIFS.items():
+        source = texte.lower() if famille == 'niveau' else texte
+        valeur = None
+        for motif, sans_casse, libelle in motifs:
+            drapeaux = re.IGNORECASE if sans_casse else 0
+            match = re.search(motif, source, drapeaux)
+            if match:
+                valeur = libelle or (f"{match.group(1)} kg/m³" if famille == 'dosage' else match.group(0))
+                break
+        resultat.append(valeur)
+    return tuple(resultat)
+
+
+def bench_metadonnees(args):
+    rnd = random.Random(42)
+    modeles = []
+    for _ in range(args.distinctes):
+        mots = rnd.sample(DESIGNATIONS, 1) + rnd.sample(FRAGMENTS_METADONNEES, rnd.randint(0, 3))
+        rnd.shuffle(mots)
+        modeles.append(' '.join(mots))
+    designations = [rnd.choice(modeles) for _ in range(args.elements)]
+    detecteur = detecteur_metadonnees()
+
+    def en_tuple(meta):
+        return (meta.niveau, meta.dosage, meta.dimensions, meta.epaisseur)
+
+    differences = [d for d in set(designations) if detecter_historique(d) != en_tuple(detecteur.detecter(d))]
+
+    def historique():
+        for d in designations:
+            detecter_historique(d)
+
+    def compile_seul():
+        for d in designations:
+            detecteur.detecter(d)
+
+    def memorise():
+        detecter_metadonnees.cache_clear()
+        for d in designations:
+            detecter_metadonnees(d)
+
+    t_hist = mesurer(historique, repeat=args.repeat)
+    t_unique = mesurer(compile_seul, repeat=args.repeat)
+    t_memo = mesurer(memorise, repeat=args.repeat)
+    print(f"Désignations: {args.elements} dont {len(set(designations))} distinctes | "
+          f"{sum(map(len, MOTIFS.values()))} motifs | différences: {len(differences)}")
+    for d in differences[:5]:
+        print(f"  ≠ {d!r}: {detecter_historique(d)} / {en_tuple(detecteur.detecter(d))}")
+    print(f"  historique (re.search motif par motif): {t_hist:8.1f} ms")
+    print(f"  motifs compilés, un appel:              {t_unique:8.1f} ms  x{t_hist / t_unique:.1f}")
+    print(f"  motifs compilés + mémoire LRU:          {t_memo:8.1f} ms  x{t_hist / t_memo:.1f}")
+
+
+# ============================================================================
+# EXTRACTION PARALLÈLE PAR PAGES
+# ============================================================================
+
+def bench_pages(args):
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+        f.write(generer_pdf(args.pages, args.lignes))
+        chemin = f.name
+    try:
+        print(f"PDF synthétique: {args.pages} pages | CPU: {os.cpu_count()}")
+        reference = None
+        for nb in (int(n) for n in args.processus.split(',')):
+            # Premier passage hors mesure: démarrage et préchauffage du pool
+            ExtracteurPDFPlumber(chemin, nb_processus=nb).extraire()
+            debut = time.perf_counter()
+            resultat = ExtracteurPDFPlumber(chemin, nb_processus=nb).extraire()
+            duree = time.perf_counter() - debut
+            if reference is None:
+                reference = (resultat, duree)
+            identique = (list(resultat.elements) == list(reference[0].elements)
+                         and resultat.resume_lots == reference[0].resume_lots)
+            print(f"  {nb} processus ({len(decouper_pages(args.pages, nb))} tranches): "
+                  f"{duree:6.2f} s, {args.pages / duree:5.1f} pages/s, "
+                  f"x{reference[1] / duree:.1f} | identique: {identique}")
+    finally:
+        arreter_pools()
+        os.unlink(chemin)
+
+
+def bench_triage(args):
+    """Extraction locale séquentielle, sans puis avec tri des pages"""
+    nb_texte = round(args.pages * args.texte / 100)
+    pas = args.pages / nb_texte if nb_texte else 0
+    pages_texte = sorted({int(i * pas) for i in range(nb_texte)})
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+        f.write(generer_pdf(args.pages, args.lignes, tableau=not args.listes, pages_texte=pages_texte))
+        chemin = f.name
+    try:
+        print(f"PDF synthétique: {args.pages} pages dont {len(pages_texte)} de texte courant, "
+              f"{'listes sans filets' if args.listes else 'tableaux tracés'}")
+        reference = None
+        extractor.MOTEUR_PDF = 'pdfplumber'   # Gain du tri seul (voir bench_moteurs)
+        for tri in (False, True):
+            extractor.TRIAGE_PAGES = tri
+            durees = []
+            for _ in range(args.repeat):
+                extracteur = ExtracteurPDFPlumber(chemin, nb_processus=1)
+                debut = time.perf_counter()
+                resultat = extracteur.extraire()
+                durees.append(time.perf_counter() - debut)
+            duree = median(durees)
+            if reference is None:
+                reference = (resultat, duree)
+            contenus = {}
+            for confiance in extracteur.confiances:
+                contenus[confiance.contenu or 'non triée'] = contenus.get(confiance.contenu or 'non triée', 0) + 1
+            print(f"  tri {'activé   ' if tri else 'désactivé'}: {duree:6.2f} s, "
+                  f"{duree * 1000 / args.pages:5.1f} ms/page, x{reference[1] / duree:.2f} | "
+                  f"identique: {list(resultat.elements) == list(reference[0].elements)} | {contenus}")
+    finally:
+        extractor.TRIAGE_PAGES = True
+        extractor.MOTEUR_PDF = 'auto'
+        os.unlink(chemin)
+
+
+def bench_moteurs(args):
+    """Extraction locale séquentielle par moteur de lecture: débit et rappel des postes"""
+    attendus = {
+        (e['numero'], e['designation'], e['prix_total'])
+        for e in TransportGeminiSimule(postes_par_page=args.lignes).postes(1, args.pages)
+    }
+    corpus = {
+        'tableaux tracés': dict(tableau=True),
+        'listes sans filets': dict(tableau=False),
+        'listes océrisées': dict(tableau=False, ocr=True),
+    }
+    print(f"Corpus synthétique: {args.pages} pages de {args.lignes} postes par mise en page")
+    try:
+        for libelle, options in corpus.items():
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+                f.write(generer_pdf(args.pages, args.lignes, **options))
+                chemin = f.name
+            try:
+                print(f"  {libelle}:")
+                reference = None
+                for moteur in ('pdfplumber', 'auto', 'pdfium'):
+                    extractor.MOTEUR_PDF = moteur
+                    durees = []
+                    for _ in range(args.repeat):
+                        extracteur = ExtracteurPDFPlumber(chemin, nb_processus=1)
+                        debut = time.perf_counter()
+                        resultat = extracteur.extraire()
+                        durees.append(time.perf_counter() - debut)
+                    duree = median(durees)
+                    if reference is None:
+                        reference = duree
+                    trouves = {(e['numero'], e['designation'], e['prix_total']) for e in resultat.elements}
+                    moteurs = {}
+                    for confiance in extracteur.confiances:
+                        moteurs[confiance.moteur] = moteurs.get(confiance.moteur, 0) + 1
+                    print(f"    {moteur:10s}: {args.pages / duree:6.1f} pages/s, x{reference / duree:5.1f} | "
+                          f"rappel {len(trouves & attendus) / len(attendus):6.1%} | {moteurs}")
+            finally:
+                os.unlink(chemin)
+    finally:
+        extractor.MOTEUR_PDF = 'auto'
+
+
+# Extraction dans un interpréteur neuf: la mémoire d'un passage ne fausse pas le suivant.
+# ru_maxrss survit à exec (il vaudrait celui du benchmark): le pic réel est
+# échantillonné toutes les 10 ms.
+SCRIPT_MEMOIRE = """
+import json, sys, threading, time
+from extractor import ExtracteurPDFPlumber, MemoireDepassee, memoire_processus_mo
+pic = [0.0]
+def echantillonner():
+    while True:
+        pic[0] = max(pic[0], memoire_processus_mo())
+        time.sleep(0.01)
+threading.Thread(target=echantillonner, daemon=True).start()
+debut = time.perf_counter()
+try:
+    r = ExtracteurPDFPlumber(sys.argv[1], nb_processus=1).extraire()
+    sortie = dict(elements=r.nb_elements, pic=r.memoire_pic_mo)
+except MemoireDepassee as e:
+    sortie = dict(erreur=str(e))
+sortie.update(duree=time.perf_counter() - debut, maxrss=max(pic[0], memoire_processus_mo()))
+print(json.dumps(sortie))
+"""
+
+
+def bench_memoire(args):
+    """
+    Pic de mémoire d'une extraction pdfplumber séquentielle, sans puis avec
+    bornes. Le budget porte sur la hausse de mémoire depuis le début de
+    l'extraction; sans --budget-mo, il vaut 90 % de celle du document
+    entier: l'extraction non fenêtrée doit s'interrompre proprement.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+        f.write(generer_pdf(args.pages, args.lignes, fond_ko=args.fond_ko))
+        chemin = f.name
+
+    def mesurer(libelle: str, variables: dict) -> dict:
+        env = dict(os.environ, BTP_MOTEUR_PDF='pdfplumber', **variables)
+        proc = subprocess.run(
+            [sys.executable, '-c', SCRIPT_MEMOIRE, chemin], env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        )
+        mesure = json.loads(proc.stdout.splitlines()[-1])
+        issue = mesure.get('erreur') or f"{mesure['elements']} éléments, hausse max +{mesure['pic']} Mo"
+        print(f"  {libelle:38s}: {mesure['duree']:6.1f} s | RSS max {mesure['maxrss']:6.0f} Mo | {issue}")
+        return mesure
+
+    sans_bornes = {'BTP_FENETRE_PAGES': '0', 'BTP_DEBORDEMENT_ELEMENTS': '0'}
+    try:
+        print(f"PDF synthétique: {args.pages} pages de {args.lignes} postes, "
+              f"fond de {args.fond_ko} Ko par page ({os.path.getsize(chemin) / 1e6:.0f} Mo), lecture pdfplumber")
+        entier = mesurer('document entier', sans_bornes)
+        mesurer(f'fenêtres de {args.fenetre} pages, débordement',
+                {'BTP_FENETRE_PAGES': str(args.fenetre), 'BTP_DEBORDEMENT_ELEMENTS': str(args.debordement)})
+        budget = args.budget_mo or round(entier['pic'] * 0.9)
+        mesurer(f'document entier, budget {budget:.0f} Mo', dict(sans_bornes, BTP_MEMOIRE_MAX_MO=str(budget)))
+        mesurer(f'fenêtres, budget {budget:.0f} Mo',
+                {'BTP_FENETRE_PAGES': str(args.fenetre), 'BTP_DEBORDEMENT_ELEMENTS': str(args.debordement),
+                 'BTP_MEMOIRE_MAX_MO': str(budget)})
+    finally:
+        os.unlink(chemin)
+
+
+# ============================================================================
+# RECONSTRUCTION DES LIGNES DE POSTES
+# ============================================================================
+
+# Repli d'origine sur le texte des pages sans tableau: une expression par ligne
+MOTIF_POSTE_HISTORIQUE = re.compile(
+    r'^(\d+(?:\.\d+)*)\s+(.+?)\s+(m[²³l]?|u|kg|ml|l|ens|ft)\s+([\d\s,\.]+)\s+([\d\s,\.]+)\s+([\d\s,\.]+)',
+    re.IGNORECASE
+)
+
+
+def postes_historique(texte: str) -> list:
+    """Éléments des lignes reconnues par l'expression d'origine (même construction qu'aujourd'hui)"""
+    elements = []
+    for ligne in texte.split('\n'):
+        match = MOTIF_POSTE_HISTORIQUE.match(ligne)
+        if match:
+            numero, designation, unite, qte, pu, total = match.groups()
+            categorie, sous_categorie = categoriser_element(designation)
+            meta = detecter_metadonnees(designation)
+            elements.append(ElementBTP(
+                numero=numero, designation=designation.strip(), categorie=categorie,
+                sous_categorie=sous_categorie, unite=unite,
+                quantite=extractor.parser_montant_fcfa(qte) or 0,
+                prix_unitaire=extractor.parser_montant_fcfa(pu),
+                prix_total=extractor.parser_montant_fcfa(total), lot_numero=None, lot_nom=None,
+                niveau=meta.niveau, dosage=meta.dosage, dimensions=meta.dimensions,
+                materiaux=None, epaisseur=meta.epaisseur
+            ))
+    return elements
+
+
+def bench_reconstruction(args):
+    """Pages sans tableau: expression d'origine sur le texte vs position des mots"""
+    import pdfplumber
+
+    attendus = {
+        (e['numero'], e['designation'], e['prix_total'])
+        for e in TransportGeminiSimule(postes_par_page=args.lignes).postes(1, args.pages)
+    }
+    print(f"Corpus synthétique: {args.pages} pages de {args.lignes} postes, mots lus une fois (hors mesure)")
+    for libelle, ocr in (('listes sans filets', False), ('listes océrisées', True)):
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+            f.write(generer_pdf(args.pages, args.lignes, tableau=False, ocr=ocr))
+            chemin = f.name
+        try:
+            with pdfplumber.open(chemin) as pdf:
+                pages = [extractor.lire_page_pdfplumber(page, extractor.TriPage('liste')).mots
+                         for page in pdf.pages]
+        finally:
+            os.unlink(chemin)
+        textes = [extractor._texte_mots(mots) for mots in pages]
+
+        def historique():
+            return [(e.numero, e.designation, e.prix_total)
+                    for texte in textes for e in postes_historique(texte)]
+
+        def par_position():
+            extracteur = ExtracteurPDFPlumber('')
+            for mots in pages:
+                extracteur._traiter_mots(mots)
+            return [(e.numero, e.designation, e.prix_total) for e in extracteur.elements]
+
+        print(f"  {libelle}:")
+        for nom, fn in (('expression', historique), ('positions', par_position)):
+            trouves = set(fn())
+            duree = mesurer(fn, repeat=args.repeat)
+            print(f"    {nom:10s}: {duree / len(attendus) * 1000:6.1f} µs/poste | "
+                  f"rappel {len(trouves & attendus) / len(attendus):6.1%}")
+
+
+# ============================================================================
+# EXTRACTION GEMINI PAR LOTS DE PAGES
+# ============================================================================
+
+def bench_gemini(args):
+    """Client Gemini simulé: un appel pour tout le document vs lots parallèles"""
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+        f.write(generer_pdf(args.pages, args.postes))
+        chemin = f.name
+    try:
+        print(f"PDF synthétique: {args.pages} pages, {args.postes} postes par page | "
+              f"{args.ms_par_jeton} ms par jeton généré")
+        reference = None
+        for nb in (int(n) for n in args.concurrence.split(',')):
+            transport = TransportGeminiSimule(
+                postes_par_page=args.postes, secondes_par_jeton=args.ms_par_jeton / 1000,
+                doublons=True
+            )
+            client = ClientGemini(transport, par_minute=args.rpm)
+            # Concurrence 1 et lot unique: comportement d'origine (un seul appel)
+            pages_par_lot = args.pages if nb == 1 else None
+            extractor.estimateur_jetons = extractor.EstimateurJetons()
+            debut = time.perf_counter()
+            resultat = ExtracteurGemini(chemin, client=client, concurrence=nb,
+                                        pages_par_lot=pages_par_lot).extraire()
+            duree = time.perf_counter() - debut
+            if reference is None:
+                reference = duree
+            attendu = transport.postes(1, args.pages)
+            identique = ([(e['numero'], e['lot_numero'], e['prix_total']) for e in resultat.elements]
+                         == [(e['numero'], e['lot_numero'], e['prix_total']) for e in attendu])
+            print(f"  concurrence {nb}: {duree:6.2f} s, x{reference / duree:.1f} | "
+                  f"{transport.appels} appels dont {transport.tronquees} tronqués | "
+                  f"{resultat.nb_elements} éléments, identique: {identique}, erreurs: {len(resultat.erreurs)}")
+            client.fermer()
+    finally:
+        os.unlink(chemin)
+
+
+def bench_gemini_client(args):
+    """Client partagé sous charge: débit d'appels simultanés, erreurs transitoires et budget"""
+    transport = TransportGeminiSimule(postes_par_page=5, secondes_par_jeton=args.ms_par_jeton / 1000,
+                                      echecs=args.echecs)
+    client = ClientGemini(transport, appels_simultanes=args.simultanes, par_minute=0)
+    pdf = generer_pdf(1, 5)
+    prompt = "pages 1 à 1 d'un document de 1 pages"
+    config = {'max_output_tokens': 32000}
+
+    async def lancer():
+        return await asyncio.gather(
+            *(client.generer(prompt, pdf, config) for _ in range(args.appels)),
+            return_exceptions=True
+        )
+
+    debut = time.perf_counter()
+    resultats = asyncio.run(lancer())
+    duree = time.perf_counter() - debut
+    client.fermer()
+    echecs = [r for r in resultats if isinstance(r, Exception)]
+    print(f"{args.appels} appels, {args.simultanes} simultanés, {args.echecs} erreurs transitoires injectées")
+    print(f"  {duree:.2f} s, {args.appels / duree:.0f} appels/s | "
+          f"{transport.appels - args.appels} nouveaux essais | {len(echecs)} échecs "
+          f"| budget restant: {client.budget.jetons:.1f}")
+
+
+def bench_hybride(args):
+    """Client Gemini simulé: tout le document vs pages peu fiables seulement"""
+    nb_degradees = round(args.pages * args.degradees / 100)
+    pas = args.pages / nb_degradees if nb_degradees else 0
+    degradees = sorted({int(i * pas) for i in range(nb_degradees)})
+    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+        f.write(generer_pdf(args.pages, args.postes, pages_degradees=degradees))
+        chemin = f.name
+    try:
+        print(f"PDF synthétique: {args.pages} pages dont {len(degradees)} dégradées, "
+              f"{args.postes} postes par page | {args.ms_par_jeton} ms par jeton généré")
+        attendu = None
+        for mode in ('gemini', 'hybrid'):
+            transport = TransportGeminiSimule(
+                postes_par_page=args.postes, secondes_par_jeton=args.ms_par_jeton / 1000
+            )
+            client = ClientGemini(transport, par_minute=args.rpm)
+            extractor.estimateur_jetons = extractor.EstimateurJetons()
+            debut = time.perf_counter()
+            if mode == 'gemini':
+                extracteur = ExtracteurGemini(chemin, client=client, concurrence=args.concurrence)
+            else:
+                extracteur = ExtracteurHybride(chemin, client=client, nb_processus=1)
+                extracteur.gemini.concurrence = args.concurrence
+            resultat = extracteur.extraire()
+            duree = time.perf_counter() - debut
+            postes = [(e['numero'], e['lot_numero'], e['prix_total']) for e in resultat.elements]
+            if attendu is None:
+                attendu = postes
+            pages = len(extracteur.pages_gemini) if mode == 'hybrid' else args.pages
+            print(f"  {mode:7s}: {duree:6.2f} s | {pages} pages envoyées, {transport.appels} appels | "
+                  f"{resultat.nb_elements} éléments, identique: {postes == attendu}, "
+                  f"erreurs: {len(resultat.erreurs)}")
+            client.fermer()
+    finally:
+        arreter_pools()
+        os.unlink(chemin)
+
+
+# ============================================================================
+# FICHIERS REÇUS PAR L'API
+# ============================================================================
+
+def entrees_sorties() -> tuple:
+    """Octets lus et écrits par le processus via des appels système (Linux)"""
+    with open('/proc/self/io') as f:
+        valeurs = dict(ligne.split(': ') for ligne in f.read().splitlines())
+    return int(valeurs['rchar']), int(valeurs['wchar'])
+
+
+def bench_fichiers(args):
+    """
+    Requêtes /extract dans le processus (cache désactivé, Gemini simulé):
+    durée et octets lus/écrits par requête, pour un petit PDF et un PDF
+    au-delà du seuil d'écriture sur disque. Les octets comprennent le
+    fichier tampon de Starlette (envois de plus de 1 Mo).
+    """
+    os.environ['BTP_CACHE_MAX_MB'] = '0'
+    os.environ.setdefault('GEMINI_API_KEY', 'simulee')
+    import httpx
+    import api
+
+    client = ClientGemini(TransportGeminiSimule(postes_par_page=args.lignes), par_minute=0)
+    extractor.client_gemini = lambda cle: client
+    extractor.GEMINI_AVAILABLE = api.GEMINI_AVAILABLE = True
+    documents = {
+        'petit': generer_pdf(args.pages, args.lignes),
+        'gros': generer_pdf(args.pages, args.lignes, fond_ko=args.fond_ko),
+    }
+
+    async def lancer():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app),
+                                     base_url='http://bench', timeout=600) as http:
+            for nom, pdf in documents.items():
+                print(f"  PDF {nom}: {args.pages} pages, {len(pdf) / 1e6:.1f} Mo")
+                for mode in ('local', 'gemini'):
+                    mesures = []
+                    for _ in range(args.repeat):
+                        avant = entrees_sorties()
+                        debut = time.perf_counter()
+                        reponse = await http.post(f'/extract?mode={mode}',
+                                                  files={'file': ('devis.pdf', pdf, 'application/pdf')})
+                        duree = time.perf_counter() - debut
+                        reponse.raise_for_status()
+                        apres = entrees_sorties()
+                        mesures.append((duree, apres[0] - avant[0], apres[1] - avant[1]))
+                    duree, lus, ecrits = (median(m[i] for m in mesures) for i in range(3))
+                    print(f"    {mode:6s}: {duree * 1000:7.1f} ms | lus {lus / len(pdf):4.1f}x, "
+                          f"écrits {ecrits / len(pdf):4.1f}x la taille du PDF")
+
+    try:
+        asyncio.run(lancer())
+    finally:
+        client.fermer()
+
+
+# ============================================================================
+# TEMPS D'IMPORT
+# ============================================================================
+
+# Bibliothèques qui ne doivent pas être chargées à l'import de l'API
+IMPORTS_DIFFERES = ('pdfplumber', 'pdfminer', 'pypdfium2', 'google.generativeai')
+
+
+def mesurer_import(module: str) -> tuple:
+    """
+    Importe `module` dans un interpréteur neuf avec `-X importtime`.
+
+    Returns:
+        (durée cumulée en ms, {dépendance directe: ms}, modules chargés)
+    """
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         f'import {module}, sys, json; print(json.dumps(sorted(sys.modules)))'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+    )
+    # Les dépendances sont listées avant le module qui les importe
+    total = 0.0
+    dependances, enfants = {}, {}
+    for ligne in proc.stderr.splitlines():
+        if not ligne.startswith('import time:') or '|' not in ligne:
+            continue
+        _, cumul, nom = ligne.split('|', 2)
+        if not cumul.strip().isdigit():
+            continue  # En-tête
+        profondeur = (len(nom) - len(nom.lstrip())) // 2
+        if profondeur == 1:
+            enfants[nom.strip()] = int(cumul) / 1000
+        elif profondeur == 0:
+            if nom.strip() == module:
+                total, dependances = int(cumul) / 1000, enfants
+            enfants = {}
+    return total, dependances, json.loads(proc.stdout.splitlines()[-1])
+
+
+def bench_demarrage(args):
+    mesures = [mesurer_import(args.module) for _ in range(args.repeat)]
+    total, dependances, modules = min(mesures, key=lambda m: m[0])
+
+    print(f"Import de {args.module}: {total:.0f} ms (meilleur de {args.repeat})")
+    for nom, ms in sorted(dependances.items(), key=lambda d: -d[1])[:args.top]:
+        print(f"  {nom:40s} {ms:8.1f} ms")
+
+    erreurs = [f"{nom} importé au chargement" for nom in IMPORTS_DIFFERES if nom in modules]
+    if args.budget_ms is not None and total > args.budget_ms:
+        erreurs.append(f"budget dépassé: {total:.0f} ms > {args.budget_ms:.0f} ms")
+    for erreur in erreurs:
+        print(f"ÉCHEC: {erreur}")
+    sys.exit(1 if erreurs else 0)
+
+
+# ============================================================================
+# POINT D'ENTRÉE
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks extracteur BTP')
+    sub = parser.add_subparsers(dest='commande', required=True)
+
+    p = sub.add_parser('serialisation', help='Sérialisation de la réponse /extract')
+    p.add_argument('--elements', type=int, default=10000)
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_serialisation)
+
+    p = sub.add_parser('categories', help='Catégorisation: mots-clés un par un vs expression compilée')
+    p.add_argument('--elements', type=int, default=20000)
+    p.add_argument('--distinctes', type=int, default=2000, help='Désignations distinctes')
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_categories)
+
+    p = sub.add_parser('metadonnees', help='Métadonnées techniques: quatre détecteurs vs détecteur compilé mémorisé')
+    p.add_argument('--elements', type=int, default=20000)
+    p.add_argument('--distinctes', type=int, default=2000, help='Désignations distinctes')
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_metadonnees)
+
+    p = sub.add_parser('pages', help='Extraction pdfplumber séquentielle vs par tranches')
+    p.add_argument('--pages', type=int, default=40)
+    p.add_argument('--lignes', type=int, default=30, help='Postes par page')
+    p.add_argument('--processus', default='1,2,4')
+    p.set_defaults(func=bench_pages)
+
+    p = sub.add_parser('triage', help='Extraction locale sans/avec tri des pages (garde, conditions)')
+    p.add_argument('--pages', type=int, default=30)
+    p.add_argument('--lignes', type=int, default=30, help='Postes par page')
+    p.add_argument('--texte', type=float, default=30, help='Pourcentage de pages de texte courant')
+    p.add_argument('--listes', action='store_true', help='Postes en texte brut au lieu de tableaux')
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=bench_triage)
+
+    p = sub.add_parser('moteurs', help='Extraction locale: pdfplumber vs PDFium (débit, rappel)')
+    p.add_argument('--pages', type=int, default=30)
+    p.add_argument('--lignes', type=int, default=30, help='Postes par page')
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=bench_moteurs)
+
+    p = sub.add_parser('memoire', help='Pic de mémoire: document entier vs fenêtres de pages et budget')
+    p.add_argument('--pages', type=int, default=200)
+    p.add_argument('--lignes', type=int, default=30, help='Postes par page')
+    p.add_argument('--fenetre', type=int, default=50, help='Pages par ouverture du PDF')
+    p.add_argument('--debordement', type=int, default=2000, help='Éléments gardés en mémoire')
+    p.add_argument('--fond-ko', type=int, default=200, help='Image de fond par page (Ko)')
+    p.add_argument('--budget-mo', type=float, default=None, help='Hausse de mémoire max. (défaut: 90 %% de celle du document entier)')
+    p.set_defaults(func=bench_memoire)
+
+    p = sub.add_parser('reconstruction', help="Pages sans tableau: expression d'origine vs position des mots")
+    p.add_argument('--pages', type=int, default=20)
+    p.add_argument('--lignes', type=int, default=30, help='Postes par page')
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_reconstruction)
+
+    p = sub.add_parser('gemini', help='Gemini (client simulé): appel unique vs lots de pages parallèles')
+    p.add_argument('--pages', type=int, default=60)
+    p.add_argument('--postes', type=int, default=25, help='Postes par page')
+    p.add_argument('--concurrence', default='1,4,8', help='1 = un seul appel pour le document')
+    p.add_argument('--ms-par-jeton', type=float, default=0.2, help='Latence simulée par jeton généré')
+    p.add_argument('--rpm', type=float, default=600, help='Appels par minute')
+    p.set_defaults(func=bench_gemini)
+
+    p = sub.add_parser('gemini-client', help='Client Gemini partagé (transport simulé): concurrence et nouveaux essais')
+    p.add_argument('--appels', type=int, default=200)
+    p.add_argument('--simultanes', type=int, default=16)
+    p.add_argument('--echecs', type=int, default=20, help='Premiers appels en erreur transitoire')
+    p.add_argument('--ms-par-jeton', type=float, default=2.0)
+    p.set_defaults(func=bench_gemini_client)
+
+    p = sub.add_parser('hybride', help='Hybride (client simulé): Gemini sur les pages peu fiables seulement')
+    p.add_argument('--pages', type=int, default=60)
+    p.add_argument('--postes', type=int, default=25, help='Postes par page')
+    p.add_argument('--degradees', type=float, default=10, help='Pourcentage de pages dégradées')
+    p.add_argument('--concurrence', type=int, default=4)
+    p.add_argument('--ms-par-jeton', type=float, default=5.0,
+                   help='Latence simulée par jeton généré (~200 jetons/s)')
+    p.add_argument('--rpm', type=float, default=600, help='Appels par minute')
+    p.set_defaults(func=bench_hybride)
+
+    p = sub.add_parser('fichiers', help="Requêtes /extract: durée et octets lus/écrits par requête")
+    p.add_argument('--pages', type=int, default=20)
+    p.add_argument('--lignes', type=int, default=30, help='Postes par page')
+    p.add_argument('--fond-ko', type=int, default=500, help='Image de fond par page du gros PDF (Ko)')
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=bench_fichiers)
+
+    p = sub.add_parser('demarrage', help="Temps d'import (échoue au-delà du budget)")
+    p.add_argument('--module', default='api')
+    p.add_argument('--budget-ms', type=float, default=None)
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--top', type=int, default=10)
+    p.set_defaults(func=bench_demarrage)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
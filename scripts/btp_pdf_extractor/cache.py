@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Cache persistant des résultats d'extraction
+
+Un résultat est rangé sous l'empreinte SHA-256 complète du PDF, le mode
+d'extraction et la version des résultats (logique d'extraction, version de
+pdfplumber, modèle et prompt Gemini): renvoyer le même devis ne relance ni
+pdfplumber ni un appel Gemini payant, et une nouvelle version de
+l'extracteur invalide d'elle-même les anciens résultats.
+
+Une entrée = un fichier JSON dans le répertoire du cache, écrit de façon
+atomique; plusieurs processus (workers uvicorn) peuvent partager le même
+répertoire. Les entrées expirent après un TTL; au-delà de la taille
+maximale, les moins récemment utilisées sont retirées (la date de
+modification sert de date de dernière utilisation).
+
+Usage:
+    cache = CacheResultats('/var/cache/btp', taille_max=512 * 1024**2, ttl=7 * 86400)
+    cle = cache.cle(empreinte, 'gemini', version_extraction('gemini'))
+    resultat = cache.lire(cle) or extraire()
+    cache.ecrire(cle, resultat)
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from extractor import ResultatExtraction, loads_json
+from metrics import CACHE_OCTETS, CACHE_EVICTIONS
+
+logger = logging.getLogger(__name__)
+
+EXTENSION = '.json'
+
+
+class CacheResultats:
+    """Cache disque des ResultatExtraction, borné en taille et en âge"""
+
+    def __init__(self, dossier: str, taille_max: int, ttl: float):
+        """
+        Args:
+            dossier: Répertoire des entrées (créé au besoin)
+            taille_max: Taille totale maximale en octets (0 = cache désactivé)
+            ttl: Durée de vie d'une entrée en secondes
+        """
+        self.dossier = dossier
+        self.taille_max = taille_max
+        self.ttl = ttl
+        self._verrou = threading.Lock()   # Éviction: un seul parcours à la fois par processus
+
+    @property
+    def actif(self) -> bool:
+        return self.taille_max > 0
+
+    @staticmethod
+    def cle(empreinte: str, mode: str, version: str) -> str:
+        """Clé d'une entrée: empreinte SHA-256 complète, mode et version des résultats"""
+        return f"{empreinte}-{mode}-{version}"
+
+    def _chemin(self, cle: str) -> str:
+        return os.path.join(self.dossier, cle + EXTENSION)
+
+    def lire(self, cle: str) -> Optional[ResultatExtraction]:
+        """Résultat en cache, ou None (absent, expiré ou illisible)"""
+        if not self.actif:
+            return None
+        chemin = self._chemin(cle)
+        try:
+            if time.time() - os.stat(chemin).st_mtime > self.ttl:
+                self._supprimer(chemin, 'ttl')
+                return None
+            with open(chemin, 'rb') as f:
+                resultat = ResultatExtraction(**loads_json(f.read()))
+            os.utime(chemin)   # Dernière utilisation, pour l'éviction LRU
+            return resultat
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"⚠️ Entrée de cache illisible {cle}: {e}")
+            self._supprimer(chemin, 'corrompue')
+            return None
+
+    def ecrire(self, cle: str, resultat: ResultatExtraction):
+        """
+        Enregistre un résultat puis applique TTL et taille maximale. Le JSON
+        est écrit par morceaux (éléments éventuellement relus du disque),
+        abandonné dès qu'il dépasse la taille maximale.
+        """
+        if not self.actif:
+            return
+        os.makedirs(self.dossier, exist_ok=True)
+        chemin = self._chemin(cle)
+        temporaire = f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+        taille = 0
+        try:
+            with open(temporaire, 'wb') as f:
+                for morceau in resultat.iter_json():
+                    taille += len(morceau)
+                    if taille > self.taille_max:
+                        break
+                    f.write(morceau)
+            if taille > self.taille_max:
+                logger.info(f"Résultat trop volumineux pour le cache (plus de {self.taille_max} octets)")
+                os.unlink(temporaire)
+                return
+            os.replace(temporaire, chemin)
+        except OSError as e:
+            logger.warning(f"⚠️ Écriture du cache impossible: {e}")
+            try:
+                os.unlink(temporaire)
+            except OSError:
+                pass
+            return
+        self.evincer()
+
+    def evincer(self):
+        """Retire les entrées expirées, puis les moins récentes au-delà de la taille maximale"""
+        with self._verrou:
+            entrees = self._entrees()
+            limite = time.time() - self.ttl
+            restantes = []
+            for mtime, taille, chemin in entrees:
+                if mtime < limite:
+                    self._supprimer(chemin, 'ttl')
+                else:
+                    restantes.append((mtime, taille, chemin))
+
+            total = sum(taille for _, taille, _ in restantes)
+            for mtime, taille, chemin in sorted(restantes):
+                if total <= self.taille_max:
+                    break
+                self._supprimer(chemin, 'taille')
+                total -= taille
+            CACHE_OCTETS.set(total)
+
+    def vider(self):
+        """Supprime toutes les entrées"""
+        with self._verrou:
+            for _, _, chemin in self._entrees():
+                self._supprimer(chemin, 'purge')
+            CACHE_OCTETS.set(0)
+
+    def statistiques(self) -> dict:
+        """Nombre d'entrées et taille totale"""
+        entrees = self._entrees()
+        return {
+            'entrees': len(entrees),
+            'octets': sum(taille for _, taille, _ in entrees),
+            'taille_max': self.taille_max,
+            'ttl': self.ttl
+        }
+
+    def _entrees(self) -> List[Tuple[float, int, str]]:
+        """(date de dernière utilisation, taille, chemin) de chaque entrée"""
+        entrees = []
+        try:
+            with os.scandir(self.dossier) as it:
+                for entree in it:
+                    if not entree.name.endswith(EXTENSION):
+                        continue
+                    try:
+                        stat = entree.stat()
+                    except FileNotFoundError:   # Retirée par un autre processus
+                        continue
+                    entrees.append((stat.st_mtime, stat.st_size, entree.path))
+        except FileNotFoundError:
+            pass
+        return entrees
+
+    @staticmethod
+    def _supprimer(chemin: str, raison: str):
+        try:
+            os.unlink(chemin)
+            CACHE_EVICTIONS.labels(raison).inc()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+PDF à extraire, lu une seule fois
+
+Le PDF reçu est recopié une fois, par blocs, dans un tampon unique mappé en
+mémoire, et son empreinte SHA-256 est calculée au passage: mémoire anonyme
+jusqu'à SEUIL_DISQUE (aucune écriture sur disque), au-delà fichier
+temporaire. Un PDF déjà sur disque (ligne de commande, processus de
+tranches) est mappé tel quel.
+
+Tous les lecteurs partagent ce tampon, sans copie ni relecture:
+    - pdfplumber: un flux par ouverture (position propre), sur le tampon
+    - PDFium (tri des pages, lots Gemini): tableau ctypes sur le tampon
+    - charge Gemini du document entier: le même tableau
+    - empreinte, estimation de l'admission: calculées sur le tampon
+Seules les tranches de pages extraites par d'autres processus ont besoin
+d'un chemin: il n'est écrit qu'à ce moment pour un PDF gardé en mémoire.
+
+Les octets lus, écrits et transmis à pdfplumber sont comptés par document
+(`es`): l'API les publie par requête.
+
+Usage:
+    document = await DocumentPDF.depuis_envoi(upload, 'devis.pdf', taille_max=20 * 1024**2)
+    try:
+        document.empreinte, len(document)
+        ExtracteurPDFPlumber(document).extraire()
+    finally:
+        document.fermer()
+"""
+
+import ctypes
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+import weakref
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+BLOC_LECTURE = 1024 * 1024
+SEUIL_DISQUE = int(float(os.getenv('BTP_SEUIL_DISQUE_MO', 8)) * 1024 * 1024)   # Au-delà: fichier temporaire
+
+
+class DocumentTropVolumineux(ValueError):
+    """PDF reçu au-delà de la taille maximale acceptée"""
+
+
+def _supprimer(chemin: str):
+    try:
+        os.unlink(chemin)
+    except OSError:
+        pass
+
+
+class FluxTampon(io.RawIOBase):
+    """Flux en lecture seule sur le tampon d'un document, avec sa propre position"""
+
+    def __init__(self, document: 'DocumentPDF'):
+        self._document = document
+        self._tampon = document.tampon
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, taille: int = -1) -> bytes:
+        fin = len(self._tampon) if taille is None or taille < 0 else min(len(self._tampon), self._position + taille)
+        donnees = bytes(self._tampon[self._position:fin])
+        self._position = max(self._position, fin)
+        self._document.es['flux'] += len(donnees)
+        return donnees
+
+    def readinto(self, tampon) -> int:
+        donnees = self.read(len(tampon))
+        tampon[:len(donnees)] = donnees
+        return len(donnees)
+
+    def seek(self, decalage: int, origine: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._tampon)}[origine]
+        self._position = max(0, base + decalage)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+class DocumentPDF:
+    """PDF dans un tampon mappé en mémoire, partagé par l'empreinte et les lecteurs"""
+
+    def __init__(self, memoire: mmap.mmap, taille: int, nom: str, chemin: Optional[str] = None,
+                 temporaire: bool = False, empreinte: Optional[str] = None):
+        """
+        Args:
+            memoire: Tampon (mmap anonyme ou d'un fichier, au moins `taille` octets)
+            chemin: Fichier d'origine, s'il existe
+            temporaire: `chemin` est à supprimer à la fermeture
+            empreinte: SHA-256 déjà calculé (sinon calculé au premier accès)
+        """
+        self._memoire = memoire
+        self.taille = taille
+        self.nom = nom
+        self._chemin = chemin
+        # Fichier temporaire supprimé à la fermeture, ou à défaut quand le
+        # document est collecté (flux abandonné avant son premier bloc)
+        self._suppression = weakref.finalize(self, _supprimer, chemin) if temporaire else None
+        self._empreinte = empreinte
+        self.tampon = memoryview(memoire)[:taille].toreadonly()
+        self.es: Dict[str, int] = {'lecture': 0, 'ecriture': 0, 'flux': 0}
+
+    # ------------------------------------------------------------------
+    # Ouverture
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def depuis_chemin(cls, chemin: str) -> 'DocumentPDF':
+        """PDF sur disque, mappé sans copie (pages lues à la demande par le système)"""
+        with open(chemin, 'rb') as f:
+            taille = os.fstat(f.fileno()).st_size
+            # ACCESS_COPY: mappage privé, requis par PDFium (tableau ctypes inscriptible)
+            memoire = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) if taille else mmap.mmap(-1, 1)
+        return cls(memoire, taille, Path(chemin).name, chemin=chemin)
+
+    @classmethod
+    def depuis_octets(cls, donnees: bytes, nom: str = 'document.pdf') -> 'DocumentPDF':
+        """PDF déjà en mémoire (copié une fois dans le tampon)"""
+        memoire = mmap.mmap(-1, max(len(donnees), 1))
+        memoire[:len(donnees)] = donnees
+        return cls(memoire, len(donnees), nom, empreinte=hashlib.sha256(donnees).hexdigest())
+
+    @classmethod
+    async def depuis_envoi(cls, envoi, nom: str, taille_max: Optional[int] = None,
+                           seuil_disque: Optional[int] = None) -> 'DocumentPDF':
+        """
+        PDF envoyé (UploadFile ou tout objet avec `await read(n)` et `size`),
+        copié par blocs dans le tampon avec calcul de l'empreinte au passage.
+
+        Raises:
+            DocumentTropVolumineux: Au-delà de `taille_max` (avant toute
+                copie si la taille est annoncée)
+        """
+        seuil = SEUIL_DISQUE if seuil_disque is None else seuil_disque
+        taille_annoncee = getattr(envoi, 'size', None)
+        if taille_max is not None and taille_annoncee is not None and taille_annoncee > taille_max:
+            raise DocumentTropVolumineux(f"{taille_annoncee} octets > {taille_max}")
+
+        empreinte = hashlib.sha256()
+        lus = 0
+        if taille_annoncee is not None and taille_annoncee <= seuil:
+            # Petit fichier: mémoire anonyme, aucune écriture sur disque
+            memoire = mmap.mmap(-1, max(taille_annoncee, 1))
+            while lus < taille_annoncee and (bloc := await envoi.read(min(BLOC_LECTURE, taille_annoncee - lus))):
+                memoire[lus:lus + len(bloc)] = bloc
+                empreinte.update(bloc)
+                lus += len(bloc)
+            document = cls(memoire, lus, nom, empreinte=empreinte.hexdigest())
+            document.es['lecture'] = lus
+            return document
+
+        # Gros fichier (ou taille inconnue): fichier temporaire mappé une fois écrit
+        fichier = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+        try:
+            with fichier:
+                while bloc := await envoi.read(BLOC_LECTURE):
+                    lus += len(bloc)
+                    if taille_max is not None and lus > taille_max:
+                        raise DocumentTropVolumineux(f"plus de {taille_max} octets")
+                    fichier.write(bloc)
+                    empreinte.update(bloc)
+                fichier.flush()
+                memoire = mmap.mmap(fichier.fileno(), 0, access=mmap.ACCESS_COPY) if lus else mmap.mmap(-1, 1)
+        except BaseException:
+            os.unlink(fichier.name)
+            raise
+        document = cls(memoire, lus, nom, chemin=fichier.name, temporaire=True, empreinte=empreinte.hexdigest())
+        document.es['lecture'] = document.es['ecriture'] = lus
+        return document
+
+    # ------------------------------------------------------------------
+    # Lecteurs
+    # ------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return self.taille
+
+    @property
+    def empreinte(self) -> str:
+        """SHA-256 complet du PDF (hexadécimal)"""
+        if self._empreinte is None:
+            self._empreinte = hashlib.sha256(self.tampon).hexdigest()
+        return self._empreinte
+
+    def flux(self) -> FluxTampon:
+        """Nouveau flux sur le tampon (pdfplumber.open), indépendant des autres lecteurs"""
+        return FluxTampon(self)
+
+    def tableau(self) -> ctypes.Array:
+        """
+        Tableau ctypes sur le tampon, sans copie: entrée de
+        pypdfium2.PdfDocument et charge Gemini du document entier
+        """
+        return (ctypes.c_char * self.taille).from_buffer(self._memoire)
+
+    def chemin(self) -> str:
+        """Chemin du PDF sur disque, écrit à la première demande s'il n'est qu'en mémoire"""
+        if self._chemin is None:
+            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as fichier:
+                fichier.write(self.tampon)
+            self._chemin = fichier.name
+            self._suppression = weakref.finalize(self, _supprimer, fichier.name)
+            self.es['ecriture'] += self.taille
+        return self._chemin
+
+    def fermer(self):
+        """Libère le tampon et supprime le fichier temporaire éventuel"""
+        try:
+            self.tampon.release()
+            self._memoire.close()
+        except BufferError:
+            pass   # Encore exporté (document PDFium non collecté): libéré par le ramasse-miettes
+        if self._suppression is not None:
+            self._suppression()
+
+    def __enter__(self) -> 'DocumentPDF':
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+
+def ouvrir_document(source: Union[str, Path, DocumentPDF]) -> DocumentPDF:
+    """Document d'un chemin (mappé) ou document déjà ouvert"""
+    if isinstance(source, DocumentPDF):
+        return source
+    return DocumentPDF.depuis_chemin(str(source))
@@ -4,7 +4,7 @@ Extracteur BTP - Système robuste d'extraction de données depuis des PDF DQE
 Utilise pdfplumber (local) + Gemini API (production)
 
 Usage:
-    python extractor.py <fichier.pdf> [--mode local|gemini] [--output json|csv|both]
+    python extractor.py <fichier.pdf> [--mode local|gemini|hybrid] [--output json|csv|both]
 """
 
 import os
@@ -12,42 +12,75 @@ import sys
 import json
 import csv
 import re
+import bisect
 import hashlib
+import importlib.metadata
+import importlib.util
 import logging
+import multiprocessing
+import tempfile
+import threading
+import time
+from collections import deque
+from itertools import islice
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
-from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple, Union
+from dataclasses import dataclass, field
 from enum import Enum
+from functools import lru_cache
+from statistics import median
 
 # Imports conditionnels
 try:
-    import pdfplumber
-    PDFPLUMBER_AVAILABLE = True
+    import orjson
+    ORJSON_AVAILABLE = True
 except ImportError:
-    PDFPLUMBER_AVAILABLE = False
-    print("⚠️ pdfplumber non installé. Installez avec: pip install pdfplumber")
+    ORJSON_AVAILABLE = False
 
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-    print("⚠️ google-generativeai non installé. Installez avec: pip install google-generativeai")
 
+def _module_disponible(nom: str) -> bool:
+    """Vérifie qu'un module est installé sans l'importer"""
+    try:
+        return importlib.util.find_spec(nom) is not None
+    except (ImportError, ValueError):  # ValueError: module déjà chargé sans __spec__
+        return False
 
-# Configuration du logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('btp_extractor.log', encoding='utf-8')
-    ]
+
+# pdfplumber et google-generativeai sont lourds à importer: ils ne sont
+# chargés qu'à la première extraction qui en a besoin (ou par prechauffer())
+PDFPLUMBER_AVAILABLE = _module_disponible('pdfplumber')
+GEMINI_AVAILABLE = _module_disponible('google.generativeai')
+PYPDFIUM2_AVAILABLE = _module_disponible('pypdfium2')   # Découpage des PDF en lots de pages
+
+from metrics import (
+    GEMINI_ERREURS, PAGES_HYBRIDE, PAGES_MOTEUR, PAGES_TRIEES, PHASE_DUREE,
+    mesurer_phase, enregistrer_document
+)
+from gemini_client import MODELE, ReponseGemini, client_gemini
+from document import DocumentPDF, ouvrir_document
+from metadonnees import (
+    detecter_metadonnees, detecter_niveau, detecter_dosage, detecter_dimensions, detecter_epaisseur
 )
+
+
 logger = logging.getLogger(__name__)
 
 
+def configurer_logs():
+    """Logs console + fichier btp_extractor.log (utilisation en ligne de commande)"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(),
+            logging.FileHandler('btp_extractor.log', encoding='utf-8')
+        ]
+    )
+
+
 # ============================================================================
 # CATÉGORIES BTP
 # ============================================================================
@@ -179,7 +212,8 @@ class ElementBTP:
     epaisseur: Optional[str]             # Épaisseur (ex: "15 cm")
 
     def to_dict(self) -> Dict:
-        return asdict(self)
+        # Copie superficielle: les champs sont plats, asdict() est inutilement coûteux
+        return dict(vars(self))
 
 
 @dataclass
@@ -191,29 +225,174 @@ class ResultatExtraction:
     mode_extraction: str                  # 'pdfplumber' ou 'gemini'
     nb_pages: int
     nb_elements: int
-    elements: List[Dict]
+    elements: Iterable[Dict]              # Liste, ou ElementsSurDisque au-delà de DEBORDEMENT_ELEMENTS
     resume_categories: Dict[str, Dict]    # Agrégation par catégorie
     resume_lots: Dict[str, Dict]          # Agrégation par lot
     resume_niveaux: Dict[str, Dict]       # Agrégation par niveau
     total_general: float
     devise: str
     erreurs: List[str]
+    memoire_pic_mo: Optional[float] = None   # Hausse maximale de la mémoire pendant l'extraction (Mo)
+
+    def to_dict(self) -> Dict:
+        return dict(vars(self))
+
+    def resume(self) -> Dict:
+        """Champs hors éléments"""
+        resume = self.to_dict()
+        del resume['elements']
+        return resume
+
+    def iter_json(self, indent: bool = False) -> Iterator[bytes]:
+        """JSON de to_dict() par morceaux, les éléments lus au fil de l'eau"""
+        return iter_json(self.resume(), 'elements', self.elements, indent=indent)
+
+
+@dataclass
+class ConfiancePage:
+    """Qualité de l'extraction locale d'une page (mode hybride)"""
+    page: int                             # Numéro de page (à partir de 1)
+    lignes: int                           # Lignes candidates (lignes de tableau, lignes numérotées)
+    elements: int                         # Éléments extraits
+    colonnes: float                       # Part des 6 colonnes attendues reconnues (en-tête)
+    couverture: float                     # Part des éléments avec quantité et prix total
+    coherence: float                      # Part des éléments où quantité × P.U ≈ total
+    contenu: str = ''                     # Tri de la page (TriPage.contenu), '' sans tri
+    moteur: str = ''                      # Moteur de lecture (ContenuPage.moteur), '' si non lue
+
+    @classmethod
+    def evaluer(cls, page: int, lignes: int, colonnes: float, elements: List[ElementBTP],
+                contenu: str = '', moteur: str = '') -> 'ConfiancePage':
+        complets = [e for e in elements if e.quantite and e.prix_total is not None]
+        coherents = [
+            e for e in complets
+            if e.prix_unitaire is not None
+            and abs(e.quantite * e.prix_unitaire - e.prix_total) <= max(1.0, 0.01 * abs(e.prix_total))
+        ]
+        nb = len(elements)
+        return cls(page, lignes, nb, colonnes,
+                   len(complets) / nb if nb else 0.0, len(coherents) / nb if nb else 0.0,
+                   contenu, moteur)
+
+    @property
+    def score(self) -> float:
+        """Entre 0 et 1; une page sans ligne candidate (garde, sommaire) n'a rien à reprendre"""
+        if not self.lignes:
+            return 1.0
+        rendement = min(1.0, self.elements / self.lignes)
+        return rendement * (0.2 * self.colonnes + 0.4 * self.couverture + 0.4 * self.coherence)
+
+
+@dataclass
+class TranchePages:
+    """Éléments d'une tranche de pages extraite dans un worker, avant fusion"""
+    elements: List[ElementBTP]
+    erreurs: List[str]
+    nb_sans_lot: int                      # Éléments précédant le premier titre de lot
+    lot_vu: bool                          # Un titre de lot figure dans la tranche
+    lot_final: Tuple[Optional[str], Optional[str]]  # Lot courant en fin de tranche
+    confiances: List[ConfiancePage] = field(default_factory=list)
+    memoire_pic_mo: Optional[float] = None   # Hausse maximale de la mémoire du worker pendant la tranche
+
+
+class ResumesExtraction:
+    """Résumés par catégorie, lot et niveau, cumulés élément par élément"""
+
+    def __init__(self):
+        self.categories: Dict[str, Dict] = {}
+        self.lots: Dict[str, Dict] = {}
+        self.niveaux: Dict[str, Dict] = {}
+        self.nb_elements = 0
+        self.total_general = 0
+
+    def ajouter(self, element: Dict):
+        total = element.get('prix_total') or 0
+        self.nb_elements += 1
+        self.total_general += total
+
+        for resume, cle in ((self.categories, element.get('categorie')),
+                            (self.niveaux, element.get('niveau'))):
+            entree = resume.setdefault(cle or 'Non défini', {'nombre': 0, 'total': 0})
+            entree['nombre'] += 1
+            entree['total'] += total
+
+        lot = element.get('lot_numero') or 'Non défini'
+        if lot not in self.lots:
+            self.lots[lot] = {'nom': element.get('lot_nom'), 'nombre': 0, 'total': 0}
+        self.lots[lot]['nombre'] += 1
+        self.lots[lot]['total'] += total
 
     def to_dict(self) -> Dict:
-        return asdict(self)
+        return {
+            'nb_elements': self.nb_elements,
+            'resume_categories': self.categories,
+            'resume_lots': self.lots,
+            'resume_niveaux': self.niveaux,
+            'total_general': self.total_general,
+        }
 
 
 # ============================================================================
 # UTILITAIRES
 # ============================================================================
 
-def calculer_hash_fichier(filepath: str) -> str:
-    """Calcule le hash SHA256 du fichier pour traçabilité"""
-    sha256_hash = hashlib.sha256()
-    with open(filepath, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()[:16]
+def calculer_hash_fichier(source: Union[str, DocumentPDF]) -> str:
+    """Hash SHA256 du fichier pour traçabilité (calculé une fois par document)"""
+    return ouvrir_document(source).empreinte[:16]
+
+
+def dumps_json(obj: Any, indent: bool = False) -> bytes:
+    """
+    Sérialise en bytes UTF-8 avec orjson si disponible,
+    sinon avec json de la stdlib (rendu équivalent)
+    """
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads_json(donnees: bytes) -> Any:
+    """Désérialise du JSON (orjson si disponible)"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(donnees)
+    return json.loads(donnees)
+
+
+def iter_json(champs: Dict, cle: str, valeurs: Iterable, indent: bool = False,
+              taille_bloc: int = 500) -> Iterator[bytes]:
+    """
+    Sérialise {**champs, cle: [valeurs]} par morceaux: la liste est lue au
+    fil de l'itérable (éléments sur disque) sans être construite en mémoire.
+    """
+    entete = dumps_json(champs, indent=indent).rstrip()[:-1].rstrip()
+    virgule = b',' if champs else b''
+    if indent:
+        # Éléments indentés au niveau de la liste, comme dumps_json(indent=True)
+        yield entete + virgule + b'\n  ' + dumps_json(cle) + b': ['
+        separateur, fin = b'\n    ', b'\n  ]\n}'
+    else:
+        yield entete + virgule + dumps_json(cle) + b':['
+        separateur, fin = b'', b']}'
+    morceaux: List[bytes] = []
+    premier = True
+    for valeur in valeurs:
+        donnees = dumps_json(valeur, indent=indent)
+        if indent:
+            donnees = donnees.replace(b'\n', b'\n    ')
+        morceaux.append((b'' if premier else b',') + separateur + donnees)
+        premier = False
+        if len(morceaux) == taille_bloc:
+            yield b''.join(morceaux)
+            morceaux = []
+    if morceaux:
+        yield b''.join(morceaux)
+    yield b']\n}' if premier and indent else fin
 
 
 def parser_montant_fcfa(valeur: str) -> Optional[float]:
@@ -251,91 +430,81 @@ def parser_montant_fcfa(valeur: str) -> Optional[float]:
         return None
 
 
-def detecter_niveau(texte: str) -> Optional[str]:
-    """Détecte le niveau du bâtiment dans un texte"""
-    texte_lower = texte.lower()
-
-    patterns = [
-        (r'sous[- ]?sol|ss\b|niveau -1', 'Sous-sol'),
-        (r'rdc|rez[- ]?de[- ]?chauss[ée]e|niveau 0', 'RDC'),
-        (r'r\+1|1er étage|niveau 1|étage 1', 'R+1'),
-        (r'r\+2|2[èe]me étage|niveau 2|étage 2', 'R+2'),
-        (r'r\+3|3[èe]me étage|niveau 3|étage 3', 'R+3'),
-        (r'toiture|terrasse|couverture', 'Toiture'),
-    ]
-
-    for pattern, niveau in patterns:
-        if re.search(pattern, texte_lower):
-            return niveau
-
-    return None
-
-
-def detecter_dosage(texte: str) -> Optional[str]:
-    """Détecte le dosage béton dans un texte"""
-    patterns = [
-        r'(\d{3})\s*kg\s*/?\s*m[³3]',  # "350 kg/m³"
-        r'dosage\s*:?\s*(\d{3})',       # "dosage: 350"
-        r'dos[ée]\s*[àa]\s*(\d{3})',    # "dosé à 350"
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, texte, re.IGNORECASE)
-        if match:
-            return f"{match.group(1)} kg/m³"
-
-    return None
-
-
-def detecter_dimensions(texte: str) -> Optional[str]:
-    """Détecte les dimensions dans un texte"""
-    patterns = [
-        r'(\d+)\s*[xX×]\s*(\d+)\s*[xX×]\s*(\d+)',  # "20x20x40"
-        r'(\d+)\s*[xX×]\s*(\d+)',                    # "20x20"
-        r'[ØøD]\s*(\d+)',                            # "Ø12" ou "D12"
-        r'(\d+)\s*mm',                               # "12 mm"
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, texte)
-        if match:
-            return match.group(0)
-
-    return None
-
-
-def detecter_epaisseur(texte: str) -> Optional[str]:
-    """Détecte l'épaisseur dans un texte"""
-    patterns = [
-        r'[ée]p(?:aisseur)?\.?\s*:?\s*(\d+)\s*(?:cm|mm)',
-        r'(\d+)\s*cm\s*d[\'']?[ée]paisseur',
-        r'e\s*=\s*(\d+)\s*(?:cm|mm)',
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, texte, re.IGNORECASE)
-        if match:
-            return match.group(0)
-
-    return None
-
+class MoteurCategories:
+    """
+    Mots-clés de KEYWORDS_CATEGORIES compilés en une seule expression.
+
+    Le score d'une catégorie est le nombre de ses mots-clés présents dans
+    la désignation, y compris à l'intérieur d'un mot ou d'un autre mot-clé
+    ('alu' dans 'aluminium'). Un seul parcours suffit: l'expression (un
+    arbre de préfixes, sans retour arrière entre mots-clés) donne, à chaque
+    position, le plus long mot-clé qui y commence; les mots-clés présents
+    sont exactement ceux contenus dans l'un de ces mots-clés (table
+    précalculée).
+    """
 
+    def __init__(self, keywords_categories: Dict[CategorieBTP, List[str]]):
+        self.categories = list(keywords_categories)
+        mots = sorted({kw for kws in keywords_categories.values() for kw in kws})
+        self.expression = re.compile('(?=(' + self._arbre_prefixes(mots) + '))')
+        self.inclus = {mot: frozenset(m for m in mots if m in mot) for mot in mots}
+        self.categories_mot = {
+            mot: [i for i, kws in enumerate(keywords_categories.values()) if mot in kws]
+            for mot in mots
+        }
+
+    @staticmethod
+    def _arbre_prefixes(mots: List[str]) -> str:
+        """Alternative factorisée par préfixes communs, la plus longue tentée d'abord"""
+        arbre: Dict[str, dict] = {}
+        for mot in mots:
+            noeud = arbre
+            for car in mot:
+                noeud = noeud.setdefault(car, {})
+            noeud[''] = {}
+
+        def motif(noeud: Dict[str, dict]) -> str:
+            suites = [re.escape(car) + motif(suite) for car, suite in sorted(noeud.items()) if car]
+            if not suites:
+                return ''
+            corps = suites[0] if len(suites) == 1 else '(?:' + '|'.join(suites) + ')'
+            return f'(?:{corps})?' if '' in noeud else corps
+
+        return motif(arbre)
+
+    def meilleure(self, designation_lower: str) -> CategorieBTP:
+        """Catégorie au plus grand score, la première dans l'ordre en cas d'égalité"""
+        presents = set()
+        for mot in self.expression.findall(designation_lower):
+            presents |= self.inclus[mot]
+        if not presents:
+            return CategorieBTP.DIVERS
+        scores = [0] * len(self.categories)
+        for mot in presents:
+            for i in self.categories_mot[mot]:
+                scores[i] += 1
+        meilleur_score = max(scores)
+        return self.categories[scores.index(meilleur_score)]
+
+
+@lru_cache(maxsize=1)
+def moteur_categories() -> MoteurCategories:
+    """Moteur compilé à la première catégorisation (hors du temps d'import)"""
+    return MoteurCategories(KEYWORDS_CATEGORIES)
+
+
+@lru_cache(maxsize=8192)
 def categoriser_element(designation: str) -> Tuple[str, Optional[str]]:
     """
     Catégorise automatiquement un élément BTP selon sa désignation
     Retourne (catégorie, sous_catégorie)
+
+    Mémorisé: les mêmes désignations reviennent d'un lot à l'autre.
     """
     designation_lower = designation.lower()
 
     # Chercher la meilleure correspondance
-    meilleur_score = 0
-    meilleure_categorie = CategorieBTP.DIVERS
-
-    for categorie, keywords in KEYWORDS_CATEGORIES.items():
-        score = sum(1 for kw in keywords if kw in designation_lower)
-        if score > meilleur_score:
-            meilleur_score = score
-            meilleure_categorie = categorie
+    meilleure_categorie = moteur_categories().meilleure(designation_lower)
 
     # Sous-catégorie basée sur des mots-clés spécifiques
     sous_categorie = None
@@ -360,68 +529,890 @@ def categoriser_element(designation: str) -> Tuple[str, Optional[str]]:
 # EXTRACTEUR PDFPLUMBER (LOCAL)
 # ============================================================================
 
+# ============================================================================
+# EXTRACTION PARALLÈLE PAR PAGES
+# ============================================================================
+# extract_tables() traite quelques pages par seconde: les gros DQE sont
+# découpés en tranches de pages contiguës, extraites par un pool de processus
+# (chaque worker ouvre le PDF), puis fusionnées dans l'ordre en propageant le
+# lot courant d'une tranche à la suivante. Les workers sont lancés en
+# « spawn »: le pool est créé au premier gros document, depuis un thread de
+# l'API alors que d'autres tournent (client Gemini...), et un fork copierait
+# leurs verrous dans l'état où il les trouve.
+
+PROCESSUS_PAGES = int(os.getenv('BTP_PAGE_WORKERS', os.cpu_count() or 1))
+PAGES_MIN_TRANCHE = 4   # En dessous, l'ouverture du PDF par worker ne vaut pas le coût
+
+_pools_pages: Dict[int, ProcessPoolExecutor] = {}
+
+
+def _pool_pages(nb_processus: int) -> ProcessPoolExecutor:
+    """Pool de processus partagé (par taille), créé au premier usage"""
+    if nb_processus not in _pools_pages:
+        _pools_pages[nb_processus] = ProcessPoolExecutor(
+            max_workers=nb_processus, initializer=prechauffer,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _pools_pages[nb_processus]
+
+
+def arreter_pools():
+    """Arrête les pools d'extraction (arrêt de l'API)"""
+    for pool in _pools_pages.values():
+        pool.shutdown(wait=False, cancel_futures=True)
+    _pools_pages.clear()
+
+
+def decouper_pages(nb_pages: int, nb_processus: int) -> List[Tuple[int, int]]:
+    """
+    Tranches [début, fin) de pages contiguës: deux par processus pour
+    équilibrer la charge, d'au moins PAGES_MIN_TRANCHE pages.
+    """
+    nb_tranches = min(nb_processus * 2, -(-nb_pages // PAGES_MIN_TRANCHE))
+    if nb_processus <= 1 or nb_tranches <= 1:
+        return [(0, nb_pages)]
+    taille, reste = divmod(nb_pages, nb_tranches)
+    tranches, debut = [], 0
+    for i in range(nb_tranches):
+        fin = debut + taille + (1 if i < reste else 0)
+        tranches.append((debut, fin))
+        debut = fin
+    return tranches
+
+
+def _extraire_tranche(filepath: str, debut: int, fin: int) -> TranchePages:
+    """
+    Extrait les pages [debut, fin) dans un worker, sans contexte de lot
+    initial. Le PDF est mappé: les workers partagent les pages du fichier
+    en mémoire au lieu de le lire chacun.
+    """
+    import pdfplumber
+
+    with DocumentPDF.depuis_chemin(filepath) as document:
+        extracteur = ExtracteurPDFPlumber(document, nb_processus=1)
+        extracteur.memoire.demarrer()
+        try:
+            tris = trier_pages(document, debut, fin)
+            with pdfplumber.open(document.flux(), pages=list(range(debut + 1, fin + 1))) as pdf:
+                extracteur._traiter_pages(pdf.pages, debut, tris)
+        finally:
+            extracteur.memoire.terminer()
+    premier_lot = extracteur.premier_lot
+    return TranchePages(
+        elements=extracteur.elements,
+        erreurs=extracteur.erreurs,
+        nb_sans_lot=len(extracteur.elements) if premier_lot is None else premier_lot,
+        lot_vu=premier_lot is not None,
+        lot_final=(extracteur.lot_courant, extracteur.lot_nom_courant),
+        confiances=extracteur.confiances,
+        memoire_pic_mo=extracteur.memoire.pic_mo
+    )
+
+
+# ============================================================================
+# MÉMOIRE BORNÉE
+# ============================================================================
+# pdfminer garde en cache les objets du PDF déjà lus tant que le document
+# est ouvert, et chaque page de pdfplumber ses caractères et objets jusqu'à
+# page.close(): en mode séquentiel, le PDF est rouvert toutes les
+# FENETRE_PAGES pages. extraire() range les éléments dans un fichier
+# temporaire au-delà de DEBORDEMENT_ELEMENTS: le résultat les relit au fil de
+# sa sérialisation, sans jamais tous les garder en mémoire (le mode hybride
+# y range de même l'extraction locale, relue page par page).
+# La mémoire du processus (RSS) est relevée après chaque page et comparée à
+# celle du début de l'extraction: la RSS ne redescend pas après un gros
+# document, seule la hausse depuis le début est attribuée à celle-ci. Sa
+# valeur maximale figure dans le résultat. Au-delà de MEMOIRE_MAX_MO,
+# l'extraction s'arrête (MemoireDepassee) au lieu d'épuiser le worker de
+# l'API, mais seulement si elle a été seule dans le processus depuis son
+# début: sinon la hausse compte aussi les extractions simultanées (threads
+# de l'API), et un petit document serait refusé à leur place.
+
+FENETRE_PAGES = int(os.getenv('BTP_FENETRE_PAGES', 50))              # 0 = document ouvert une fois
+DEBORDEMENT_ELEMENTS = int(os.getenv('BTP_DEBORDEMENT_ELEMENTS', 20000))   # 0 = jamais sur disque
+MEMOIRE_MAX_MO = float(os.getenv('BTP_MEMOIRE_MAX_MO', 0))           # 0 = sans limite
+
+
+class MemoireDepassee(MemoryError):
+    """Budget mémoire (BTP_MEMOIRE_MAX_MO) dépassé pendant une extraction"""
+
+
+def memoire_processus_mo() -> Optional[float]:
+    """Mémoire résidente du processus en Mo (None si elle n'est pas mesurable)"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource   # Hors Linux: pic du processus (Ko), faute de valeur courante
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except (ImportError, OSError):
+        return None
+
+
+class SuiviMemoire:
+    """Hausse de la mémoire du processus depuis le début d'une extraction, avec budget"""
+
+    # Extractions suivies en cours dans le processus, et numéro de la
+    # dernière démarrée: une extraction est seule tant qu'aucune autre n'a
+    # démarré après elle et qu'aucune ne tournait à son début
+    _verrou = threading.Lock()
+    _actives = 0
+    _demarrees = 0
+
+    def __init__(self, budget_mo: float = MEMOIRE_MAX_MO):
+        self.budget_mo = budget_mo
+        self.pic_mo: Optional[float] = None
+        self._numero: Optional[int] = None
+        self._seule = False
+        self.base_mo = memoire_processus_mo()
+
+    def demarrer(self):
+        """Mémoire de référence: début de l'extraction (ou de la tranche), à clore par terminer()"""
+        cls = SuiviMemoire
+        with cls._verrou:
+            if self._numero is None:
+                cls._actives += 1
+            cls._demarrees += 1
+            self._numero = cls._demarrees
+            self._seule = cls._actives == 1
+        self.base_mo = memoire_processus_mo()
+
+    def terminer(self):
+        """Fin de l'extraction: elle ne compte plus parmi celles du processus"""
+        cls = SuiviMemoire
+        with cls._verrou:
+            if self._numero is not None:
+                cls._actives -= 1
+                self._numero = None
+
+    def seule(self) -> bool:
+        """Aucune autre extraction dans le processus depuis demarrer()"""
+        return self._seule and self._numero == SuiviMemoire._demarrees
+
+    def relever(self, contexte: str = ''):
+        """Relève la hausse depuis demarrer(); MemoireDepassee au-delà du budget"""
+        mo = memoire_processus_mo()
+        if mo is None or self.base_mo is None:
+            return
+        hausse = max(0.0, mo - self.base_mo)
+        self.pic_mo = hausse if self.pic_mo is None else max(self.pic_mo, hausse)
+        if self.budget_mo and hausse > self.budget_mo and self.seule():
+            raise MemoireDepassee(
+                f"Budget mémoire dépassé (+{hausse:.0f} Mo > {self.budget_mo:.0f} Mo)"
+                f"{' ' + contexte if contexte else ''}"
+            )
+
+
+def arrondir_mo(mo: Optional[float]) -> Optional[float]:
+    """Pic de mémoire tel que publié dans le résultat (Mo, une décimale)"""
+    return None if mo is None else round(mo, 1)
+
+
+class ElementsSurDisque:
+    """
+    Éléments rangés dans un fichier temporaire, un bloc par ligne et par
+    colonnes ({champ: [valeurs]}): les noms de champs ne sont écrits qu'une
+    fois par bloc. Relus dans l'ordre d'écriture, ou bloc par bloc; chaque
+    lecture a sa propre position (un résultat partagé par plusieurs
+    requêtes est sérialisé par chacune).
+    """
+
+    def __init__(self):
+        self._fichier = tempfile.TemporaryFile()
+        self._blocs: List[Tuple[int, int]] = []   # (position, taille) de chaque bloc, vide compris
+        self._taille = 0
+        self.nb = 0
+
+    def ajouter(self, bloc: List[Dict]):
+        ligne = b''
+        if bloc:
+            colonnes = {champ: [e[champ] for e in bloc] for champ in bloc[0]}
+            ligne = dumps_json(colonnes) + b'\n'
+            self._fichier.write(ligne)
+            self._fichier.flush()
+        self._blocs.append((self._taille, len(ligne)))
+        self._taille += len(ligne)
+        self.nb += len(bloc)
+
+    @staticmethod
+    def _decoder(ligne: bytes) -> List[Dict]:
+        colonnes = loads_json(ligne)
+        return [dict(zip(colonnes, valeurs)) for valeurs in zip(*colonnes.values())]
+
+    def bloc(self, indice: int) -> List[Dict]:
+        """Éléments du bloc `indice` (ordre d'ajout)"""
+        position, taille = self._blocs[indice]
+        return self._decoder(os.pread(self._fichier.fileno(), taille, position)) if taille else []
+
+    @property
+    def nb_blocs(self) -> int:
+        return len(self._blocs)
+
+    def __iter__(self) -> Iterator[Dict]:
+        for indice in range(len(self._blocs)):
+            yield from self.bloc(indice)
+
+    def __len__(self) -> int:
+        return self.nb
+
+    def fermer(self):
+        self._fichier.close()
+
+
+def collecter_elements(blocs: Iterator[List[Dict]]) -> Union[List[Dict], ElementsSurDisque]:
+    """
+    Éléments de tous les blocs. Au-delà de DEBORDEMENT_ELEMENTS, ils sont
+    rangés sur disque et y restent: le résultat est alors un
+    ElementsSurDisque, relu au fil de sa sérialisation (réponse de l'API,
+    cache, exports).
+    """
+    elements: List[Dict] = []
+    disque: Optional[ElementsSurDisque] = None
+    try:
+        for bloc in blocs:
+            if disque is None and DEBORDEMENT_ELEMENTS and len(elements) + len(bloc) > DEBORDEMENT_ELEMENTS:
+                disque = ElementsSurDisque()
+                disque.ajouter(elements)
+                elements = []
+            if disque is None:
+                elements.extend(bloc)
+            else:
+                disque.ajouter(bloc)
+    except BaseException:
+        if disque is not None:
+            disque.fermer()
+        raise
+    return elements if disque is None else disque
+
+
+def repartir_pages(elements: Union[List[Dict], ElementsSurDisque],
+                   nb_par_page: List[int]) -> Union[List[List[Dict]], ElementsSurDisque]:
+    """
+    Éléments d'un document découpés par page (nb_par_page[i] éléments pour
+    la page i), accessibles par page: listes en mémoire, ou un bloc par page
+    sur disque si les éléments y sont déjà.
+    """
+    if isinstance(elements, list):
+        pages, position = [], 0
+        for nb in nb_par_page:
+            pages.append(elements[position:position + nb])
+            position += nb
+        return pages
+    pages = ElementsSurDisque()
+    try:
+        lecture = iter(elements)
+        for nb in nb_par_page:
+            pages.ajouter(list(islice(lecture, nb)))
+    except BaseException:
+        pages.fermer()
+        raise
+    return pages
+
+
+# ============================================================================
+# TRI DES PAGES
+# ============================================================================
+
+# pdfplumber analyse toute la page (pdfminer, ~100 ms par page) avant
+# extract_tables() et extract_text(). Un tri préalable avec PDFium (texte
+# et tracés de la page, quelques millisecondes) écarte les pages sans
+# poste (garde, conditions, signatures) sans les analyser, évite
+# extract_tables() sur les listes de postes sans filets et le limite à la
+# zone tracée quand elle n'occupe qu'une partie de la page (recadrer coûte
+# plus qu'il ne rapporte sur un tableau pleine page).
+TRIAGE_PAGES = os.getenv('BTP_TRIAGE_PAGES', '1') != '0'
+FILETS_MIN = 2                   # Filets horizontaux et verticaux d'un tableau tracé
+EPAISSEUR_FILET = 3.0            # Points: au-delà, un tracé compte comme un cadre (2 + 2 filets)
+MARGE_ZONE = 2.0                 # Points autour de la zone tracée
+PART_ZONE_MAX = 0.6              # Recadrage si la zone tracée couvre au plus cette part de la page
+LIGNES_NUMEROTEES_MIN = 3        # Lignes commençant par un chiffre: liste de postes
+DENSITE_CHIFFRES_MIN = 0.15      # Part des caractères visibles: liste de postes (montants)
+# Tableaux tracés uniquement (stratégie par défaut, explicitée): la zone
+# recadrée contient alors toutes les cellules
+REGLAGES_TABLEAUX = {'vertical_strategy': 'lines', 'horizontal_strategy': 'lines'}
+
+
+@dataclass
+class TriPage:
+    """Contenu d'une page estimé avant extraction"""
+    contenu: str                                   # 'tableau', 'liste', 'ignoree' ou 'vide'
+    zone: Optional[Tuple[float, float, float, float]] = None   # Zone tracée (x0, top, x1, bottom)
+    lecture: Optional['ContenuPage'] = None        # Page déjà lue par PDFium (voir MOTEUR_PDF)
+
+
+def trier_pages(source: Union[str, DocumentPDF], debut: int = 0,
+                fin: Optional[int] = None) -> Optional[List[TriPage]]:
+    """
+    Tri des pages [debut, fin[ avec pypdfium2; None si le tri est désactivé
+    (BTP_TRIAGE_PAGES=0), pypdfium2 absent ou le PDF illisible par PDFium:
+    toutes les pages sont alors extraites comme avant.
+    """
+    if not (TRIAGE_PAGES and PYPDFIUM2_AVAILABLE):
+        return None
+    import pypdfium2 as pdfium
+    import pypdfium2.raw as pdfium_c
+
+    with mesurer_phase('pdfplumber', 'tri'):
+        with _verrou_pdfium:
+            try:
+                document = pdfium.PdfDocument(ouvrir_document(source).tableau())
+            except pdfium.PdfiumError as e:
+                logger.warning(f"⚠️ Tri des pages impossible: {e}")
+                return None
+        try:
+            tris = []
+            for i in range(debut, len(document) if fin is None else fin):
+                with _verrou_pdfium:
+                    page = document[i]
+                    try:
+                        tris.append(_trier_page(page, pdfium_c))
+                    finally:
+                        page.close()
+            return tris
+        finally:
+            with _verrou_pdfium:
+                document.close()
+
+
+def _trier_page(page, pdfium_c) -> TriPage:
+    textpage = page.get_textpage()
+    try:
+        texte = textpage.get_text_range()
+        visibles = len(texte) - sum(texte.count(c) for c in ' \r\n\t')
+        if visibles <= 0:
+            return TriPage('vide')
+
+        # Filets: (position, début, fin) en coordonnées PDFium; un tracé
+        # épais compte comme un cadre (deux filets de chaque sens)
+        horizontaux, verticaux = [], []
+        zone = None
+        for objet in page.get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_PATH]):
+            gauche, bas, droite, haut = objet.get_bounds()
+            if haut - bas <= EPAISSEUR_FILET:
+                horizontaux.append(((haut + bas) / 2, gauche, droite))
+            elif droite - gauche <= EPAISSEUR_FILET:
+                verticaux.append(((gauche + droite) / 2, bas, haut))
+            else:
+                horizontaux += [(bas, gauche, droite), (haut, gauche, droite)]
+                verticaux += [(gauche, bas, haut), (droite, bas, haut)]
+            zone = (gauche, bas, droite, haut) if zone is None else (
+                min(zone[0], gauche), min(zone[1], bas), max(zone[2], droite), max(zone[3], haut)
+            )
+
+        if len(horizontaux) >= FILETS_MIN and len(verticaux) >= FILETS_MIN:
+            # Coordonnées PDFium (origine en bas à gauche) vers pdfplumber;
+            # pas de recadrage si la page est tournée ou décalée
+            largeur, hauteur = page.get_size()
+            gauche, bas, droite, haut = zone
+            if (page.get_rotation() or tuple(page.get_mediabox()[:2]) != (0, 0)
+                    or (droite - gauche) * (haut - bas) > PART_ZONE_MAX * largeur * hauteur):
+                tri = TriPage('tableau')
+            else:
+                tri = TriPage('tableau', (
+                    max(0.0, gauche - MARGE_ZONE), max(0.0, hauteur - haut - MARGE_ZONE),
+                    min(largeur, droite + MARGE_ZONE), min(hauteur, hauteur - bas + MARGE_ZONE)
+                ))
+        else:
+            numerotees = sum(1 for ligne in texte.splitlines() if ligne.lstrip()[:1].isdigit())
+            chiffres = sum(texte.count(c) for c in '0123456789')
+            if numerotees < LIGNES_NUMEROTEES_MIN and chiffres < DENSITE_CHIFFRES_MIN * visibles:
+                return TriPage('ignoree')
+            tri = TriPage('liste')
+            horizontaux = verticaux = []
+
+        if MOTEUR_PDF != 'pdfplumber':
+            tri.lecture = lire_page_pdfium(
+                page, textpage, pdfium_c, horizontaux, verticaux, exigeant=MOTEUR_PDF == 'auto'
+            )
+        return tri
+    finally:
+        textpage.close()
+
+
+# ============================================================================
+# MOTEURS DE LECTURE
+# ============================================================================
+
+# Deux moteurs lisent une page en tableaux (lignes de cellules) ou, à
+# défaut, en mots positionnés: pdfplumber, qui détecte tous les tableaux
+# mais analyse la page en Python (pdfminer), et PDFium, qui reconstruit
+# lignes et cellules à partir des positions des mots et des filets déjà
+# lus par le tri, environ dix fois plus vite. En mode 'auto', PDFium lit
+# les listes de postes et les tableaux en grille régulière (filets
+# horizontaux sur toute la largeur, aucun mot à cheval sur un filet
+# vertical, page ni tournée ni décalée); les autres pages sont confiées à
+# pdfplumber.
+MOTEUR_PDF = os.getenv('BTP_MOTEUR_PDF', 'auto')   # 'auto', 'pdfplumber' ou 'pdfium'
+TOLERANCE_MOTS = 3.0             # Points: écart entre caractères d'un mot, lignes d'un même rang
+
+
+@dataclass
+class ContenuPage:
+    """Page lue par un moteur: tableaux (lignes de cellules), ou mots à défaut"""
+    tables: List[List[List[Optional[str]]]] = field(default_factory=list)
+    mots: List[list] = field(default_factory=list)   # [gauche, bas, droite, haut, texte]
+    moteur: str = 'pdfplumber'
+
+
+def lire_page_pdfplumber(page, tri: Optional[TriPage] = None) -> ContenuPage:
+    """Tableaux tracés de la page (dans la zone du tri), mots à défaut"""
+    tables = []
+    if not tri or tri.contenu != 'liste':
+        tables = ExtracteurPDFPlumber._zone_tracee(page, tri).extract_tables(REGLAGES_TABLEAUX)
+    if tables:
+        return ContenuPage(tables=tables)
+    # Mots dans le repère de PDFium (ordonnées croissantes vers le haut)
+    return ContenuPage(mots=[
+        [mot['x0'], -mot['bottom'], mot['x1'], -mot['top'], mot['text']] for mot in page.extract_words()
+    ])
+
+
+def lire_page_pdfium(page, textpage, pdfium_c, horizontaux: List[Tuple[float, float, float]],
+                     verticaux: List[Tuple[float, float, float]], exigeant: bool = True
+                     ) -> Optional[ContenuPage]:
+    """
+    Lit une page PDFium ouverte par le tri. horizontaux et verticaux:
+    filets (position, début, fin). Avec `exigeant`, None si la mise en page
+    n'est pas une grille simple: la page est alors lue par pdfplumber.
+    """
+    if exigeant and (page.get_rotation() or tuple(page.get_mediabox()[:2]) != (0, 0)):
+        return None
+    mots = _mots_pdfium(textpage, pdfium_c)
+    if horizontaux and verticaux:
+        tables = _tables_grille(mots, horizontaux, verticaux, exigeant)
+        if tables is None:
+            return None
+        if tables:
+            return ContenuPage(tables=tables, moteur='pdfium')
+    return ContenuPage(mots=mots, moteur='pdfium')
+
+
+def _mots_pdfium(textpage, pdfium_c) -> List[list]:
+    """Mots [gauche, bas, droite, haut, texte] dans l'ordre du flux de la page"""
+    nb = textpage.count_chars()
+    texte = textpage.get_text_range(0, nb)
+    if len(texte) != nb:   # Caractères hors plan de base: un appel par caractère
+        texte = ''.join(chr(pdfium_c.FPDFText_GetUnicode(textpage.raw, i)) for i in range(nb))
+    mots, mot = [], None
+    for i, caractere in enumerate(texte):
+        if caractere.isspace():
+            mot = None
+            continue
+        gauche, bas, droite, haut = textpage.get_charbox(i, loose=True)
+        if (mot is None or gauche - mot[2] > TOLERANCE_MOTS or gauche < mot[0]
+                or abs(haut - mot[3]) > TOLERANCE_MOTS):
+            mot = [gauche, bas, droite, haut, caractere]
+            mots.append(mot)
+        else:
+            mot[2] = max(mot[2], droite)
+            mot[1] = min(mot[1], bas)
+            mot[4] += caractere
+    return mots
+
+
+def _lignes_mots(mots: List[list]) -> List[List[list]]:
+    """Mots regroupés en lignes (de haut en bas), chaque ligne de gauche à droite"""
+    lignes = []
+    precedent = None
+    for mot in sorted(mots, key=lambda m: -m[3]):
+        if precedent is not None and precedent - mot[3] <= TOLERANCE_MOTS:
+            lignes[-1].append(mot)
+        else:
+            lignes.append([mot])
+        precedent = mot[3]
+    return [sorted(ligne, key=lambda m: m[0]) for ligne in lignes]
+
+
+def _texte_mots(mots: List[list]) -> str:
+    """Texte des mots, ligne par ligne (comme extract_text() de pdfplumber)"""
+    return '\n'.join(' '.join(m[4] for m in ligne) for ligne in _lignes_mots(mots))
+
+
+def _positions(valeurs: List[float]) -> List[float]:
+    """Positions distinctes croissantes (valeurs proches de moins de TOLERANCE_MOTS confondues)"""
+    positions = []
+    for valeur in sorted(valeurs):
+        if not positions or valeur - positions[-1] > TOLERANCE_MOTS:
+            positions.append(valeur)
+    return positions
+
+
+def _tables_grille(mots: List[list], horizontaux: List[Tuple[float, float, float]],
+                   verticaux: List[Tuple[float, float, float]], exigeant: bool
+                   ) -> Optional[List[List[List[Optional[str]]]]]:
+    """
+    Tableaux d'une page tracée: un rang entre deux filets horizontaux
+    consécutifs, une cellule entre deux filets verticaux qui traversent le
+    rang (cellule fusionnée: None pour les colonnes couvertes, comme
+    pdfplumber). Rangs consécutifs tracés = un tableau. None si `exigeant`
+    et que la grille n'est pas régulière.
+    """
+    tolerance = TOLERANCE_MOTS
+    xs = _positions([x for x, _, _ in verticaux])
+    ys = _positions([y for y, _, _ in horizontaux])[::-1]   # De haut en bas
+    if exigeant and any(debut > xs[0] + tolerance or fin < xs[-1] - tolerance
+                        for _, debut, fin in horizontaux):
+        return None
+
+    # Bords de chaque rang: index des filets verticaux qui le traversent
+    bords_rangs = []
+    for haut, bas in zip(ys, ys[1:]):
+        bords = sorted({
+            bisect.bisect_left(xs, x - tolerance) for x, debut, fin in verticaux
+            if debut <= bas + tolerance and fin >= haut - tolerance
+        })
+        bords_rangs.append(bords if len(bords) >= 2 else [])
+
+    # Mots rangés par cellule (rang, bord gauche)
+    cellules: Dict[Tuple[int, int], List[list]] = {}
+    ys_montants = [-y for y in ys]
+    for mot in mots:
+        rang = bisect.bisect_left(ys_montants, -(mot[1] + mot[3]) / 2) - 1
+        if rang < 0 or rang >= len(bords_rangs) or not bords_rangs[rang]:
+            continue   # Hors des tableaux
+        bords = bords_rangs[rang]
+        abscisses = [xs[b] for b in bords]
+        colonne = bisect.bisect_right(abscisses, (mot[0] + mot[2]) / 2) - 1
+        if colonne < 0 or colonne >= len(bords) - 1:
+            continue
+        if exigeant and (mot[0] < abscisses[colonne] - tolerance
+                         or mot[2] > abscisses[colonne + 1] + tolerance):
+            return None   # Mot à cheval sur un filet: pdfplumber tranchera
+        cellules.setdefault((rang, bords[colonne]), []).append(mot)
+
+    # Tableaux: rangs tracés consécutifs, colonnes réduites aux bords utilisés
+    tables, rangs = [], []
+    for rang, bords in enumerate(bords_rangs + [[]]):
+        if bords:
+            rangs.append(rang)
+            continue
+        if rangs:
+            colonnes = sorted({b for r in rangs for b in bords_rangs[r][:-1]})
+            table = []
+            for r in rangs:
+                presents = set(bords_rangs[r][:-1])
+                table.append([
+                    _texte_mots(cellules.get((r, b), [])) if b in presents else None
+                    for b in colonnes
+                ])
+            tables.append(table)
+            rangs = []
+    return tables
+
+
+# ============================================================================
+# RECONSTRUCTION DES LIGNES DE POSTES
+# ============================================================================
+
+# Sans tableau, les postes sont reconstitués à partir de la position des
+# mots: une ligne commence par un numéro de poste, se termine par des
+# montants précédés éventuellement d'une unité; la désignation est entre
+# les deux. L'écart normal entre deux mots est estimé une fois par page:
+# un groupe de trois chiffres plus proche que ECART_CHAMPS fois cet écart
+# prolonge le montant précédent (séparateur de milliers). Si les montants
+# s'alignent en colonnes sur la page (bords droits regroupés), chaque
+# montant va à sa colonne (quantité, P.U, total), ce qui supporte les
+# colonnes vides; sinon ils sont lus de droite à gauche.
+UNITES_POSTES = {'m', 'm²', 'm³', 'm2', 'm3', 'ml', 'l', 'u', 'kg', 'ens', 'ft', 'ff'}
+MOTIF_NUMERO_POSTE = re.compile(r'\d+(?:\.\d+)*')
+MOTIF_NOMBRE = re.compile(r'\d[\d,.]*')
+ECART_CHAMPS = 1.5               # × écart médian entre mots d'une ligne: au-delà, nouveau champ
+TOLERANCE_COLONNES = 8.0         # Points entre bords droits de montants d'une même colonne
+SUPPORT_COLONNE = 0.5            # Part des lignes de postes qui ont un montant dans la colonne
+
+# Titre numéroté en chiffres romains: I à XXXIX en capitales, séparateur
+# puis intitulé commençant par une capitale (« II. MAÇONNERIE »,
+# « IV - Electricité »). Une ligne reconstituée à partir des mots doit en
+# plus être courte et sans montant; la première cellule d'un tableau peut
+# finir par la quantité d'une colonne fusionnée (« II - GROS ŒUVRE 1 »).
+# Écarte la prose qui commence par des lettres romaines (« Il est
+# précisé… », « M. le Maître d'ouvrage », « Civil works », « DI 1 ml »).
+MOTIF_TITRE_ROMAIN = re.compile(r'(?=[IVX])X{0,3}(?:IX|IV|V?I{0,3})\s*[.\-–)]\s*(\w)')
+MOTIF_MONTANT = re.compile(r'(?:\d[\s.,]?){4,}|\d\s*$')   # 4 chiffres et plus, ou nombre en fin de ligne
+LONGUEUR_TITRE_MAX = 80
+
+
+@dataclass
+class LignePoste:
+    """Ligne de poste découpée en champs (montants: [texte, bord droit])"""
+    numero: str
+    designation: List[str]
+    unite: str
+    montants: List[list]
+
+
+def decouper_ligne(ligne: List[list], seuil: float) -> LignePoste:
+    """
+    Découpe une ligne de mots (de gauche à droite, numéro en tête):
+    montants en fin de ligne, unité juste avant, désignation entre le
+    numéro et l'unité. Au-delà de trois montants, les premiers reviennent
+    à la désignation (nombre en fin de libellé).
+    """
+    debut = len(ligne)
+    while debut > 1 and MOTIF_NOMBRE.fullmatch(ligne[debut - 1][4]):
+        debut -= 1
+
+    montants, precedent = [], None
+    for mot in ligne[debut:]:
+        if (montants and len(mot[4]) == 3 and mot[4].isdigit() and mot[0] - precedent[2] <= seuil
+                and montants[-1][0].replace(' ', '').isdigit()):
+            montants[-1][0] += ' ' + mot[4]
+            montants[-1][1] = mot[2]
+        else:
+            montants.append([mot[4], mot[2]])
+        precedent = mot
+
+    unite = ''
+    if debut > 1 and ligne[debut - 1][4].lower() in UNITES_POSTES:
+        unite = ligne[debut - 1][4]
+        debut -= 1
+    designation = [mot[4] for mot in ligne[1:debut]]
+    if len(montants) > 3 and not unite:
+        designation += [texte for texte, _ in montants[:-3]]
+        montants = montants[-3:]
+    return LignePoste(ligne[0][4], designation, unite, montants[-3:])
+
+
+def colonnes_montants(lignes: List[LignePoste]) -> Optional[List[float]]:
+    """
+    Bords droits des colonnes quantité, P.U et total si les montants de la
+    page s'alignent (trois colonnes les plus à droite assez fournies),
+    None sinon.
+    """
+    bords = sorted(droite for ligne in lignes for _, droite in ligne.montants)
+    groupes = []
+    for bord in bords:
+        if groupes and bord - groupes[-1][-1] <= TOLERANCE_COLONNES:
+            groupes[-1].append(bord)
+        else:
+            groupes.append([bord])
+    colonnes = [sum(g) / len(g) for g in groupes if len(g) >= SUPPORT_COLONNE * len(lignes)]
+    return colonnes[-3:] if len(colonnes) >= 3 else None
+
+
+def repartir_montants(ligne: LignePoste, colonnes: Optional[List[float]]
+                      ) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """(quantité, P.U, total): par colonne si la page en a, sinon de droite à gauche"""
+    valeurs: List[Optional[str]] = [None, None, None]
+    if colonnes:
+        for texte, droite in ligne.montants:
+            i = min(range(3), key=lambda c: abs(colonnes[c] - droite))
+            if abs(colonnes[i] - droite) <= TOLERANCE_COLONNES:
+                valeurs[i] = texte
+    elif len(ligne.montants) == 3:
+        valeurs = [texte for texte, _ in ligne.montants]
+    elif len(ligne.montants) == 2:
+        valeurs[0], valeurs[2] = (texte for texte, _ in ligne.montants)   # Quantité et total
+    elif ligne.montants:
+        valeurs[0] = ligne.montants[0][0]
+    return valeurs[0], valeurs[1], valeurs[2]
+
+
 class ExtracteurPDFPlumber:
     """Extraction de données BTP avec pdfplumber (mode local)"""
 
-    def __init__(self, filepath: str):
-        self.filepath = filepath
+    def __init__(self, filepath: Union[str, DocumentPDF], nb_processus: Optional[int] = None):
+        """
+        Args:
+            filepath: Chemin du PDF, ou document déjà ouvert (partagé avec
+                l'appelant: pas de nouvelle lecture)
+        """
+        self.filepath = filepath.nom if isinstance(filepath, DocumentPDF) else filepath
+        self._source = filepath
+        self._document: Optional[DocumentPDF] = None
+        self.nb_processus = PROCESSUS_PAGES if nb_processus is None else nb_processus
         self.elements: List[ElementBTP] = []
         self.erreurs: List[str] = []
         self.lot_courant = None
         self.lot_nom_courant = None
+        self.premier_lot: Optional[int] = None  # Nb d'éléments au premier titre de lot
+        self.confiances: List[ConfiancePage] = []  # Une par page traitée, dans l'ordre
+        self.memoire = SuiviMemoire()
+        self._lignes_page = 0
+        self._colonnes_page = 0.0
+
+    @property
+    def document(self) -> DocumentPDF:
+        """PDF mappé en mémoire, ouvert au premier accès"""
+        if self._document is None:
+            self._document = ouvrir_document(self._source)
+        return self._document
 
     def extraire(self) -> ResultatExtraction:
         """Extrait toutes les données du PDF"""
+        elements = collecter_elements(self.iter_blocs())
+        return ResultatExtraction(elements=elements, **self.resume_final())
+
+    def iter_elements(self) -> Iterator[Dict]:
+        """Éléments extraits au fil des pages (voir iter_blocs)"""
+        for bloc in self.iter_blocs():
+            yield from bloc
+
+    def iter_blocs(self) -> Iterator[List[Dict]]:
+        """
+        Extrait le PDF bloc par bloc: une page, ou une tranche de pages en
+        parallèle. Les éléments ne sont pas conservés: les résumés sont
+        cumulés au passage et resume_final() complète le résultat.
+        """
+        self.memoire.demarrer()
+        try:
+            yield from self._iter_blocs()
+        finally:   # Aussi quand le flux est abandonné (générateur fermé)
+            self.memoire.terminer()
+
+    def _iter_blocs(self) -> Iterator[List[Dict]]:
+        """Corps de iter_blocs(), entre le début et la fin du suivi mémoire"""
         logger.info(f"🔄 Extraction pdfplumber: {self.filepath}")
 
         if not PDFPLUMBER_AVAILABLE:
             raise ImportError("pdfplumber n'est pas installé")
-
-        hash_fichier = calculer_hash_fichier(self.filepath)
-
-        with pdfplumber.open(self.filepath) as pdf:
-            nb_pages = len(pdf.pages)
-            logger.info(f"📄 {nb_pages} pages détectées")
-
-            for i, page in enumerate(pdf.pages):
-                logger.info(f"📖 Traitement page {i+1}/{nb_pages}")
-                self._traiter_page(page, i+1)
-
-        # Calculer les résumés
-        resume_categories = self._calculer_resume_categories()
-        resume_lots = self._calculer_resume_lots()
-        resume_niveaux = self._calculer_resume_niveaux()
-        total_general = sum(e.prix_total or 0 for e in self.elements)
-
-        return ResultatExtraction(
-            fichier=Path(self.filepath).name,
+        import pdfplumber
+
+        debut = time.perf_counter()
+        duree_pages = 0.0  # Hors temps de consommation des blocs
+        self.resumes = ResumesExtraction()
+
+        # PDFium compte les pages sur le tampon sans analyser le document;
+        # pdfplumber à défaut (pypdfium2 absent ou PDF refusé par PDFium)
+        self.nb_pages = compter_pages_pdf(self.document.tableau())
+        if not self.nb_pages:
+            with pdfplumber.open(self.document.flux()) as pdf:
+                self.nb_pages = len(pdf.pages)
+        logger.info(f"📄 {self.nb_pages} pages détectées")
+        tranches = decouper_pages(self.nb_pages, self.nb_processus)
+
+        if len(tranches) == 1:
+            # Fenêtres de pages: le PDF est rouvert pour vider les caches de pdfminer
+            taille = FENETRE_PAGES or self.nb_pages or 1
+            for debut_fenetre in range(0, self.nb_pages, taille):
+                fin_fenetre = min(debut_fenetre + taille, self.nb_pages)
+                tris = trier_pages(self.document, debut_fenetre, fin_fenetre)
+                pages = list(range(debut_fenetre + 1, fin_fenetre + 1))
+                with pdfplumber.open(self.document.flux(), pages=pages) as pdf:
+                    for num_page, page in zip(pages, pdf.pages):
+                        debut_page = time.perf_counter()
+                        logger.info(f"📖 Traitement page {num_page}/{self.nb_pages}")
+                        self._traiter_page(page, num_page, tris[num_page - debut_fenetre - 1] if tris else None)
+                        page.close()
+                        self.memoire.relever(f"page {num_page}")
+                        duree_pages += time.perf_counter() - debut_page
+                        yield self._publier()
+
+        if len(tranches) > 1:
+            logger.info(f"⚡ {len(tranches)} tranches sur {self.nb_processus} processus")
+            pool = _pool_pages(self.nb_processus)
+            chemin = self.document.chemin()   # Écrit sur disque à cette occasion s'il n'est qu'en mémoire
+            futures = [pool.submit(_extraire_tranche, chemin, d, f) for d, f in tranches]
+            try:
+                for future in futures:
+                    debut_tranche = time.perf_counter()
+                    self._fusionner_tranche(future.result())
+                    self.memoire.relever()
+                    duree_pages += time.perf_counter() - debut_tranche
+                    yield self._publier()
+            except BrokenProcessPool:
+                # Worker tué (mémoire...): le pool est inutilisable, il sera recréé
+                _pools_pages.pop(self.nb_processus, None)
+                raise
+            finally:
+                for future in futures:  # Flux abandonné: tranches restantes annulées
+                    future.cancel()
+
+        PHASE_DUREE.labels('pdfplumber', 'pages').observe(duree_pages)
+        for confiance in self.confiances:
+            if confiance.contenu:
+                PAGES_TRIEES.labels(confiance.contenu).inc()
+            if confiance.moteur:
+                PAGES_MOTEUR.labels(confiance.moteur).inc()
+        enregistrer_document('pdfplumber', self.nb_pages, self.resumes.nb_elements,
+                             time.perf_counter() - debut)
+
+    def resume_final(self) -> Dict:
+        """Champs de ResultatExtraction hors éléments, une fois les blocs consommés"""
+        with mesurer_phase('pdfplumber', 'hash'):
+            hash_fichier = calculer_hash_fichier(self.document)
+        return dict(
+            fichier=self.document.nom,
             hash_fichier=hash_fichier,
             date_extraction=datetime.now().isoformat(),
             mode_extraction='pdfplumber',
-            nb_pages=nb_pages,
-            nb_elements=len(self.elements),
-            elements=[e.to_dict() for e in self.elements],
-            resume_categories=resume_categories,
-            resume_lots=resume_lots,
-            resume_niveaux=resume_niveaux,
-            total_general=total_general,
+            nb_pages=self.nb_pages,
             devise='FCFA',
-            erreurs=self.erreurs
+            erreurs=self.erreurs,
+            memoire_pic_mo=arrondir_mo(self.memoire.pic_mo),
+            **self.resumes.to_dict()
         )
 
-    def _traiter_page(self, page, num_page: int):
-        """Traite une page du PDF"""
-        # Extraire les tableaux
-        tables = page.extract_tables()
+    def _publier(self) -> List[Dict]:
+        """Éléments produits depuis le dernier bloc, cumulés dans les résumés puis oubliés"""
+        bloc = [e.to_dict() for e in self.elements]
+        self.elements = []
+        for element in bloc:
+            self.resumes.ajouter(element)
+        return bloc
+
+    def _traiter_pages(self, pages, premier: int, tris: Optional[List[TriPage]] = None):
+        """Traite des pages consécutives (premier: index de la première dans le PDF)"""
+        for i, page in enumerate(pages, start=premier + 1):
+            logger.info(f"📖 Traitement page {i}")
+            self._traiter_page(page, i, tris[i - premier - 1] if tris else None)
+            page.close()
+            self.memoire.relever(f"page {i}")
+
+    def _fusionner_tranche(self, tranche: TranchePages):
+        """
+        Ajoute la tranche suivante (dans l'ordre des pages). Ses éléments qui
+        précèdent son premier titre de lot appartiennent au lot en cours à
+        la fin des tranches précédentes.
+        """
+        for element in tranche.elements[:tranche.nb_sans_lot]:
+            element.lot_numero = self.lot_courant
+            element.lot_nom = self.lot_nom_courant
+        self.elements.extend(tranche.elements)
+        self.erreurs.extend(tranche.erreurs)
+        self.confiances.extend(tranche.confiances)
+        if tranche.memoire_pic_mo is not None:   # Pic par processus: le plus haut des workers
+            self.memoire.pic_mo = max(self.memoire.pic_mo or 0.0, tranche.memoire_pic_mo)
+        if tranche.lot_vu:
+            self.lot_courant, self.lot_nom_courant = tranche.lot_final
+
+    def _traiter_page(self, page, num_page: int, tri: Optional[TriPage] = None):
+        """Traite une page du PDF (tri: voir trier_pages, None = page non triée)"""
+        avant = len(self.elements)
+        self._lignes_page = 0
+        self._colonnes_page = 0.0
+        contenu = tri.contenu if tri else ''
+
+        if contenu in ('ignoree', 'vide'):
+            # Rien à extraire: la page n'est pas analysée par pdfplumber
+            self.confiances.append(ConfiancePage.evaluer(num_page, 0, 0.0, [], contenu))
+            return
 
-        if tables:
-            for table in tables:
-                self._traiter_tableau(table)
-        else:
-            # Si pas de tableau, extraire le texte brut
-            texte = page.extract_text()
-            if texte:
-                self._traiter_texte_brut(texte)
+        # Tableaux, ou mots s'il n'y en a pas: déjà lus par PDFium
+        # au tri si la mise en page s'y prête, sinon par pdfplumber
+        lecture = tri.lecture if tri and tri.lecture else lire_page_pdfplumber(page, tri)
+        for table in lecture.tables:
+            self._traiter_tableau(table)
+        if not lecture.tables and lecture.mots:
+            self._traiter_mots(lecture.mots)
+
+        self.confiances.append(ConfiancePage.evaluer(
+            num_page, self._lignes_page, self._colonnes_page, self.elements[avant:], contenu,
+            lecture.moteur
+        ))
+
+    @staticmethod
+    def _zone_tracee(page, tri: Optional[TriPage]):
+        """Page recadrée sur la zone tracée du tri (la page entière à défaut)"""
+        if not tri or not tri.zone:
+            return page
+        x0, top, x1, bottom = page.bbox
+        zone = (max(x0, tri.zone[0]), max(top, tri.zone[1]), min(x1, tri.zone[2]), min(bottom, tri.zone[3]))
+        if zone[0] >= zone[2] or zone[1] >= zone[3]:
+            return page
+        return page.crop(zone)
 
     def _traiter_tableau(self, table: List[List[str]]):
         """Traite un tableau extrait"""
@@ -437,6 +1428,8 @@ class ExtracteurPDFPlumber:
         col_quantite = self._trouver_colonne(headers, ['qté', 'qte', 'quantité', 'quantite', 'qty'])
         col_pu = self._trouver_colonne(headers, ['p.u', 'pu', 'prix unit', 'unitaire'])
         col_total = self._trouver_colonne(headers, ['total', 'montant', 'prix total', 'pt'])
+        colonnes = (col_numero, col_designation, col_unite, col_quantite, col_pu, col_total)
+        self._colonnes_page = max(self._colonnes_page, sum(c is not None for c in colonnes) / 6)
 
         # Traiter chaque ligne
         for row in table[1:]:
@@ -445,9 +1438,12 @@ class ExtracteurPDFPlumber:
 
             # Détecter si c'est un titre de lot
             premiere_cellule = str(row[0]) if row[0] else ''
-            if self._est_titre_lot(premiere_cellule):
+            if self._est_titre_lot(premiere_cellule, cellule=True):
                 self.lot_courant, self.lot_nom_courant = self._extraire_lot(premiere_cellule)
+                if self.premier_lot is None:
+                    self.premier_lot = len(self.elements)
                 continue
+            self._lignes_page += 1
 
             # Extraire les données
             try:
@@ -465,11 +1461,8 @@ class ExtracteurPDFPlumber:
                 # Catégorisation automatique
                 categorie, sous_categorie = categoriser_element(designation)
 
-                # Métadonnées
-                niveau = detecter_niveau(designation)
-                dosage = detecter_dosage(designation)
-                dimensions = detecter_dimensions(designation)
-                epaisseur = detecter_epaisseur(designation)
+                # Métadonnées (un seul parcours de la désignation)
+                meta = detecter_metadonnees(designation)
 
                 element = ElementBTP(
                     numero=numero,
@@ -482,11 +1475,11 @@ class ExtracteurPDFPlumber:
                     prix_total=prix_total,
                     lot_numero=self.lot_courant,
                     lot_nom=self.lot_nom_courant,
-                    niveau=niveau,
-                    dosage=dosage,
-                    dimensions=dimensions,
+                    niveau=meta.niveau,
+                    dosage=meta.dosage,
+                    dimensions=meta.dimensions,
                     materiaux=None,
-                    epaisseur=epaisseur
+                    epaisseur=meta.epaisseur
                 )
 
                 self.elements.append(element)
@@ -494,37 +1487,66 @@ class ExtracteurPDFPlumber:
             except Exception as e:
                 self.erreurs.append(f"Erreur ligne: {str(e)}")
 
-    def _traiter_texte_brut(self, texte: str):
-        """Traite du texte brut (fallback)"""
-        # Patterns pour détecter les lignes de poste
-        pattern_poste = r'^(\d+(?:\.\d+)*)\s+(.+?)\s+(m[²³l]?|u|kg|ml|l|ens|ft)\s+([\d\s,\.]+)\s+([\d\s,\.]+)\s+([\d\s,\.]+)'
-
-        for ligne in texte.split('\n'):
-            match = re.match(pattern_poste, ligne, re.IGNORECASE)
-            if match:
-                numero, designation, unite, qte, pu, total = match.groups()
+    def _traiter_mots(self, mots: List[list]):
+        """
+        Traite une page sans tableau: postes reconstitués à partir des mots
+        [gauche, bas, droite, haut, texte] (voir decouper_ligne), titres de
+        lot reconnus sur les autres lignes.
+        """
+        candidates, ecarts = [], []
+        for ligne in _lignes_mots(mots):
+            if MOTIF_NUMERO_POSTE.fullmatch(ligne[0][4]):
+                if len(ligne) > 1:
+                    self._lignes_page += 1
+                    ecarts.extend(b[0] - a[2] for a, b in zip(ligne, ligne[1:]))
+                    candidates.append(ligne)
+                continue
+            titre = ' '.join(mot[4] for mot in ligne)
+            if self._est_titre_lot(titre):
+                # Titre entre deux postes: la ligne garde sa place dans l'ordre
+                candidates.append(titre)
+        if not ecarts:
+            return
 
-                categorie, sous_categorie = categoriser_element(designation)
+        seuil = ECART_CHAMPS * median(ecarts)
+        lignes = [decouper_ligne(l, seuil) if isinstance(l, list) else l for l in candidates]
+        colonnes = colonnes_montants([l for l in lignes if isinstance(l, LignePoste)])
 
-                element = ElementBTP(
-                    numero=numero,
-                    designation=designation.strip(),
-                    categorie=categorie,
-                    sous_categorie=sous_categorie,
-                    unite=unite,
-                    quantite=parser_montant_fcfa(qte) or 0,
-                    prix_unitaire=parser_montant_fcfa(pu),
-                    prix_total=parser_montant_fcfa(total),
-                    lot_numero=self.lot_courant,
-                    lot_nom=self.lot_nom_courant,
-                    niveau=detecter_niveau(designation),
-                    dosage=detecter_dosage(designation),
-                    dimensions=detecter_dimensions(designation),
-                    materiaux=None,
-                    epaisseur=detecter_epaisseur(designation)
-                )
+        for ligne in lignes:
+            if isinstance(ligne, str):
+                self.lot_courant, self.lot_nom_courant = self._extraire_lot(ligne)
+                if self.premier_lot is None:
+                    self.premier_lot = len(self.elements)
+                continue
+            designation = ' '.join(ligne.designation)
+            if len(designation) < 3 or not (len(ligne.montants) >= 2 or (ligne.unite and ligne.montants)):
+                continue
+            qte, pu, total = repartir_montants(ligne, colonnes)
+            champs = (ligne.numero, designation, ligne.unite, qte, pu, total)
+            self._colonnes_page = max(self._colonnes_page, sum(1 for c in champs if c) / 6)
+
+            categorie, sous_categorie = categoriser_element(designation)
+            meta = detecter_metadonnees(designation)
+
+            element = ElementBTP(
+                numero=ligne.numero,
+                designation=designation,
+                categorie=categorie,
+                sous_categorie=sous_categorie,
+                unite=ligne.unite,
+                quantite=(parser_montant_fcfa(qte) if qte else 0) or 0,
+                prix_unitaire=parser_montant_fcfa(pu) if pu else None,
+                prix_total=parser_montant_fcfa(total) if total else None,
+                lot_numero=self.lot_courant,
+                lot_nom=self.lot_nom_courant,
+                niveau=meta.niveau,
+                dosage=meta.dosage,
+                dimensions=meta.dimensions,
+                materiaux=None,
+                epaisseur=meta.epaisseur
+            )
 
-                self.elements.append(element)
+            self.elements.append(element)
 
     def _trouver_colonne(self, headers: List[str], keywords: List[str]) -> Optional[int]:
         """Trouve l'index d'une colonne basé sur des mots-clés"""
@@ -534,15 +1556,23 @@ class ExtracteurPDFPlumber:
                     return i
         return None
 
-    def _est_titre_lot(self, texte: str) -> bool:
-        """Vérifie si le texte est un titre de lot"""
+    def _est_titre_lot(self, texte: str, cellule: bool = False) -> bool:
+        """
+        Vérifie si le texte est un titre de lot: ligne reconstituée à partir
+        des mots, ou première cellule d'une ligne de tableau (cellule=True)
+        """
         patterns = [
             r'^lot\s*[n°]*\s*\d+',
-            r'^[ivxlcdm]+[\.\s]+',  # Numérotation romaine
             r'^chapitre\s*\d+',
         ]
-        texte_lower = texte.lower().strip()
-        return any(re.match(p, texte_lower) for p in patterns)
+        texte = texte.strip()
+        if any(re.match(p, texte.lower()) for p in patterns):
+            return True
+        # Numérotation romaine (voir MOTIF_TITRE_ROMAIN)
+        romain = MOTIF_TITRE_ROMAIN.match(texte)
+        if not (romain and romain.group(1).isupper()):
+            return False
+        return cellule or (len(texte) <= LONGUEUR_TITRE_MAX and not MOTIF_MONTANT.search(texte))
 
     def _extraire_lot(self, texte: str) -> Tuple[Optional[str], Optional[str]]:
         """Extrait le numéro et nom du lot"""
@@ -551,38 +1581,86 @@ class ExtracteurPDFPlumber:
             return match.group(1), match.group(2).strip() or None
         return None, texte.strip()
 
-    def _calculer_resume_categories(self) -> Dict[str, Dict]:
-        """Agrège les éléments par catégorie"""
-        resume = {}
-        for e in self.elements:
-            cat = e.categorie
-            if cat not in resume:
-                resume[cat] = {'nombre': 0, 'total': 0}
-            resume[cat]['nombre'] += 1
-            resume[cat]['total'] += e.prix_total or 0
-        return resume
 
-    def _calculer_resume_lots(self) -> Dict[str, Dict]:
-        """Agrège les éléments par lot"""
-        resume = {}
-        for e in self.elements:
-            lot = e.lot_numero or 'Non défini'
-            if lot not in resume:
-                resume[lot] = {'nom': e.lot_nom, 'nombre': 0, 'total': 0}
-            resume[lot]['nombre'] += 1
-            resume[lot]['total'] += e.prix_total or 0
-        return resume
+# ============================================================================
+# EXTRACTION GEMINI PAR LOTS DE PAGES
+# ============================================================================
 
-    def _calculer_resume_niveaux(self) -> Dict[str, Dict]:
-        """Agrège les éléments par niveau"""
-        resume = {}
-        for e in self.elements:
-            niv = e.niveau or 'Non défini'
-            if niv not in resume:
-                resume[niv] = {'nombre': 0, 'total': 0}
-            resume[niv]['nombre'] += 1
-            resume[niv]['total'] += e.prix_total or 0
-        return resume
+# Un seul appel pour tout le document plafonne la réponse à
+# max_output_tokens (JSON tronqué sur les gros DQE) et génère tous les
+# jetons en série: le PDF est découpé en lots de pages (pypdfium2) envoyés
+# en parallèle par le client partagé (gemini_client), puis fusionnés dans
+# l'ordre des pages
+MAX_JETONS_SORTIE = 32000
+REMPLISSAGE_CIBLE = 0.5          # Part de max_output_tokens visée par lot (marge de variance)
+JETONS_PAR_PAGE_INITIAL = 1500   # Estimation avant le premier appel (~25 postes par page)
+PAGES_PAR_LOT_MAX = 20
+CONCURRENCE_GEMINI = int(os.getenv('BTP_GEMINI_CONCURRENCE', 4))
+PAGES_PAR_LOT = int(os.getenv('BTP_GEMINI_PAGES_PAR_LOT', 0))   # 0 = adaptatif
+
+# PDFium n'est pas thread-safe: un seul découpage à la fois par processus
+_verrou_pdfium = threading.Lock()
+
+
+class EstimateurJetons:
+    """
+    Jetons de sortie par page (moyenne glissante des appels du processus):
+    fixe la taille des lots pour remplir REMPLISSAGE_CIBLE de
+    max_output_tokens.
+    """
+
+    def __init__(self, jetons_par_page: float = JETONS_PAR_PAGE_INITIAL, lissage: float = 0.3):
+        self.jetons_par_page = jetons_par_page
+        self.lissage = lissage
+        self._verrou = threading.Lock()
+
+    def observer(self, jetons: int, nb_pages: int):
+        with self._verrou:
+            mesure = jetons / max(nb_pages, 1)
+            self.jetons_par_page += self.lissage * (mesure - self.jetons_par_page)
+
+    def observer_troncature(self, nb_pages: int):
+        """Réponse tronquée: ces pages dépassent à elles seules la limite"""
+        with self._verrou:
+            self.jetons_par_page = max(self.jetons_par_page, MAX_JETONS_SORTIE / max(nb_pages, 1))
+
+    def pages_par_lot(self) -> int:
+        pages = int(MAX_JETONS_SORTIE * REMPLISSAGE_CIBLE / max(self.jetons_par_page, 1))
+        return max(1, min(PAGES_PAR_LOT_MAX, pages))
+
+
+estimateur_jetons = EstimateurJetons()
+
+
+def compter_pages_pdf(pdf) -> int:
+    """Nombre de pages d'un PDF en octets ou tableau ctypes (0 si pypdfium2 est absent ou le PDF illisible)"""
+    if not PYPDFIUM2_AVAILABLE:
+        return 0
+    import pypdfium2 as pdfium
+    with _verrou_pdfium:
+        try:
+            document = pdfium.PdfDocument(pdf)
+        except pdfium.PdfiumError:
+            return 0
+        try:
+            return len(document)
+        finally:
+            document.close()
+
+
+def extraire_pages_pdf(source, debut: int, fin: int) -> bytes:
+    """PDF réduit aux pages [debut, fin[ d'un pypdfium2.PdfDocument"""
+    import io
+    import pypdfium2 as pdfium
+    with _verrou_pdfium:
+        sortie = pdfium.PdfDocument.new()
+        try:
+            sortie.import_pages(source, list(range(debut, fin)))
+            tampon = io.BytesIO()
+            sortie.save(tampon)
+            return tampon.getvalue()
+        finally:
+            sortie.close()
 
 
 # ============================================================================
@@ -612,105 +1690,258 @@ class ExtracteurGemini:
         "Vitrerie & Miroiterie",
         "Divers & Imprévus"
     ]
-
-    def __init__(self, filepath: str, api_key: Optional[str] = None):
-        self.filepath = filepath
-        self.api_key = api_key or os.getenv('GOOGLE_AI_API_KEY') or os.getenv('GEMINI_API_KEY')
+    MODELE = MODELE
+    MODE_EXTRACTION = 'gemini-2.0-flash'
+    CONFIG_GENERATION = {
+        'temperature': 0.1,
+        'max_output_tokens': MAX_JETONS_SORTIE,
+        'response_mime_type': 'application/json'
+    }
+    # Ajouté au prompt quand le document est découpé en plusieurs lots
+    CONSIGNE_LOT = """
+
+CONTEXTE: ce PDF contient les pages {premiere} à {derniere} d'un document de {total} pages.
+- Les premiers postes peuvent appartenir à un lot commencé avant ces pages: s'ils précèdent tout titre de lot, laisse lot_numero et lot_nom à null
+- total_general: le total général du document s'il figure sur ces pages, sinon 0
+- nb_pages: {nb_pages}"""
+
+    def __init__(self, filepath: Union[str, DocumentPDF], api_key: Optional[str] = None, client=None,
+                 concurrence: Optional[int] = None, pages_par_lot: Optional[int] = None):
+        """
+        Args:
+            filepath: PDF à extraire (chemin ou document déjà ouvert)
+            api_key: Clé Gemini (sinon GOOGLE_AI_API_KEY ou GEMINI_API_KEY)
+            client: gemini_client.ClientGemini (défaut: client partagé du
+                processus); avec TransportGeminiSimule, tests sans réseau
+            concurrence: Lots envoyés simultanément (BTP_GEMINI_CONCURRENCE)
+            pages_par_lot: Taille fixe des lots (défaut: adaptative)
+        """
+        self.document = ouvrir_document(filepath)
+        self.filepath = filepath.nom if isinstance(filepath, DocumentPDF) else filepath
         self.erreurs: List[str] = []
-
-        if not self.api_key:
-            raise ValueError("Clé API Gemini requise (GOOGLE_AI_API_KEY ou GEMINI_API_KEY)")
-
-        if not GEMINI_AVAILABLE:
-            raise ImportError("google-generativeai n'est pas installé")
-
-        genai.configure(api_key=self.api_key)
+        self.concurrence = max(1, concurrence or CONCURRENCE_GEMINI)
+        self.pages_par_lot = pages_par_lot or PAGES_PAR_LOT or None
+        self.nb_pages = 0
+
+        if client is None:
+            self.api_key = api_key or os.getenv('GOOGLE_AI_API_KEY') or os.getenv('GEMINI_API_KEY')
+            if not self.api_key:
+                raise ValueError("Clé API Gemini requise (GOOGLE_AI_API_KEY ou GEMINI_API_KEY)")
+            if not GEMINI_AVAILABLE:
+                raise ImportError("google-generativeai n'est pas installé")
+            client = client_gemini(self.api_key)
+        self.client = client
 
     def extraire(self) -> ResultatExtraction:
         """Extrait toutes les données du PDF via Gemini"""
+        elements = collecter_elements(self.iter_blocs())
+        return ResultatExtraction(elements=elements, **self.resume_final())
+
+    def iter_elements(self) -> Iterator[Dict]:
+        """Éléments extraits au fil des réponses (voir iter_blocs)"""
+        for bloc in self.iter_blocs():
+            yield from bloc
+
+    def iter_blocs(self) -> Iterator[List[Dict]]:
+        """
+        Extrait le PDF par lots de pages: un bloc par lot, dans l'ordre des
+        pages. Les lots sont envoyés en parallèle par le client partagé
+        (au plus self.concurrence pour ce document); leur taille suit les
+        jetons de sortie observés, et un lot dont la réponse est tronquée
+        est redécoupé.
+        Les résumés sont cumulés au passage et resume_final() complète le
+        résultat.
+        """
         logger.info(f"🤖 Extraction Gemini: {self.filepath}")
 
-        hash_fichier = calculer_hash_fichier(self.filepath)
-
-        # Lire le PDF en bytes
-        with open(self.filepath, 'rb') as f:
-            pdf_bytes = f.read()
+        debut = time.perf_counter()
+        self._initialiser_fusion()
+        try:
+            for _, _, reponse in self.iter_reponses():
+                yield self._fusionner_lot(reponse)
+        except Exception as e:
+            logger.error(f"❌ Erreur Gemini: {e}")
+            self.erreurs.append(str(e))
+            raise
 
-        # Créer le modèle
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        enregistrer_document('gemini', self.nb_pages, self.resumes.nb_elements,
+                             time.perf_counter() - debut)
 
-        # Prompt optimisé pour l'extraction BTP
-        prompt = self._construire_prompt()
+        # Vérifier le total
+        total_general = self.resumes.total_general
+        total_document = self._total_document
+        if total_document and abs(total_general - total_document) > 1000:
+            self.erreurs.append(
+                f"Différence de total: calculé={total_general:,.0f}, document={total_document:,.0f}"
+            )
 
+    def iter_reponses(self, zones: Optional[List[Tuple[int, int]]] = None
+                      ) -> Iterator[Tuple[int, int, Dict]]:
+        """
+        Réponses JSON des lots de pages couvrant `zones` (plages [debut, fin[
+        disjointes et croissantes; défaut: tout le document), sous la forme
+        (debut, fin, réponse) dans l'ordre des pages.
+        """
+        # Tampon du document, sans copie: compté, découpé et envoyé tel quel
+        pdf = self.document.tableau()
+
+        self.nb_pages = compter_pages_pdf(pdf)   # 0: pypdfium2 absent, pas de découpage
+        plage_entiere = (0, max(self.nb_pages, 1))
+        zones = zones or [plage_entiere]
+        source = None                                   # Document pypdfium2, ouvert au premier découpage
+
+        # Plages à envoyer en priorité (document entier ou lots redécoupés),
+        # puis pages restantes des zones par lots de taille adaptative
+        a_envoyer = deque()
+        restantes = deque([debut, fin] for debut, fin in zones)
+        if zones == [plage_entiere] and self.nb_pages <= self._taille_lot():
+            a_envoyer.append(plage_entiere)
+            restantes.clear()
+        # Fin d'une zone -> début de la suivante, pour publier dans l'ordre
+        zone_suivante = {fin: suivante[0] for (_, fin), suivante in zip(zones, zones[1:])}
+        reponses: Dict[int, Tuple[int, Dict]] = {}   # Première page -> (fin, réponse)
+        a_publier = zones[0][0]
+        en_vol: Dict[Future, Tuple[int, int]] = {}
         try:
-            # Envoyer le PDF à Gemini
-            response = model.generate_content([
-                prompt,
-                {
-                    'mime_type': 'application/pdf',
-                    'data': pdf_bytes
-                }
-            ],
-            generation_config={
-                'temperature': 0.1,
-                'max_output_tokens': 32000,
-                'response_mime_type': 'application/json'
-            })
-
-            # Parser la réponse JSON
-            result_text = response.text
-            logger.info(f"📥 Réponse Gemini reçue: {len(result_text)} caractères")
-
-            # Nettoyer et parser le JSON
-            result = self._parser_reponse(result_text)
-
-            if not result:
-                raise ValueError("Impossible de parser la réponse Gemini")
-
-            # Construire le résultat
-            elements = result.get('elements', [])
-            nb_pages = result.get('nb_pages', 0)
-
-            # Valider et enrichir les éléments
-            elements_valides = self._valider_elements(elements)
-
-            # Calculer les résumés
-            resume_categories = self._calculer_resume(elements_valides, 'categorie')
-            resume_lots = self._calculer_resume_lots(elements_valides)
-            resume_niveaux = self._calculer_resume(elements_valides, 'niveau')
-            total_general = sum(e.get('prix_total', 0) or 0 for e in elements_valides)
-
-            # Vérifier le total
-            total_document = result.get('total_general', 0)
-            if total_document and abs(total_general - total_document) > 1000:
-                self.erreurs.append(
-                    f"Différence de total: calculé={total_general:,.0f}, document={total_document:,.0f}"
-                )
-
-            return ResultatExtraction(
-                fichier=Path(self.filepath).name,
-                hash_fichier=hash_fichier,
-                date_extraction=datetime.now().isoformat(),
-                mode_extraction='gemini-2.0-flash',
-                nb_pages=nb_pages,
-                nb_elements=len(elements_valides),
-                elements=elements_valides,
-                resume_categories=resume_categories,
-                resume_lots=resume_lots,
-                resume_niveaux=resume_niveaux,
-                total_general=total_general,
-                devise='FCFA',
-                erreurs=self.erreurs
+            while True:
+                while len(en_vol) < self.concurrence:
+                    if a_envoyer:
+                        plage = a_envoyer.popleft()
+                    elif restantes:
+                        zone = restantes[0]
+                        plage = (zone[0], min(zone[0] + self._taille_lot(), zone[1]))
+                        zone[0] = plage[1]
+                        if zone[0] >= zone[1]:
+                            restantes.popleft()
+                    else:
+                        break
+                    if plage == plage_entiere:
+                        pdf_lot = pdf
+                    else:
+                        if source is None:
+                            import pypdfium2 as pdfium
+                            with _verrou_pdfium:
+                                source = pdfium.PdfDocument(pdf)
+                        pdf_lot = extraire_pages_pdf(source, *plage)
+                    en_vol[self._soumettre_lot(pdf_lot, *plage)] = plage
+                if not en_vol:
+                    break
+
+                terminees, _ = wait(en_vol, return_when=FIRST_COMPLETED)
+                for future in terminees:
+                    plage = en_vol.pop(future)
+                    reponse = self._lire_reponse(future.result(), *plage)
+                    if reponse is not None:
+                        reponses[plage[0]] = (plage[1], reponse)
+                    elif plage[1] - plage[0] > 1:
+                        milieu = (plage[0] + plage[1]) // 2
+                        logger.info(f"✂️ Réponse tronquée, pages {plage[0] + 1}-{plage[1]} redécoupées")
+                        a_envoyer.extendleft([(milieu, plage[1]), (plage[0], milieu)])
+                    else:
+                        GEMINI_ERREURS.labels('reponse_invalide').inc()
+                        raise ValueError("Impossible de parser la réponse Gemini")
+
+                # Publication dans l'ordre des pages
+                while a_publier in reponses:
+                    fin, reponse = reponses.pop(a_publier)
+                    yield a_publier, fin, reponse
+                    a_publier = zone_suivante.get(fin, fin)
+
+        finally:
+            for future in en_vol:
+                future.cancel()
+            if source is not None:
+                with _verrou_pdfium:
+                    source.close()
+
+    def _initialiser_fusion(self):
+        """Résumés et contexte de lot vierges avant la fusion des lots de pages"""
+        self.resumes = ResumesExtraction()
+        self._lot_courant: Tuple[Optional[str], Optional[str]] = (None, None)
+        self._dernier: Optional[Dict] = None
+        self._total_document = 0.0
+
+    def _taille_lot(self) -> int:
+        return self.pages_par_lot or estimateur_jetons.pages_par_lot()
+
+    def _soumettre_lot(self, pdf, debut: int, fin: int) -> Future:
+        """Envoie un lot de pages (pages [debut, fin[) au client partagé"""
+        prompt = self._construire_prompt()
+        if fin - debut < self.nb_pages:
+            prompt += self.CONSIGNE_LOT.format(
+                premiere=debut + 1, derniere=fin, total=self.nb_pages, nb_pages=fin - debut
             )
+        return self.client.soumettre(prompt, pdf, self.CONFIG_GENERATION)
 
-        except Exception as e:
-            logger.error(f"❌ Erreur Gemini: {e}")
-            self.erreurs.append(str(e))
-            raise
+    def _lire_reponse(self, reponse: ReponseGemini, debut: int, fin: int) -> Optional[Dict]:
+        """JSON d'un lot, ou None si la réponse est tronquée ou illisible (lot à redécouper)"""
+        logger.info(f"📥 Réponse Gemini reçue (pages {debut + 1}-{fin}): {len(reponse.texte)} caractères")
 
-    def _construire_prompt(self) -> str:
+        if reponse.tronquee:
+            GEMINI_ERREURS.labels('reponse_tronquee').inc()
+            estimateur_jetons.observer_troncature(fin - debut)
+            return None
+        estimateur_jetons.observer(reponse.jetons_sortie, fin - debut)
+
+        # Nettoyer et parser le JSON
+        return self._parser_reponse(reponse.texte)
+
+    def _fusionner_lot(self, reponse: Dict) -> List[Dict]:
+        """
+        Valide les éléments d'un lot et les raccorde au précédent: les
+        postes précédant tout titre de lot héritent du lot en cours, et un
+        poste coupé par la limite de pages (même numéro et même lot que le
+        dernier publié) n'est gardé qu'une fois.
+        """
+        if not self.nb_pages:
+            self.nb_pages = reponse.get('nb_pages', 0)
+        if reponse.get('total_general'):
+            self._total_document = reponse['total_general']
+
+        with mesurer_phase('gemini', 'validation'):
+            elements = self._valider_elements(reponse.get('elements', []))
+
+        lot_vu = False
+        bloc = []
+        for element in elements:
+            if element.get('lot_numero') or element.get('lot_nom'):
+                lot_vu = True
+            elif not lot_vu:
+                element['lot_numero'], element['lot_nom'] = self._lot_courant
+
+            dernier = self._dernier
+            if (not bloc and dernier is not None and element.get('numero')
+                    and element.get('numero') == dernier.get('numero')
+                    and element.get('lot_numero') == dernier.get('lot_numero')):
+                continue
+            bloc.append(element)
+
+        for element in bloc:
+            self.resumes.ajouter(element)
+        if bloc:
+            self._dernier = bloc[-1]
+            self._lot_courant = (bloc[-1].get('lot_numero'), bloc[-1].get('lot_nom'))
+        return bloc
+
+    def resume_final(self) -> Dict:
+        """Champs de ResultatExtraction hors éléments, une fois les blocs consommés"""
+        with mesurer_phase('gemini', 'hash'):
+            hash_fichier = calculer_hash_fichier(self.document)
+        return dict(
+            fichier=self.document.nom,
+            hash_fichier=hash_fichier,
+            date_extraction=datetime.now().isoformat(),
+            mode_extraction=self.MODE_EXTRACTION,
+            nb_pages=self.nb_pages,
+            devise='FCFA',
+            erreurs=self.erreurs,
+            **self.resumes.to_dict()
+        )
+
+    @classmethod
+    def _construire_prompt(cls) -> str:
         """Construit le prompt optimisé pour l'extraction BTP"""
-        categories_json = json.dumps(self.CATEGORIES_BTP, ensure_ascii=False)
+        categories_json = json.dumps(cls.CATEGORIES_BTP, ensure_ascii=False)
 
         return f"""Tu es un expert en extraction de données de documents BTP (Devis Quantitatif Estimatif - DQE).
 
@@ -819,27 +2050,260 @@ Analyse maintenant le document PDF et retourne le JSON complet:"""
 
         return elements_valides
 
-    def _calculer_resume(self, elements: List[Dict], champ: str) -> Dict[str, Dict]:
-        """Calcule un résumé agrégé par un champ"""
-        resume = {}
-        for e in elements:
-            valeur = e.get(champ) or 'Non défini'
-            if valeur not in resume:
-                resume[valeur] = {'nombre': 0, 'total': 0}
-            resume[valeur]['nombre'] += 1
-            resume[valeur]['total'] += e.get('prix_total', 0) or 0
-        return resume
 
-    def _calculer_resume_lots(self, elements: List[Dict]) -> Dict[str, Dict]:
-        """Calcule un résumé agrégé par lot"""
-        resume = {}
-        for e in elements:
-            lot = e.get('lot_numero') or 'Non défini'
-            if lot not in resume:
-                resume[lot] = {'nom': e.get('lot_nom'), 'nombre': 0, 'total': 0}
-            resume[lot]['nombre'] += 1
-            resume[lot]['total'] += e.get('prix_total', 0) or 0
-        return resume
+# ============================================================================
+# EXTRACTION HYBRIDE
+# ============================================================================
+
+# Score de confiance (ConfiancePage.score) en dessous duquel une page
+# extraite localement est reprise par Gemini
+SEUIL_CONFIANCE = float(os.getenv('BTP_HYBRIDE_SEUIL', 0.7))
+
+
+def regrouper_pages(pages: List[int]) -> List[Tuple[int, int]]:
+    """Index de pages croissants -> plages [debut, fin[ de pages consécutives"""
+    zones: List[Tuple[int, int]] = []
+    for page in pages:
+        if zones and zones[-1][1] == page:
+            zones[-1] = (zones[-1][0], page + 1)
+        else:
+            zones.append((page, page + 1))
+    return zones
+
+
+class ExtracteurHybride:
+    """
+    pdfplumber sur tout le document, puis Gemini sur les seules pages dont
+    l'extraction locale est peu fiable: latence et coût API suivent le
+    nombre de pages difficiles, pas la taille du document.
+    """
+
+    def __init__(self, filepath: Union[str, DocumentPDF], api_key: Optional[str] = None, client=None,
+                 seuil: Optional[float] = None, nb_processus: Optional[int] = None):
+        """
+        Args:
+            seuil: Score de confiance minimal d'une page (BTP_HYBRIDE_SEUIL)
+            api_key, client: Voir ExtracteurGemini; sans clé ni client,
+                l'extraction locale est conservée pour toutes les pages
+        """
+        self.document = ouvrir_document(filepath)   # Un seul tampon pour les deux extracteurs
+        self.filepath = filepath.nom if isinstance(filepath, DocumentPDF) else filepath
+        self.seuil = SEUIL_CONFIANCE if seuil is None else seuil
+        self.local = ExtracteurPDFPlumber(self.document, nb_processus=nb_processus)
+        self.erreurs: List[str] = []
+        self.pages_gemini: List[int] = []       # Pages reprises par Gemini (à partir de 1)
+        self.repli = False                      # Pages faibles gardées en local faute de Gemini (résultat dégradé)
+        self.nb_pages = 0
+        try:
+            self.gemini: Optional[ExtracteurGemini] = ExtracteurGemini(self.document, api_key=api_key, client=client)
+        except (ValueError, ImportError) as e:
+            self.gemini = None
+            self._gemini_indisponible = str(e)
+
+    def extraire(self) -> ResultatExtraction:
+        """Extrait toutes les données du PDF (local puis Gemini sur les pages faibles)"""
+        elements = collecter_elements(self.iter_blocs())
+        return ResultatExtraction(elements=elements, **self.resume_final())
+
+    def iter_elements(self) -> Iterator[Dict]:
+        """Éléments dans l'ordre des pages (voir iter_blocs)"""
+        for bloc in self.iter_blocs():
+            yield from bloc
+
+    def iter_blocs(self) -> Iterator[List[Dict]]:
+        """
+        Extraction locale complète (éléments gardés par page, sur disque
+        au-delà de DEBORDEMENT_ELEMENTS), puis un bloc par page fiable et un
+        bloc par lot de pages repris par Gemini, dans l'ordre des pages. Si
+        Gemini échoue, l'extraction locale de ses pages est conservée.
+        """
+        debut = time.perf_counter()
+        self.resumes = ResumesExtraction()
+        self._dernier: Optional[Dict] = None
+
+        locaux = collecter_elements(self.local.iter_blocs())
+        self.nb_pages = self.local.nb_pages
+        try:
+            par_page = repartir_pages(locaux, [c.elements for c in self.local.confiances])
+        finally:
+            if isinstance(locaux, ElementsSurDisque):
+                locaux.fermer()
+        try:
+            yield from self._iter_blocs_pages(par_page)
+        finally:
+            if isinstance(par_page, ElementsSurDisque):
+                par_page.fermer()
+
+        PAGES_HYBRIDE.labels('gemini').inc(len(self.pages_gemini))
+        PAGES_HYBRIDE.labels('local').inc(self.nb_pages - len(self.pages_gemini))
+        enregistrer_document('hybride', self.nb_pages, self.resumes.nb_elements,
+                             time.perf_counter() - debut)
+
+    def _iter_blocs_pages(self, par_page: Union[List[List[Dict]], ElementsSurDisque]) -> Iterator[List[Dict]]:
+        """Blocs de iter_blocs() à partir des éléments locaux par page"""
+        faibles = [c.page - 1 for c in self.local.confiances if c.score < self.seuil]
+        zones = regrouper_pages(faibles)
+        if zones and self.gemini is None:
+            self.erreurs.append(
+                f"{len(faibles)} page(s) à faible confiance non reprises: {self._gemini_indisponible}"
+            )
+            zones, self.repli = [], True
+        elif zones and not PYPDFIUM2_AVAILABLE:
+            self.erreurs.append(f"{len(faibles)} page(s) à faible confiance non reprises: pypdfium2 absent")
+            zones, self.repli = [], True
+        logger.info(f"🔀 Hybride: {len(faibles)}/{self.nb_pages} page(s) sous le seuil {self.seuil}")
+
+        page = 0
+        if zones:
+            self.gemini._initialiser_fusion()
+            try:
+                for debut_lot, fin_lot, reponse in self.gemini.iter_reponses(zones):
+                    if page < debut_lot:
+                        yield from self._raccorder(par_page, page, debut_lot)
+                    locales = [self._page_locale(par_page, p) for p in range(debut_lot, fin_lot)]
+                    yield self._publier_gemini(reponse, locales, debut_lot, fin_lot)
+                    page = fin_lot
+            except Exception as e:
+                logger.error(f"❌ Erreur Gemini (mode hybride): {e}")
+                self.erreurs.append(f"Pages faibles conservées en extraction locale: {e}")
+                self.repli = True
+        if page < len(self.local.confiances):
+            yield from self._raccorder(par_page, page, len(self.local.confiances))
+
+        total_document = self.gemini._total_document if zones else 0
+        if total_document and abs(self.resumes.total_general - total_document) > 1000:
+            self.erreurs.append(
+                f"Différence de total: calculé={self.resumes.total_general:,.0f}, document={total_document:,.0f}"
+            )
+
+    def resume_final(self) -> Dict:
+        """Champs de ResultatExtraction hors éléments, une fois les blocs consommés"""
+        with mesurer_phase('hybride', 'hash'):
+            hash_fichier = calculer_hash_fichier(self.document)
+        erreurs = self.local.erreurs + (self.gemini.erreurs if self.gemini else []) + self.erreurs
+        return dict(
+            fichier=self.document.nom,
+            hash_fichier=hash_fichier,
+            date_extraction=datetime.now().isoformat(),
+            mode_extraction=f"pdfplumber+{ExtracteurGemini.MODE_EXTRACTION}" if self.pages_gemini else 'pdfplumber',
+            nb_pages=self.nb_pages,
+            devise='FCFA',
+            erreurs=erreurs,
+            memoire_pic_mo=arrondir_mo(self.local.memoire.pic_mo),
+            **self.resumes.to_dict()
+        )
+
+    @staticmethod
+    def _page_locale(par_page: Union[List[List[Dict]], ElementsSurDisque], page: int) -> List[Dict]:
+        return par_page[page] if isinstance(par_page, list) else par_page.bloc(page)
+
+    def _raccorder(self, par_page: Union[List[List[Dict]], ElementsSurDisque],
+                   debut: int, fin: int) -> Iterator[List[Dict]]:
+        """
+        Pages locales [debut, fin[ publiées une à une. Après des pages
+        reprises par Gemini, les éléments qui héritaient du lot local (avant
+        le premier titre de lot de ces pages) prennent le lot du dernier
+        élément publié: Gemini a pu lire un titre de lot que l'extraction
+        locale avait manqué.
+        """
+        raccord = None
+        if self.pages_gemini and self.pages_gemini[-1] == debut and self._dernier is not None:
+            # Lot du dernier élément local des pages précédentes
+            precedente = next((p for p in range(debut - 1, -1, -1) if self.local.confiances[p].elements), None)
+            dernier = self._page_locale(par_page, precedente)[-1] if precedente is not None else None
+            herite = (dernier['lot_numero'], dernier['lot_nom']) if dernier else (None, None)
+            raccord = (self._dernier['lot_numero'], self._dernier['lot_nom'])
+        for page in range(debut, fin):
+            elements = self._page_locale(par_page, page)
+            if raccord:
+                # Copie: la page locale garde son lot, comparé au raccord suivant
+                elements = [dict(e) for e in elements]
+            for element in elements if raccord else ():
+                if (element['lot_numero'], element['lot_nom']) != herite:
+                    raccord = None
+                    break
+                element['lot_numero'], element['lot_nom'] = raccord
+            yield self._publier([elements])
+
+    def _publier(self, pages: List[List[Dict]]) -> List[Dict]:
+        bloc = [e for elements in pages for e in elements]
+        for element in bloc:
+            self.resumes.ajouter(element)
+        if bloc:
+            self._dernier = bloc[-1]
+        return bloc
+
+    def _publier_gemini(self, reponse: Dict, locaux: List[List[Dict]], debut: int, fin: int) -> List[Dict]:
+        """
+        Éléments Gemini des pages [debut, fin[, raccordés au lot du dernier
+        élément publié; réponse vide alors que l'extraction locale a trouvé
+        des éléments: les éléments locaux sont gardés.
+        """
+        dernier = self._dernier
+        gemini = self.gemini
+        gemini._dernier = dernier
+        gemini._lot_courant = (dernier['lot_numero'], dernier['lot_nom']) if dernier else (None, None)
+        bloc = [self._normaliser(e) for e in gemini._fusionner_lot(reponse)]
+        if not bloc and any(locaux):
+            return self._publier(locaux)
+        self.pages_gemini.extend(range(debut + 1, fin + 1))
+        return self._publier([bloc])
+
+    @staticmethod
+    def _normaliser(e: Dict) -> Dict:
+        """Élément Gemini au format des éléments locaux (champs d'ElementBTP)"""
+        designation = e['designation']
+        lot_numero = e.get('lot_numero')
+        meta = detecter_metadonnees(designation)
+        return ElementBTP(
+            numero=str(e.get('numero') or ''),
+            designation=designation,
+            categorie=e['categorie'],
+            sous_categorie=e.get('sous_categorie'),
+            unite=e.get('unite') or '',
+            quantite=e['quantite'],
+            prix_unitaire=e['prix_unitaire'],
+            prix_total=e['prix_total'],
+            lot_numero=str(lot_numero) if lot_numero is not None else None,
+            lot_nom=e.get('lot_nom'),
+            niveau=e.get('niveau') or meta.niveau,
+            dosage=e.get('dosage') or meta.dosage,
+            dimensions=e.get('dimensions') or meta.dimensions,
+            materiaux=e.get('materiaux'),
+            epaisseur=e.get('epaisseur') or meta.epaisseur
+        ).to_dict()
+
+
+# ============================================================================
+# VERSIONS DES RÉSULTATS
+# ============================================================================
+
+# À incrémenter à chaque changement du parsing, de la catégorisation ou de la
+# détection des métadonnées: les résultats en cache de l'ancienne version
+# ne sont plus servis
+VERSION_EXTRACTEUR = "3"
+
+
+@lru_cache(maxsize=None)
+def version_extraction(mode: str) -> str:
+    """
+    Version des résultats d'un mode ('local', 'gemini' ou 'hybrid'): logique
+    d'extraction, plus version de pdfplumber ou empreinte du modèle et du
+    prompt Gemini (les deux et le seuil de confiance en mode hybride).
+    """
+    if mode == 'hybrid':
+        return f"{version_extraction('local')}+{version_extraction('gemini')}-s{SEUIL_CONFIANCE}"
+    if mode == 'gemini':
+        empreinte = hashlib.sha256(
+            (ExtracteurGemini.MODELE + ExtracteurGemini._construire_prompt()
+             + ExtracteurGemini.CONSIGNE_LOT).encode('utf-8')
+        ).hexdigest()[:12]
+        return f"v{VERSION_EXTRACTEUR}-gemini-{empreinte}"
+    try:
+        version_pdfplumber = importlib.metadata.version('pdfplumber')
+    except importlib.metadata.PackageNotFoundError:
+        version_pdfplumber = 'absent'
+    return f"v{VERSION_EXTRACTEUR}-pdfplumber-{version_pdfplumber}-{MOTEUR_PDF}"
 
 
 # ============================================================================
@@ -848,8 +2312,8 @@ Analyse maintenant le document PDF et retourne le JSON complet:"""
 
 def exporter_json(resultat: ResultatExtraction, output_path: str):
     """Exporte le résultat en JSON"""
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(resultat.to_dict(), f, ensure_ascii=False, indent=2)
+    with open(output_path, 'wb') as f:
+        f.writelines(resultat.iter_json(indent=True))
     logger.info(f"✅ Export JSON: {output_path}")
 
 
@@ -876,6 +2340,36 @@ def exporter_csv(resultat: ResultatExtraction, output_path: str):
     logger.info(f"✅ Export CSV: {output_path}")
 
 
+# ============================================================================
+# PRÉCHAUFFAGE
+# ============================================================================
+
+def prechauffer():
+    """
+    Précharge pdfplumber et compile les expressions régulières de
+    l'extraction (montants, lots, postes, métadonnées) sur un mini-tableau.
+    Prévu pour le démarrage de l'API ou comme initialiseur de processus:
+    la première extraction ne paie plus ces coûts. N'échoue jamais.
+    """
+    try:
+        if PDFPLUMBER_AVAILABLE:
+            import pdfplumber  # noqa: F401
+
+        extracteur = ExtracteurPDFPlumber('')
+        extracteur._traiter_tableau([
+            ['N°', 'Désignation', 'U', 'Qté', 'P.U', 'Total'],
+            ['LOT 1 : GROS OEUVRE', None, None, None, None, None],
+            ['1.1', 'Béton dosé à 350 kg/m3 R+1 ép. 15 cm 20x20', 'm3', '12,5', '1 250 000', '15.625.000'],
+        ])
+        mots, x = [], 0.0
+        for mot in '1.2 Parpaing de 15 plein m2 10 8 500 85 000'.split():
+            mots.append([x, 0.0, x + 5 * len(mot), 8.0, mot])
+            x += 5 * len(mot) + 3
+        extracteur._traiter_mots(mots)
+    except Exception:
+        pass
+
+
 # ============================================================================
 # POINT D'ENTRÉE
 # ============================================================================
@@ -886,13 +2380,23 @@ def main():
 
     parser = argparse.ArgumentParser(description='Extracteur BTP - Données PDF DQE')
     parser.add_argument('fichier', help='Chemin vers le fichier PDF')
-    parser.add_argument('--mode', choices=['local', 'gemini', 'auto'], default='auto',
+    parser.add_argument('--mode', choices=['local', 'gemini', 'hybrid', 'auto'], default='auto',
                         help='Mode d\'extraction (default: auto)')
     parser.add_argument('--output', choices=['json', 'csv', 'both'], default='both',
                         help='Format de sortie (default: both)')
     parser.add_argument('--output-dir', default='.', help='Répertoire de sortie')
+    parser.add_argument('--processus', type=int, default=None,
+                        help='Processus pour les pages en mode local (défaut: BTP_PAGE_WORKERS ou nb CPU)')
+    parser.add_argument('--seuil', type=float, default=None,
+                        help='Mode hybride: confiance minimale d\'une page (défaut: BTP_HYBRIDE_SEUIL ou 0.7)')
 
     args = parser.parse_args()
+    configurer_logs()
+
+    if not PDFPLUMBER_AVAILABLE:
+        print("⚠️ pdfplumber non installé. Installez avec: pip install pdfplumber")
+    if not GEMINI_AVAILABLE:
+        print("⚠️ google-generativeai non installé. Installez avec: pip install google-generativeai")
 
     if not os.path.exists(args.fichier):
         print(f"❌ Fichier non trouvé: {args.fichier}")
@@ -901,8 +2405,11 @@ def main():
     # Déterminer le mode
     mode = args.mode
     if mode == 'auto':
-        # Préférer Gemini si disponible
-        if GEMINI_AVAILABLE and (os.getenv('GOOGLE_AI_API_KEY') or os.getenv('GEMINI_API_KEY')):
+        # Hybride si les deux extracteurs sont disponibles, sinon Gemini ou local
+        gemini_configure = GEMINI_AVAILABLE and (os.getenv('GOOGLE_AI_API_KEY') or os.getenv('GEMINI_API_KEY'))
+        if gemini_configure and PDFPLUMBER_AVAILABLE:
+            mode = 'hybrid'
+        elif gemini_configure:
             mode = 'gemini'
         elif PDFPLUMBER_AVAILABLE:
             mode = 'local'
@@ -916,8 +2423,10 @@ def main():
         # Extraction
         if mode == 'gemini':
             extracteur = ExtracteurGemini(args.fichier)
+        elif mode == 'hybrid':
+            extracteur = ExtracteurHybride(args.fichier, seuil=args.seuil, nb_processus=args.processus)
         else:
-            extracteur = ExtracteurPDFPlumber(args.fichier)
+            extracteur = ExtracteurPDFPlumber(args.fichier, nb_processus=args.processus)
 
         resultat = extracteur.extraire()
 
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Client Gemini asynchrone partagé
+
+Un client par processus (et par clé API): google-generativeai est configuré
+et le modèle créé une seule fois. Les appels s'exécutent sur une boucle
+asyncio dédiée (thread de fond), ce qui permet de nombreux appels
+simultanés sans bloquer ni la boucle de l'API ni un thread par appel; le
+code synchrone (ExtracteurGemini, ligne de commande) soumet ses appels et
+attend des futures.
+
+Chaque appel a un délai par tentative et une échéance globale. Les erreurs
+transitoires (timeouts, 429, 5xx) sont réessayées avec une attente
+exponentielle aléatoire ("full jitter"), dans la limite d'un budget de
+nouveaux essais commun à tout le processus: une panne de l'API ne
+multiplie pas la charge. Le débit (appels par minute) et le nombre d'appels
+en vol sont limités pour tout le processus.
+
+Le transport est injectable: TransportGeminiSimule (synthetic.py) permet
+de tester et mesurer sans réseau.
+
+Usage:
+    client = client_gemini()                          # GOOGLE_AI_API_KEY / GEMINI_API_KEY
+    reponse = await client.generer(prompt, pdf, config)
+    future = client.soumettre(prompt, pdf, config)    # Depuis du code synchrone
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from metrics import (
+    GEMINI_DUREE, GEMINI_ERREURS, GEMINI_JETONS, GEMINI_EN_VOL, GEMINI_NOUVEAUX_ESSAIS
+)
+
+logger = logging.getLogger(__name__)
+
+MODELE = 'gemini-2.0-flash-exp'
+APPELS_SIMULTANES = int(os.getenv('BTP_GEMINI_MAX_APPELS', 16))
+APPELS_PAR_MINUTE = float(os.getenv('BTP_GEMINI_RPM', 60))
+DELAI_TENTATIVE = float(os.getenv('BTP_GEMINI_TIMEOUT', 120))     # Secondes par tentative
+ECHEANCE_APPEL = float(os.getenv('BTP_GEMINI_DEADLINE', 300))     # Secondes, nouveaux essais compris
+TENTATIVES = 4
+ATTENTE_BASE = 1.0               # Secondes, doublée à chaque nouvel essai (avant tirage aléatoire)
+ATTENTE_MAX = 30.0
+BUDGET_RATIO = 0.2               # Nouveaux essais autorisés par appel réussi ou non
+BUDGET_MINIMUM = 10.0            # Nouveaux essais disponibles au démarrage
+
+# Erreurs google.api_core réessayables (reconnues par nom: pas d'import)
+ERREURS_TRANSITOIRES = {
+    'DeadlineExceeded', 'ResourceExhausted', 'ServiceUnavailable', 'InternalServerError',
+    'TooManyRequests', 'GatewayTimeout', 'BadGateway', 'Aborted', 'RetryError'
+}
+
+
+@dataclass
+class ReponseGemini:
+    """Réponse brute d'un appel de génération"""
+    texte: str
+    jetons_sortie: int                    # Jetons générés (estimés si l'API ne les donne pas)
+    tronquee: bool                        # Arrêt sur max_output_tokens
+
+
+def erreur_transitoire(e: BaseException) -> bool:
+    """Erreur qu'un nouvel essai peut résoudre"""
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return type(e).__name__ in ERREURS_TRANSITOIRES
+
+
+# ============================================================================
+# TRANSPORTS
+# ============================================================================
+
+class TransportGenAI:
+    """Transport google-generativeai (appels asynchrones)"""
+
+    def __init__(self, api_key: str, modele: str = MODELE):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.modele = genai.GenerativeModel(modele)
+
+    async def generer(self, prompt: str, pdf: bytes, config: Dict, delai: float) -> ReponseGemini:
+        response = await self.modele.generate_content_async(
+            # Le SDK veut des bytes: seule copie du tampon mappé du document
+            [prompt, {'mime_type': 'application/pdf', 'data': bytes(pdf)}],
+            generation_config=config,
+            request_options={'timeout': delai}
+        )
+        texte = response.text
+        usage = getattr(response, 'usage_metadata', None)
+        jetons = getattr(usage, 'candidates_token_count', 0) or int(len(texte) / 3.5)
+        try:
+            fin = response.candidates[0].finish_reason
+            tronquee = getattr(fin, 'name', fin) in ('MAX_TOKENS', 2)
+        except (AttributeError, IndexError, TypeError):
+            tronquee = False
+        return ReponseGemini(texte, jetons, tronquee)
+
+
+# ============================================================================
+# LIMITES DU PROCESSUS
+# ============================================================================
+
+class LimiteurDebit:
+    """Seau à jetons (appels par minute), utilisé sur la boucle du client"""
+
+    def __init__(self, par_minute: float, rafale: int = 1):
+        self.debit = par_minute / 60
+        self.rafale = max(1, rafale)
+        self._jetons = float(self.rafale)
+        self._maj = time.monotonic()
+
+    async def attendre(self):
+        """Attend le créneau suivant (réservé dès l'appel)"""
+        if self.debit <= 0:
+            return
+        maintenant = time.monotonic()
+        self._jetons = min(self.rafale, self._jetons + (maintenant - self._maj) * self.debit)
+        self._maj = maintenant
+        self._jetons -= 1
+        if self._jetons < 0:
+            await asyncio.sleep(-self._jetons / self.debit)
+
+
+class BudgetNouvelsEssais:
+    """
+    Chaque appel crédite `ratio` nouvel essai, chaque nouvel essai en
+    consomme un: en panne prolongée, la charge supplémentaire reste
+    bornée à `ratio` fois le trafic normal.
+    """
+
+    def __init__(self, ratio: float = BUDGET_RATIO, minimum: float = BUDGET_MINIMUM):
+        self.ratio = ratio
+        self.plafond = minimum
+        self.jetons = minimum
+
+    def crediter(self):
+        self.jetons = min(self.plafond, self.jetons + self.ratio)
+
+    def retirer(self) -> bool:
+        if self.jetons < 1:
+            return False
+        self.jetons -= 1
+        return True
+
+
+# ============================================================================
+# CLIENT
+# ============================================================================
+
+class ClientGemini:
+    """Appels Gemini concurrents avec échéance, nouveaux essais et débit limité"""
+
+    def __init__(self, transport, appels_simultanes: int = APPELS_SIMULTANES,
+                 par_minute: float = APPELS_PAR_MINUTE, delai: float = DELAI_TENTATIVE,
+                 echeance: float = ECHEANCE_APPEL, tentatives: int = TENTATIVES,
+                 budget: Optional[BudgetNouvelsEssais] = None):
+        """
+        Args:
+            transport: Objet exposant `async generer(prompt, pdf, config, delai)`
+            appels_simultanes: Appels en vol pour tout le processus
+            par_minute: Débit maximal (0 = illimité)
+            delai: Délai d'une tentative (secondes)
+            echeance: Durée maximale d'un appel, nouveaux essais compris
+            tentatives: Tentatives maximales par appel
+        """
+        self.transport = transport
+        self.appels_simultanes = appels_simultanes
+        self.limiteur = LimiteurDebit(par_minute, rafale=min(appels_simultanes, 4))
+        self.delai = delai
+        self.echeance = echeance
+        self.tentatives = tentatives
+        self.budget = budget or BudgetNouvelsEssais()
+        self._boucle: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._verrou = threading.Lock()
+
+    def _demarrer(self) -> asyncio.AbstractEventLoop:
+        """Boucle du client, démarrée au premier appel dans un thread de fond"""
+        with self._verrou:
+            if self._boucle is None:
+                boucle = asyncio.new_event_loop()
+                threading.Thread(
+                    target=boucle.run_forever, name='gemini-client', daemon=True
+                ).start()
+                self._semaphore = asyncio.Semaphore(self.appels_simultanes)
+                self._boucle = boucle
+            return self._boucle
+
+    def soumettre(self, prompt: str, pdf: bytes, config: Dict,
+                  echeance: Optional[float] = None) -> concurrent.futures.Future:
+        """Lance un appel depuis n'importe quel thread; future.cancel() l'interrompt"""
+        return asyncio.run_coroutine_threadsafe(
+            self._generer(prompt, pdf, config, echeance), self._demarrer()
+        )
+
+    async def generer(self, prompt: str, pdf: bytes, config: Dict,
+                      echeance: Optional[float] = None) -> ReponseGemini:
+        """Appel depuis une autre boucle asyncio (l'API par exemple)"""
+        return await asyncio.wrap_future(self.soumettre(prompt, pdf, config, echeance))
+
+    def fermer(self):
+        """Arrête la boucle du client (les appels en cours sont abandonnés)"""
+        with self._verrou:
+            if self._boucle is not None:
+                self._boucle.call_soon_threadsafe(self._boucle.stop)
+                self._boucle = None
+
+    async def _generer(self, prompt: str, pdf: bytes, config: Dict,
+                       echeance: Optional[float]) -> ReponseGemini:
+        limite = time.monotonic() + (echeance or self.echeance)
+        self.budget.crediter()
+        tentative = 0
+        async with self._semaphore:
+            GEMINI_EN_VOL.inc()
+            try:
+                while True:
+                    await self.limiteur.attendre()
+                    restant = limite - time.monotonic()
+                    debut = time.perf_counter()
+                    try:
+                        if restant <= 0:
+                            raise asyncio.TimeoutError("Échéance de l'appel Gemini dépassée")
+                        reponse = await asyncio.wait_for(
+                            self.transport.generer(prompt, pdf, config, min(self.delai, restant)),
+                            timeout=min(self.delai, restant)
+                        )
+                        GEMINI_JETONS.inc(reponse.jetons_sortie)
+                        return reponse
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        GEMINI_ERREURS.labels(type(e).__name__).inc()
+                        tentative += 1
+                        if not erreur_transitoire(e) or tentative >= self.tentatives:
+                            raise
+                        attente = random.uniform(0, min(ATTENTE_MAX, ATTENTE_BASE * 2 ** (tentative - 1)))
+                        if time.monotonic() + attente >= limite:
+                            GEMINI_NOUVEAUX_ESSAIS.labels('echeance').inc()
+                            raise
+                        if not self.budget.retirer():
+                            GEMINI_NOUVEAUX_ESSAIS.labels('budget_epuise').inc()
+                            raise
+                        GEMINI_NOUVEAUX_ESSAIS.labels('effectue').inc()
+                        logger.warning(f"⚠️ Appel Gemini échoué ({type(e).__name__}: {e}), "
+                                       f"nouvel essai dans {attente:.1f}s")
+                    finally:
+                        GEMINI_DUREE.observe(time.perf_counter() - debut)
+                    await asyncio.sleep(attente)
+            finally:
+                GEMINI_EN_VOL.dec()
+
+
+_clients: Dict[str, ClientGemini] = {}
+_verrou_clients = threading.Lock()
+
+
+def client_gemini(api_key: Optional[str] = None) -> ClientGemini:
+    """Client partagé du processus pour une clé API (créé au premier appel)"""
+    api_key = api_key or os.getenv('GOOGLE_AI_API_KEY') or os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise ValueError("Clé API Gemini requise (GOOGLE_AI_API_KEY ou GEMINI_API_KEY)")
+    with _verrou_clients:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = ClientGemini(TransportGenAI(api_key))
+        return client
+
+
+def fermer_clients():
+    """Arrête les boucles des clients partagés (arrêt de l'API)"""
+    with _verrou_clients:
+        for client in _clients.values():
+            client.fermer()
+        _clients.clear()
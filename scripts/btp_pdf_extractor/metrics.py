@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Métriques Prometheus de l'extracteur BTP
+
+Partagées par l'extracteur (phases, pages), le client Gemini (appels,
+nouveaux essais) et l'API
+(latence par route, octets reçus, entrées/sorties par requête,
+extractions en cours, admission, cache de résultats).
+
+Sans prometheus_client, toutes les métriques sont inertes et l'extracteur
+fonctionne à l'identique.
+
+Usage:
+    from metrics import PHASE_DUREE, mesurer_phase
+    with mesurer_phase('pdfplumber', 'pages'):
+        ...
+"""
+
+import time
+from contextlib import contextmanager
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+    METRICS_AVAILABLE = True
+except ImportError:
+    METRICS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _MetriqueInerte:
+    """Métrique sans effet utilisée quand prometheus_client est absent"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def _metrique(type_metrique: str, *args, **kwargs):
+    """Crée une métrique Prometheus, ou une métrique inerte"""
+    if not METRICS_AVAILABLE:
+        return _MetriqueInerte()
+    classes = {'counter': Counter, 'gauge': Gauge, 'histogram': Histogram}
+    return classes[type_metrique](*args, **kwargs)
+
+
+# ============================================================================
+# DÉFINITION DES MÉTRIQUES
+# ============================================================================
+
+HTTP_DUREE = _metrique(
+    'histogram', 'btp_http_request_duration_seconds',
+    'Durée des requêtes HTTP par route', ['method', 'route', 'status']
+)
+PHASE_DUREE = _metrique(
+    'histogram', 'btp_extraction_phase_duration_seconds',
+    "Durée des phases d'extraction", ['mode', 'phase'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+OCTETS_RECUS = _metrique('counter', 'btp_uploaded_bytes_total', 'Octets de PDF reçus')
+PAGES_TRAITEES = _metrique('counter', 'btp_pages_processed_total', 'Pages traitées', ['mode'])
+ELEMENTS_EXTRAITS = _metrique('counter', 'btp_elements_extracted_total', 'Éléments extraits', ['mode'])
+DEBIT_PAGES = _metrique(
+    'histogram', 'btp_extraction_pages_per_second',
+    "Débit d'extraction (pages par seconde, par document)", ['mode'],
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 25, 50, 100)
+)
+EXTRACTIONS_EN_COURS = _metrique('gauge', 'btp_extractions_in_progress', 'Extractions en cours')
+PAGES_HYBRIDE = _metrique(
+    'counter', 'btp_hybrid_pages_total', 'Pages du mode hybride par source retenue', ['source']
+)
+PAGES_TRIEES = _metrique(
+    'counter', 'btp_page_triage_total', 'Pages du mode local par contenu estimé avant extraction', ['contenu']
+)
+PAGES_MOTEUR = _metrique(
+    'counter', 'btp_page_engine_total', 'Pages du mode local par moteur de lecture', ['moteur']
+)
+ES_REQUETE = _metrique(
+    'histogram', 'btp_request_io_bytes',
+    "Octets par requête: lus de l'envoi, écrits sur disque, lus par pdfplumber dans le tampon",
+    ['operation'], buckets=(0, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6)
+)
+EXTRACTIONS_PARTAGEES = _metrique(
+    'counter', 'btp_coalesced_requests_total',
+    "Requêtes rattachées à une extraction identique déjà en cours", ['mode']
+)
+ADMISSION_TACHES = _metrique(
+    'gauge', 'btp_admission_jobs', 'Extractions admises ou en file', ['state']
+)
+ADMISSION_MEMOIRE = _metrique(
+    'gauge', 'btp_admission_memory_bytes', 'Mémoire estimée des extractions admises'
+)
+ADMISSION_ATTENTE = _metrique(
+    'histogram', 'btp_admission_wait_seconds',
+    "Attente avant admission, par classe de requête", ['job_class'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+ADMISSION_REFUS = _metrique(
+    'counter', 'btp_admission_rejected_total', "Requêtes refusées par l'admission", ['reason']
+)
+CACHE_REQUETES = _metrique(
+    'counter', 'btp_result_cache_requests_total',
+    'Consultations du cache de résultats (hit, miss, bypass)', ['mode', 'result']
+)
+CACHE_OCTETS = _metrique('gauge', 'btp_result_cache_bytes', 'Taille du cache de résultats sur disque')
+CACHE_EVICTIONS = _metrique(
+    'counter', 'btp_result_cache_evictions_total', 'Entrées retirées du cache', ['reason']
+)
+GEMINI_DUREE = _metrique(
+    'histogram', 'btp_gemini_call_duration_seconds', "Durée des appels à l'API Gemini",
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+GEMINI_ERREURS = _metrique(
+    'counter', 'btp_gemini_errors_total', "Erreurs d'appel ou de réponse Gemini", ['type']
+)
+GEMINI_JETONS = _metrique('counter', 'btp_gemini_output_tokens_total', 'Jetons générés par Gemini')
+GEMINI_EN_VOL = _metrique('gauge', 'btp_gemini_requests_in_flight', 'Appels Gemini en cours')
+GEMINI_NOUVEAUX_ESSAIS = _metrique(
+    'counter', 'btp_gemini_retries_total',
+    'Nouveaux essais Gemini (effectue) ou abandons (budget_epuise, echeance)', ['outcome']
+)
+
+
+@contextmanager
+def mesurer_phase(mode: str, phase: str):
+    """Chronomètre un bloc et l'enregistre comme phase d'extraction"""
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_DUREE.labels(mode, phase).observe(time.perf_counter() - debut)
+
+
+def enregistrer_document(mode: str, nb_pages: int, nb_elements: int, duree: float):
+    """Comptabilise les volumes et le débit d'une extraction terminée"""
+    PAGES_TRAITEES.labels(mode).inc(nb_pages)
+    ELEMENTS_EXTRAITS.labels(mode).inc(nb_elements)
+    if duree > 0 and nb_pages:
+        DEBIT_PAGES.labels(mode).observe(nb_pages / duree)
+
+
+def exporter_metriques() -> bytes:
+    """Métriques au format texte Prometheus (vide si non disponible)"""
+    if not METRICS_AVAILABLE:
+        return b''
+    return generate_latest()
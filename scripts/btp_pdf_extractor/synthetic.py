@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Générateur de DQE PDF synthétiques
+
+PDF minimal écrit directement (police Helvetica standard, aucune
+dépendance): tableaux tracés, détectés par `extract_tables()`, ou texte brut
+pour le repli ligne à ligne. Les titres de lot sont répartis dans le
+tableau et tombent aussi en milieu de document, pour exercer le contexte de
+lot d'une page à l'autre. Des pages "dégradées" (sans filets ni montants,
+comme un scan mal reconnu) exercent le mode hybride. Sert aux benchmarks
+et au test de charge.
+
+TransportGeminiSimule remplace l'API Gemini derrière ClientGemini (tests,
+benchmarks): mêmes réponses JSON que le modèle pour les pages demandées,
+sans réseau.
+
+Usage:
+    python synthetic.py devis.pdf [--pages 50] [--lignes 30] [--texte]
+"""
+
+import re
+import json
+import random
+import asyncio
+import argparse
+import threading
+from typing import Dict, Iterable, List
+
+
+DESIGNATIONS = [
+    "Beton arme dose a 350 kg/m3 pour poteaux",
+    "Maconnerie en agglos de 20x20x40 au RDC",
+    "Enduit ciment sur murs ep. 2 cm",
+    "Carrelage gres cerame 40x40 pose collee",
+    "Peinture acrylique deux couches sur murs",
+    "Fourniture et pose de cable electrique 3G2,5",
+    "Tuyau PVC 110 pour evacuation des eaux usees",
+    "Faux plafond en plaques BA13 sur ossature",
+    "Fouille en rigole pour semelles filantes",
+    "Porte isoplane 83x204 avec quincaillerie",
+]
+LOTS = [
+    "GROS OEUVRE", "MACONNERIE", "REVETEMENTS", "PEINTURE",
+    "ELECTRICITE", "PLOMBERIE", "MENUISERIE", "FAUX PLAFONDS",
+]
+# Unités reconnues aussi par le repli texte brut
+UNITES = ['ml', 'u', 'kg', 'ens', 'ft']
+
+COLONNES = [40, 80, 330, 370, 430, 500, 570]   # Abscisses des filets verticaux
+ENTETES = ["No", "Designation", "U", "Qte", "P.U", "Total"]
+HAUTEUR_LIGNE = 16
+# Texte océrisé: unités telles que lues, séparateurs de milliers variables,
+# montants alignés à droite sur ces abscisses (quantité, P.U, total)
+UNITES_OCR = {'ml': ['ml', 'ML', 'Ml'], 'u': ['u', 'U'], 'kg': ['kg', 'Kg', 'KG'],
+              'ens': ['ens', 'Ens', 'ENS'], 'ft': ['ft', 'Ft', 'FT']}
+SEPARATEURS_OCR = [' ', '.', '']
+BORDS_OCR = [400, 480, 570]
+# Texte courant des pages sans poste (garde, conditions, signatures)
+PARAGRAPHES = [
+    "CONDITIONS GENERALES DU MARCHE",
+    "Les travaux seront executes conformement aux regles de l'art et aux normes",
+    "en vigueur. L'entrepreneur est repute avoir pris connaissance des lieux et",
+    "de toutes les sujetions d'execution. Les prix s'entendent hors taxes et",
+    "comprennent la fourniture, le transport, la mise en oeuvre et le nettoyage.",
+    "Le maitre d'ouvrage se reserve le droit de modifier les quantites.",
+    "Fait a Abidjan, le maitre d'ouvrage et l'entreprise",
+]
+
+
+def _echapper(texte: str) -> str:
+    return texte.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _montant(valeur: int) -> str:
+    """Montant au format FCFA (milliers séparés par des espaces)"""
+    return f"{valeur:,}".replace(',', ' ')
+
+
+def _largeur(texte: str) -> float:
+    """Largeur d'un montant en Helvetica 8 (chiffres 556/1000 em, séparateurs 278)"""
+    return sum(4.448 if c.isdigit() else 2.224 for c in texte)
+
+
+class _Page:
+    """Opérateurs de contenu d'une page"""
+
+    def __init__(self):
+        self.ops: List[str] = []
+
+    def texte(self, x: float, y: float, texte: str):
+        self.ops.append(f"BT /F1 8 Tf {x} {y} Td ({_echapper(texte)}) Tj ET")
+
+    def trait(self, x1: float, y1: float, x2: float, y2: float):
+        self.ops.append(f"{x1} {y1} m {x2} {y2} l S")
+
+    def ligne_tableau(self, y: float, cellules: List[str]):
+        """Ligne tracée; une seule cellule = cellule fusionnée (titre de lot)"""
+        bas, haut = y - 4, y - 4 + HAUTEUR_LIGNE
+        self.trait(COLONNES[0], bas, COLONNES[-1], bas)
+        bords = COLONNES if len(cellules) > 1 else [COLONNES[0], COLONNES[-1]]
+        for x in bords:
+            self.trait(x, bas, x, haut)
+        for x, valeur in zip(COLONNES, cellules):
+            self.texte(x + 2, y, valeur)
+
+    def contenu(self) -> bytes:
+        return "\n".join(self.ops).encode('latin-1')
+
+
+def generer_pdf(nb_pages: int = 3, lignes_par_page: int = 30, tableau: bool = True,
+                lignes_par_lot: int = 45, seed: int = 0,
+                pages_degradees: Iterable[int] = (), pages_texte: Iterable[int] = (),
+                ocr: bool = False, fond_ko: int = 0) -> bytes:
+    """
+    Génère un DQE PDF.
+
+    Args:
+        nb_pages: Nombre de pages
+        lignes_par_page: Postes par page (titres de lot inclus)
+        tableau: Tableaux tracés (True) ou texte brut (False)
+        lignes_par_lot: Postes par lot, indépendamment des pages
+        seed: Graine du contenu (deux graines = deux fichiers distincts)
+        pages_degradees: Pages (à partir de 0) sans filets ni montants:
+            l'extraction locale n'y retrouve pas les postes
+        pages_texte: Pages (à partir de 0) de texte courant, sans poste
+        ocr: Texte brut en colonnes, comme un scan océrisé: casse des unités
+            et séparateurs de milliers variables, montants alignés à
+            droite, une quantité sur dix manquante (tableau=False)
+        fond_ko: Image de fond de chaque page en Ko (page scannée puis
+            océrisée): pdfminer garde ces flux en cache tant que le PDF
+            est ouvert
+    """
+    pages_degradees = set(pages_degradees)
+    pages_texte = set(pages_texte)
+    contenus = []
+    poste = 0
+    for numero_page in range(nb_pages):
+        page = _Page()
+        y = 800
+        if numero_page in pages_texte:
+            for i in range(lignes_par_page):
+                page.texte(40, y - i * HAUTEUR_LIGNE, PARAGRAPHES[i % len(PARAGRAPHES)])
+            contenus.append(page.contenu())
+            continue
+        degradee = numero_page in pages_degradees
+        if tableau and not degradee:
+            page.ligne_tableau(y, ENTETES)
+            page.trait(COLONNES[0], y + 12, COLONNES[-1], y + 12)
+        for _ in range(lignes_par_page):
+            y -= HAUTEUR_LIGNE
+            if poste % lignes_par_lot == 0:
+                numero_lot = poste // lignes_par_lot + 1
+                titre = f"LOT {numero_lot} : {LOTS[(numero_lot - 1) % len(LOTS)]}"
+                if tableau and not degradee:
+                    page.ligne_tableau(y, [titre])
+                else:
+                    page.texte(40, y, titre)
+                poste += 1
+                continue
+            # Même tirage par poste que TransportGeminiSimule (graine 0)
+            rnd = random.Random(poste + seed * 1_000_003)
+            quantite = rnd.randint(1, 300)
+            prix = rnd.randint(1000, 90000)
+            cellules = [
+                f"{poste // lignes_par_lot + 1}.{poste % lignes_par_lot}",
+                f"{rnd.choice(DESIGNATIONS)} {poste}",
+                rnd.choice(UNITES),
+                str(quantite),
+                _montant(prix),
+                _montant(quantite * prix),
+            ]
+            if degradee:
+                page.texte(40, y, "  ".join(cellules[:3]))
+            elif ocr and not tableau:
+                # Tirage distinct: le contenu reste celui de TransportGeminiSimule
+                bruit = random.Random(f"ocr-{poste}-{seed}")
+                page.texte(40, y, cellules[0])
+                page.texte(80, y, cellules[1])
+                page.texte(330, y, bruit.choice(UNITES_OCR[cellules[2]]))
+                separateur = bruit.choice(SEPARATEURS_OCR)
+                montants = [m.replace(' ', separateur) for m in cellules[3:]]
+                if bruit.random() < 0.1:
+                    montants[0] = ''
+                for bord, montant in zip(BORDS_OCR, montants):
+                    if montant:
+                        page.texte(round(bord - _largeur(montant), 3), y, montant)
+            elif tableau:
+                page.ligne_tableau(y, cellules)
+            else:
+                page.texte(40, y, "  ".join(cellules))
+            poste += 1
+        contenus.append(page.contenu())
+
+    # Objets: 1 catalogue, 2 arbre des pages, 3 police, puis page/contenu(/image)
+    pas = 3 if fond_ko else 2
+    enfants = " ".join(f"{4 + pas * i} 0 R" for i in range(nb_pages))
+    objets = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{enfants}] /Count {nb_pages} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, contenu in enumerate(contenus):
+        image = ''
+        if fond_ko:
+            image = f"/XObject << /Im1 {6 + pas * i} 0 R >> "
+            contenu = b"q 612 0 0 842 0 0 cm /Im1 Do Q\n" + contenu
+        objets.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> {image}>> /Contents {5 + pas * i} 0 R >>".encode()
+        )
+        objets.append(b"<< /Length %d >>\nstream\n" % len(contenu) + contenu + b"\nendstream")
+        if fond_ko:
+            pixels = random.Random(f"fond-{i}-{seed}").randbytes(1024 * fond_ko)
+            objets.append(
+                b"<< /Type /XObject /Subtype /Image /Width 1024 /Height %d /ColorSpace /DeviceGray "
+                b"/BitsPerComponent 8 /Length %d >>\nstream\n" % (fond_ko, len(pixels))
+                + pixels + b"\nendstream"
+            )
+
+    sortie = [b"%PDF-1.4\n"]
+    position = len(sortie[0])
+    positions = []
+    for numero, objet in enumerate(objets, start=1):
+        bloc = b"%d 0 obj\n" % numero + objet + b"\nendobj\n"
+        positions.append(position)
+        sortie.append(bloc)
+        position += len(bloc)
+    xref = [f"xref\n0 {len(objets) + 1}\n0000000000 65535 f \n"]
+    xref += [f"{p:010d} 00000 n \n" for p in positions]
+    sortie.append("".join(xref).encode())
+    sortie.append(
+        f"trailer\n<< /Size {len(objets) + 1} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n".encode()
+    )
+    return b"".join(sortie)
+
+
+class TransportGeminiSimule:
+    """
+    Transport local pour gemini_client.ClientGemini. Répond pour les pages
+    annoncées par le prompt (document entier sinon) avec des postes
+    déterministes: les postes précédant le premier titre de lot visible
+    n'ont pas de lot, comme le ferait le modèle. La latence est
+    proportionnelle aux jetons générés et la réponse est tronquée au-delà de
+    max_output_tokens.
+    """
+
+    def __init__(self, postes_par_page: int = 25, lignes_par_lot: int = 45,
+                 jetons_par_poste: int = 60, secondes_par_jeton: float = 0.0,
+                 echecs: int = 0, doublons: bool = False):
+        """
+        Args:
+            echecs: Nombre de premiers appels en erreur (nouveaux essais)
+            doublons: Répète en tête de lot le dernier poste de la page
+                précédente (poste coupé par la limite de pages)
+        """
+        self.postes_par_page = postes_par_page
+        self.lignes_par_lot = lignes_par_lot
+        self.jetons_par_poste = jetons_par_poste
+        self.secondes_par_jeton = secondes_par_jeton
+        self.echecs = echecs
+        self.doublons = doublons
+        self.appels = 0
+        self.tronquees = 0
+        self._verrou = threading.Lock()
+
+    def postes(self, premiere: int, derniere: int) -> List[Dict]:
+        """Postes des pages premiere..derniere (numérotées à partir de 1)"""
+        elements = []
+        lot = (None, None)
+        debut = (premiere - 1) * self.postes_par_page
+        if self.doublons and premiere > 1:
+            debut -= 1
+        for ligne in range(debut, derniere * self.postes_par_page):
+            numero_lot = ligne // self.lignes_par_lot + 1
+            if ligne % self.lignes_par_lot == 0:
+                lot = (str(numero_lot), LOTS[(numero_lot - 1) % len(LOTS)])
+                continue
+            rnd = random.Random(ligne)
+            quantite = rnd.randint(1, 300)
+            prix = rnd.randint(1000, 90000)
+            elements.append({
+                "numero": f"{numero_lot}.{ligne % self.lignes_par_lot}",
+                "designation": f"{rnd.choice(DESIGNATIONS)} {ligne}",
+                "categorie": None,
+                "unite": rnd.choice(UNITES),
+                "quantite": quantite,
+                "prix_unitaire": prix,
+                "prix_total": quantite * prix,
+                "lot_numero": lot[0],
+                "lot_nom": lot[1],
+            })
+        return elements
+
+    async def generer(self, prompt: str, pdf: bytes, config: Dict, delai: float):
+        from gemini_client import ReponseGemini
+        from extractor import compter_pages_pdf
+
+        with self._verrou:
+            self.appels += 1
+            echec = self.appels <= self.echecs
+        if echec:
+            raise ConnectionError("Erreur simulée")
+
+        total = compter_pages_pdf(pdf)
+        plage = re.search(r"pages (\d+) à (\d+) d'un document de (\d+) pages", prompt)
+        premiere, derniere = (int(plage.group(1)), int(plage.group(2))) if plage else (1, total)
+        if plage:
+            total = int(plage.group(3))
+
+        elements = self.postes(premiere, derniere)
+        texte = json.dumps({
+            "nb_pages": derniere - premiere + 1,
+            "total_general": sum(e["prix_total"] for e in self.postes(1, total)) if derniere == total else 0,
+            "devise": "FCFA",
+            "elements": elements,
+        }, ensure_ascii=False)
+
+        jetons = len(elements) * self.jetons_par_poste
+        tronquee = jetons > config.get('max_output_tokens', jetons)
+        if tronquee:
+            with self._verrou:
+                self.tronquees += 1
+            texte = texte[:int(len(texte) * config['max_output_tokens'] / jetons)]
+            jetons = config['max_output_tokens']
+        await asyncio.sleep(jetons * self.secondes_par_jeton)
+        return ReponseGemini(texte, jetons, tronquee)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Génère un DQE PDF synthétique')
+    parser.add_argument('sortie', help='Fichier PDF à écrire')
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--lignes', type=int, default=30, help='Postes par page')
+    parser.add_argument('--texte', action='store_true', help='Texte brut au lieu de tableaux')
+    parser.add_argument('--ocr', action='store_true', help='Texte brut en colonnes, comme un scan océrisé')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    contenu = generer_pdf(args.pages, args.lignes, tableau=not (args.texte or args.ocr), seed=args.seed,
+                          ocr=args.ocr)
+    with open(args.sortie, 'wb') as f:
+        f.write(contenu)
+    print(f"✅ {args.sortie}: {args.pages} pages, {len(contenu) / 1024:.0f} Ko")
+
+
+if __name__ == '__main__':
+    main()
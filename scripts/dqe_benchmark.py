@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de l'API DQE (dqe_api / dqe_extractor_v2)
+
+Usage:
+    python scripts/dqe_benchmark.py serialisation [--items 10000] [--repeat 5]
+    python scripts/dqe_benchmark.py ordonnancement [--petits 40] [--gros 8]
+    python scripts/dqe_benchmark.py demarrage [--module dqe_api] [--budget-ms 600]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import random
+import argparse
+import subprocess
+from dataclasses import asdict
+from statistics import median
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dqe_extractor_v2 import (  # noqa: E402
+    DQEExtractorV2, DQEItem, DQECategory, DQESheet, dumps_json, ORJSON_AVAILABLE
+)
+
+
+# =============================================================================
+# DONNÉES SYNTHÉTIQUES
+# =============================================================================
+
+def generer_extracteur(nb_items: int, nb_onglets: int = 10, seed: int = 42) -> DQEExtractorV2:
+    """Construit un extracteur dont les résultats sont déjà en mémoire"""
+    rnd = random.Random(seed)
+    extractor = DQEExtractorV2.__new__(DQEExtractorV2)
+    extractor.filepath = 'synthetique.xlsx'
+    extractor.results = []
+
+    par_onglet = max(nb_items // nb_onglets, 1)
+    for s in range(nb_onglets):
+        categories = []
+        for c in range(10):
+            items = [
+                DQEItem(
+                    code=f"{c}.{i}",
+                    designation=f"Fourniture et pose article {rnd.randint(1, 500)} béton dosé à 350 kg/m³",
+                    unite=rnd.choice(['M2', 'ML', 'U', 'KG', 'M3']),
+                    quantite=rnd.uniform(1, 500),
+                    prix_unitaire=rnd.uniform(100, 90000),
+                    montant_total=rnd.uniform(1000, 9000000),
+                    category=f"CATEGORIE {c}"
+                )
+                for i in range(par_onglet // 10)
+            ]
+            categories.append(DQECategory(name=f"CATEGORIE {c}", items=items, subtotal=1000.0))
+        extractor.results.append(DQESheet(
+            sheet_name=f"N° {s}", sheet_type='detailed', building_ref=str(s),
+            date='12 janvier 2024', categories=categories, metadata={'devis_ref': '2024-01'}
+        ))
+    return extractor
+
+
+# =============================================================================
+# CHEMINS COMPARÉS
+# =============================================================================
+
+def chemin_historique(extractor: DQEExtractorV2) -> bytes:
+    """asdict() par item + jsonable_encoder + json (comportement d'origine)"""
+    from fastapi.encoders import jsonable_encoder
+
+    stats = {"processed": len(extractor.results), "success": len(extractor.results), "errors": []}
+    result = {
+        "status": "success",
+        "extraction_info": {"sheets_extracted": len(extractor.results), "stats": stats},
+        "data": {
+            "source_file": extractor.filepath,
+            "sheets": [
+                {
+                    'sheet_name': sheet.sheet_name,
+                    'categories': [
+                        {
+                            'name': cat.name,
+                            'items': [{k: v for k, v in asdict(item).items() if v is not None}
+                                      for item in cat.items],
+                            'items_count': len(cat.items)
+                        }
+                        for cat in sheet.categories
+                    ]
+                }
+                for sheet in extractor.results
+            ]
+        }
+    }
+    return json.dumps(jsonable_encoder(result), ensure_ascii=False).encode('utf-8')
+
+
+def chemin_rapide(extractor: DQEExtractorV2) -> bytes:
+    """_format_extraction_result + dumps_json (chemin actuel de l'API)"""
+    stats = {"processed": len(extractor.results), "success": len(extractor.results), "errors": []}
+    return dumps_json(extractor._format_extraction_result(True, stats))
+
+
+def mesurer(fn, *args, repeat: int = 5) -> float:
+    """Temps médian d'exécution en millisecondes"""
+    durees = []
+    for _ in range(repeat):
+        debut = time.perf_counter()
+        fn(*args)
+        durees.append((time.perf_counter() - debut) * 1000)
+    return median(durees)
+
+
+def bench_serialisation(args):
+    extractor = generer_extracteur(args.items)
+    taille = len(chemin_rapide(extractor))
+
+    t_hist = mesurer(chemin_historique, extractor, repeat=args.repeat)
+    t_rapide = mesurer(chemin_rapide, extractor, repeat=args.repeat)
+
+    print(f"Items: {args.items} | JSON: {taille / 1024:.0f} Ko | orjson: {ORJSON_AVAILABLE}")
+    print(f"  historique (asdict + jsonable_encoder + json): {t_hist:8.1f} ms")
+    print(f"  rapide (vars + dumps_json):                    {t_rapide:8.1f} ms")
+    print(f"  gain: x{t_hist / t_rapide:.1f}")
+
+
+# =============================================================================
+# ORDONNANCEMENT DE LA FILE D'ADMISSION
+# =============================================================================
+
+async def simuler_charge(petits: int, gros: int, sjf: bool, seed: int = 7) -> dict:
+    """
+    Soumet un mélange de petits et gros classeurs à l'AdmissionController
+    (2 places) et mesure l'attente de chaque tâche. Sans SJF, toutes les
+    tâches ont le même coût: la file est servie en FIFO.
+    """
+    from dqe_api import AdmissionController
+
+    rnd = random.Random(seed)
+    controller = AdmissionController(
+        max_concurrent=2, memory_budget=10**12, max_queue=10**6,
+        client_share=1.0, queue_timeout=3600
+    )
+    attentes = {"petit": [], "gros": []}
+
+    async def tache(genre: str, lignes: int, duree: float):
+        debut = time.perf_counter()
+        async with controller.admit("client", 1, cost=lignes if sjf else 0):
+            attentes[genre].append(time.perf_counter() - debut)
+            await asyncio.sleep(duree)
+
+    jobs = [("gros", 30000, 0.2)] * gros + [("petit", 300, 0.01)] * petits
+    rnd.shuffle(jobs)
+    taches = []
+    for genre, lignes, duree in jobs:
+        taches.append(asyncio.create_task(tache(genre, lignes, duree)))
+        await asyncio.sleep(0.001)
+    await asyncio.gather(*taches)
+    return attentes
+
+
+def bench_ordonnancement(args):
+    print(f"Petits classeurs: {args.petits} (10 ms) | Gros: {args.gros} (200 ms) | 2 places")
+    for sjf in (False, True):
+        attentes = asyncio.run(simuler_charge(args.petits, args.gros, sjf))
+        petits = sorted(attentes["petit"])
+        gros = sorted(attentes["gros"])
+        print(
+            f"  {'SJF + vieillissement' if sjf else 'FIFO':20s}"
+            f" petits: médiane {median(petits) * 1000:6.0f} ms, p95 {petits[int(len(petits) * 0.95)] * 1000:6.0f} ms"
+            f" | gros: médiane {median(gros) * 1000:6.0f} ms, max {gros[-1] * 1000:6.0f} ms"
+        )
+
+
+# =============================================================================
+# TEMPS D'IMPORT
+# =============================================================================
+
+# Bibliothèques qui ne doivent pas être chargées à l'import de l'API
+IMPORTS_DIFFERES = ('pandas', 'openpyxl')
+
+
+def mesurer_import(module: str) -> tuple:
+    """
+    Importe `module` dans un interpréteur neuf avec `-X importtime`.
+
+    Returns:
+        (durée cumulée en ms, {dépendance directe: ms}, modules chargés)
+    """
+    racine = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         f'import {module}, sys, json; print(json.dumps(sorted(sys.modules)))'],
+        cwd=racine, capture_output=True, text=True, check=True
+    )
+    # Les dépendances sont listées avant le module qui les importe
+    total = 0.0
+    dependances, enfants = {}, {}
+    for ligne in proc.stderr.splitlines():
+        if not ligne.startswith('import time:') or '|' not in ligne:
+            continue
+        _, cumul, nom = ligne.split('|', 2)
+        if not cumul.strip().isdigit():
+            continue  # En-tête
+        profondeur = (len(nom) - len(nom.lstrip())) // 2
+        if profondeur == 1:
+            enfants[nom.strip()] = int(cumul) / 1000
+        elif profondeur == 0:
+            if nom.strip() == module:
+                total, dependances = int(cumul) / 1000, enfants
+            enfants = {}
+    return total, dependances, json.loads(proc.stdout.splitlines()[-1])
+
+
+def bench_demarrage(args):
+    mesures = [mesurer_import(args.module) for _ in range(args.repeat)]
+    total, dependances, modules = min(mesures, key=lambda m: m[0])
+
+    print(f"Import de {args.module}: {total:.0f} ms (meilleur de {args.repeat})")
+    for nom, ms in sorted(dependances.items(), key=lambda d: -d[1])[:args.top]:
+        print(f"  {nom:40s} {ms:8.1f} ms")
+
+    erreurs = [f"{nom} importé au chargement" for nom in IMPORTS_DIFFERES if nom in modules]
+    if args.budget_ms is not None and total > args.budget_ms:
+        erreurs.append(f"budget dépassé: {total:.0f} ms > {args.budget_ms:.0f} ms")
+    for erreur in erreurs:
+        print(f"ÉCHEC: {erreur}")
+    sys.exit(1 if erreurs else 0)
+
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks API DQE')
+    sub = parser.add_subparsers(dest='commande', required=True)
+
+    p = sub.add_parser('serialisation', help='Chemin de sérialisation des résultats')
+    p.add_argument('--items', type=int, default=10000)
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_serialisation)
+
+    p = sub.add_parser('ordonnancement', help="Attente en file: FIFO vs plus court d'abord")
+    p.add_argument('--petits', type=int, default=40)
+    p.add_argument('--gros', type=int, default=8)
+    p.set_defaults(func=bench_ordonnancement)
+
+    p = sub.add_parser('demarrage', help="Temps d'import (échoue au-delà du budget)")
+    p.add_argument('--module', default='dqe_api')
+    p.add_argument('--budget-ms', type=float, default=None)
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--top', type=int, default=10)
+    p.set_defaults(func=bench_demarrage)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Test de charge HTTP des API d'extraction (dqe_api et API PDF BTP)
+
+Rejoue le parcours complet avec des fichiers synthétiques, à concurrence et
+mélange de tailles configurables:
+    dqe: upload → sheets → select → extract → download → delete
+    pdf: extract (mode local)
+
+L'application tourne dans le processus (httpx + ASGITransport, démarrage
+et arrêt compris) ou derrière un serveur existant (--url). Le rapport donne
+le débit, les latences p50/p95/p99 par endpoint, les taux d'erreur et la
+mémoire résidente du serveur; --output l'enregistre en JSON pour comparer
+d'un commit à l'autre (--baseline).
+
+Usage:
+    python scripts/load_test.py dqe [--concurrence 8] [--parcours 40] [--mix petit=6,moyen=3,gros=1]
+    python scripts/load_test.py pdf --url http://localhost:8001 --output pdf.json
+    python scripts/load_test.py dqe --output apres.json --baseline avant.json
+
+Les envois simultanés d'un même fichier sont mutualisés par les API:
+--variantes fixe le nombre de fichiers distincts générés par taille.
+
+Dépendance: httpx (pip install httpx)
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+
+RACINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DOSSIER_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'btp_pdf_extractor')
+
+
+# =============================================================================
+# FICHIERS SYNTHÉTIQUES
+# =============================================================================
+
+# Tailles: (onglets, lignes par onglet) pour dqe, (pages, postes par page) pour pdf
+TAILLES = {
+    'dqe': {'petit': (3, 60), 'moyen': (8, 300), 'gros': (20, 1000)},
+    'pdf': {'petit': (2, 30), 'moyen': (10, 30), 'gros': (40, 30)},
+}
+
+CATEGORIES_DQE = ['MACONNERIES', 'PEINTURE', 'ELECTRICITE', 'PLOMBERIE', 'CARRELAGE']
+UNITES_DQE = ['M2', 'ML', 'U', 'KG', 'M3']
+
+
+def generer_classeur(nb_onglets: int, lignes: int, seed: int = 0) -> bytes:
+    """Classeur DQE: un onglet RECAP puis des onglets détaillés par bâtiment"""
+    from openpyxl import Workbook
+
+    rnd = random.Random(seed)
+    wb = Workbook()
+    wb.remove(wb.active)
+    recap = wb.create_sheet("RECAP")
+    recap.append(["RECAPITULATIF GENERAL"])
+    recap.append(["N°", "DESIGNATION", "MONTANT"])
+    for s in range(1, nb_onglets):
+        ws = wb.create_sheet(f"N° {s} BAT {s}")
+        ws.append(["Libreville le 12 janvier 2024"])
+        ws.append([f"BAT : {s}A"])
+        ws.append([f"Devis N° 2024-{seed:03d}"])
+        ws.append(["N°", "DESIGNATION", "UNITE", "QUANTITE", "PRIX UNITAIRE", "MONTANT"])
+        total_onglet = 0
+        for categorie in CATEGORIES_DQE:
+            ws.append([None, categorie])
+            sous_total = 0
+            for i in range(lignes // len(CATEGORIES_DQE)):
+                quantite, prix = rnd.randint(1, 500), rnd.randint(100, 90000)
+                ws.append([
+                    str(i + 1),
+                    f"Fourniture et pose de {categorie.lower()} article {rnd.randint(1, 30)}",
+                    rnd.choice(UNITES_DQE), quantite, prix, quantite * prix
+                ])
+                sous_total += quantite * prix
+            ws.append([None, "SOUS TOTAL", None, None, None, sous_total])
+            total_onglet += sous_total
+        recap.append([str(s), f"BATIMENT {s}", total_onglet])
+
+    tampon = io.BytesIO()
+    wb.save(tampon)
+    return tampon.getvalue()
+
+
+def generer_fichiers(cible: str, tailles: List[str], variantes: int) -> Dict[str, List[bytes]]:
+    """Fichiers distincts (graines différentes) pour chaque taille du mélange"""
+    if cible == 'pdf':
+        sys.path.insert(0, DOSSIER_PDF)
+        from synthetic import generer_pdf
+
+    fichiers = {}
+    for taille in tailles:
+        a, b = TAILLES[cible][taille]
+        if cible == 'dqe':
+            fichiers[taille] = [generer_classeur(a, b, seed) for seed in range(variantes)]
+        else:
+            fichiers[taille] = [generer_pdf(a, b, seed=seed) for seed in range(variantes)]
+    return fichiers
+
+
+# =============================================================================
+# PARCOURS
+# =============================================================================
+
+class Mesures:
+    """Latences et statuts par endpoint"""
+
+    def __init__(self):
+        self.latences: Dict[str, List[float]] = {}
+        self.statuts: Dict[str, Dict[str, int]] = {}
+        self.parcours_reussis = 0
+        self.parcours_echoues = 0
+
+    async def appeler(self, client: httpx.AsyncClient, endpoint: str, methode: str,
+                      url: str, **kwargs) -> Optional[httpx.Response]:
+        """Exécute une requête; None si elle a échoué (le parcours s'arrête)"""
+        debut = time.perf_counter()
+        try:
+            reponse = await client.request(methode, url, **kwargs)
+            statut = str(reponse.status_code)
+        except httpx.HTTPError as e:
+            reponse, statut = None, type(e).__name__
+        self.latences.setdefault(endpoint, []).append(time.perf_counter() - debut)
+        compteur = self.statuts.setdefault(endpoint, {})
+        compteur[statut] = compteur.get(statut, 0) + 1
+        if reponse is None or reponse.status_code >= 400:
+            return None
+        return reponse
+
+
+async def parcours_dqe(client: httpx.AsyncClient, mesures: Mesures, nom: str, contenu: bytes,
+                       en_tetes: Dict[str, str]) -> bool:
+    type_mime = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    r = await mesures.appeler(client, 'POST /dqe/upload', 'POST', '/dqe/upload',
+                              files={'file': (nom, contenu, type_mime)}, headers=en_tetes)
+    if r is None:
+        return False
+    session_id = r.json()['session_id']
+    base = f'/dqe/{session_id}'
+    etapes = [
+        ('GET /dqe/{id}/sheets', 'GET', f'{base}/sheets', {}),
+        ('POST /dqe/{id}/select', 'POST', f'{base}/select', {'json': {'sheet_types': ['detailed']}}),
+        ('POST /dqe/{id}/extract', 'POST', f'{base}/extract', {'json': {}}),
+        ('GET /dqe/{id}/download', 'GET', f'{base}/download', {}),
+    ]
+    try:
+        for endpoint, methode, url, kwargs in etapes:
+            if await mesures.appeler(client, endpoint, methode, url, headers=en_tetes, **kwargs) is None:
+                return False
+        return True
+    finally:
+        await mesures.appeler(client, 'DELETE /dqe/{id}', 'DELETE', base, headers=en_tetes)
+
+
+async def parcours_pdf(client: httpx.AsyncClient, mesures: Mesures, nom: str, contenu: bytes,
+                       en_tetes: Dict[str, str]) -> bool:
+    r = await mesures.appeler(client, 'POST /extract', 'POST', '/extract',
+                              params={'mode': 'local'}, headers=en_tetes,
+                              files={'file': (nom, contenu, 'application/pdf')})
+    return r is not None
+
+
+PARCOURS = {'dqe': parcours_dqe, 'pdf': parcours_pdf}
+
+
+# =============================================================================
+# MÉMOIRE DU SERVEUR
+# =============================================================================
+
+def _rss_processus(pid: int) -> int:
+    with open(f'/proc/{pid}/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def rss_local() -> Optional[int]:
+    """RSS du processus et de ses enfants (workers du pool), Linux uniquement"""
+    try:
+        total = _rss_processus(os.getpid())
+        for tache in os.listdir(f'/proc/{os.getpid()}/task'):
+            with open(f'/proc/{os.getpid()}/task/{tache}/children') as f:
+                for pid in f.read().split():
+                    total += _rss_processus(int(pid))
+        return total
+    except (OSError, ValueError):
+        return None
+
+
+async def rss_distant(client: httpx.AsyncClient) -> Optional[int]:
+    """process_resident_memory_bytes exposé par /metrics (prometheus_client)"""
+    try:
+        reponse = await client.get('/metrics')
+    except httpx.HTTPError:
+        return None
+    for ligne in reponse.text.splitlines():
+        if ligne.startswith('process_resident_memory_bytes '):
+            return int(float(ligne.split()[1]))
+    return None
+
+
+async def echantillonner_rss(client: httpx.AsyncClient, local: bool, periode: float,
+                             echantillons: List[int]):
+    while True:
+        rss = rss_local() if local else await rss_distant(client)
+        if rss is not None:
+            echantillons.append(rss)
+        await asyncio.sleep(periode)
+
+
+# =============================================================================
+# EXÉCUTION
+# =============================================================================
+
+def charger_app(cible: str):
+    """Application ASGI importée dans le processus"""
+    if cible == 'dqe':
+        sys.path.insert(0, RACINE)
+        import dqe_api
+        return dqe_api.app
+    sys.path.insert(0, DOSSIER_PDF)
+    import api
+    return api.app
+
+
+def analyser_mix(mix: str, cible: str) -> Dict[str, float]:
+    poids = {}
+    for element in mix.split(','):
+        taille, _, valeur = element.partition('=')
+        if taille not in TAILLES[cible]:
+            raise SystemExit(f"Taille inconnue: {taille} (choix: {', '.join(TAILLES[cible])})")
+        poids[taille] = float(valeur or 1)
+    return poids
+
+
+def percentile(valeurs: List[float], q: float) -> float:
+    """Percentile au rang le plus proche (valeurs triées)"""
+    return valeurs[min(len(valeurs) - 1, int(len(valeurs) * q))]
+
+
+async def executer(args) -> dict:
+    mix = analyser_mix(args.mix, args.cible)
+    print(f"Génération des fichiers ({args.variantes} par taille)...")
+    fichiers = generer_fichiers(args.cible, list(mix), args.variantes)
+    extension = 'xlsx' if args.cible == 'dqe' else 'pdf'
+    parcours = PARCOURS[args.cible]
+
+    if args.url:
+        transport, base_url, local = None, args.url, False
+        lifespan = _sans_lifespan()
+    else:
+        app = charger_app(args.cible)
+        transport, base_url, local = httpx.ASGITransport(app=app), 'http://charge', True
+        lifespan = app.router.lifespan_context(app)
+
+    async with lifespan, httpx.AsyncClient(transport=transport, base_url=base_url,
+                                           timeout=args.timeout) as client:
+        # Échauffement (non mesuré): pool, imports, caches
+        jetable = Mesures()
+        for taille in mix:
+            for i in range(args.echauffement):
+                await parcours(client, jetable, f'echauffement_{taille}.{extension}',
+                               fichiers[taille][i % args.variantes], {'X-Client-Id': 'echauffement'})
+
+        mesures = Mesures()
+        rss: List[int] = []
+        echantillonneur = asyncio.create_task(echantillonner_rss(client, local, args.periode_rss, rss))
+        rnd = random.Random(args.seed)
+        tirages = rnd.choices(list(mix), weights=list(mix.values()), k=args.parcours)
+        suivant = iter(enumerate(tirages))
+
+        async def utilisateur(numero: int):
+            # Un client par utilisateur virtuel: la part par client de l'admission s'applique
+            en_tetes = {'X-Client-Id': f'charge-{numero}'}
+            for index, taille in suivant:
+                contenu = fichiers[taille][index % args.variantes]
+                nom = f'{taille}_{index}.{extension}'
+                ok = await parcours(client, mesures, nom, contenu, en_tetes)
+                if ok:
+                    mesures.parcours_reussis += 1
+                else:
+                    mesures.parcours_echoues += 1
+
+        debut = time.perf_counter()
+        await asyncio.gather(*(utilisateur(n) for n in range(args.concurrence)))
+        duree = time.perf_counter() - debut
+        echantillonneur.cancel()
+        if local and (fin := rss_local()) is not None:
+            rss.append(fin)
+
+    return construire_rapport(args, mix, mesures, duree, rss)
+
+
+class _sans_lifespan:
+    """Contexte vide (serveur distant: démarrage géré par uvicorn)"""
+
+    async def __aenter__(self):
+        return None
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+# =============================================================================
+# RAPPORT
+# =============================================================================
+
+def commit_courant() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RACINE,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def construire_rapport(args, mix: Dict[str, float], mesures: Mesures, duree: float,
+                       rss: List[int]) -> dict:
+    endpoints = {}
+    for endpoint, latences in mesures.latences.items():
+        latences = sorted(latences)
+        statuts = mesures.statuts[endpoint]
+        erreurs = sum(n for s, n in statuts.items() if not (s.isdigit() and int(s) < 400))
+        endpoints[endpoint] = {
+            'requetes': len(latences),
+            'erreurs': erreurs,
+            'taux_erreur': round(erreurs / len(latences), 4),
+            'debit_par_s': round(len(latences) / duree, 2),
+            'p50_ms': round(percentile(latences, 0.50) * 1000, 1),
+            'p95_ms': round(percentile(latences, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latences, 0.99) * 1000, 1),
+            'max_ms': round(latences[-1] * 1000, 1),
+            'statuts': statuts,
+        }
+    total = mesures.parcours_reussis + mesures.parcours_echoues
+    return {
+        'cible': args.cible,
+        'serveur': args.url or 'asgi',
+        'commit': commit_courant(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'parametres': {
+            'concurrence': args.concurrence, 'parcours': args.parcours, 'mix': mix,
+            'variantes': args.variantes, 'seed': args.seed,
+        },
+        'duree_s': round(duree, 2),
+        'parcours': {
+            'total': total,
+            'reussis': mesures.parcours_reussis,
+            'taux_erreur': round(mesures.parcours_echoues / total, 4) if total else 0.0,
+            'debit_par_s': round(total / duree, 2),
+            'requetes_par_s': round(sum(e['requetes'] for e in endpoints.values()) / duree, 2),
+        },
+        'endpoints': endpoints,
+        'rss_mo': {
+            'max': round(max(rss) / 1024 ** 2, 1),
+            'moyen': round(sum(rss) / len(rss) / 1024 ** 2, 1),
+            'fin': round(rss[-1] / 1024 ** 2, 1),
+        } if rss else None,
+    }
+
+
+def afficher_rapport(rapport: dict, reference: Optional[dict] = None):
+    p = rapport['parcours']
+    print(f"\n{rapport['cible']} ({rapport['serveur']}, commit {rapport['commit']}): "
+          f"{p['total']} parcours en {rapport['duree_s']} s")
+    print(f"  débit: {p['debit_par_s']} parcours/s, {p['requetes_par_s']} requêtes/s"
+          f" | échecs: {p['taux_erreur'] * 100:.1f} %")
+    if rapport['rss_mo']:
+        r = rapport['rss_mo']
+        print(f"  RSS serveur: max {r['max']} Mo, moyenne {r['moyen']} Mo, fin {r['fin']} Mo")
+
+    print(f"\n  {'endpoint':28s} {'req':>5s} {'err %':>6s} {'p50':>8s} {'p95':>8s} {'p99':>8s}")
+    for endpoint, e in rapport['endpoints'].items():
+        ligne = (f"  {endpoint:28s} {e['requetes']:5d} {e['taux_erreur'] * 100:6.1f}"
+                 f" {e['p50_ms']:8.1f} {e['p95_ms']:8.1f} {e['p99_ms']:8.1f}")
+        avant = (reference or {}).get('endpoints', {}).get(endpoint)
+        if avant and avant['p95_ms']:
+            ligne += f"   p95 {(e['p95_ms'] / avant['p95_ms'] - 1) * 100:+.0f} %"
+        print(ligne)
+    if reference:
+        avant = reference['parcours']['debit_par_s']
+        if avant:
+            print(f"\n  débit vs {reference.get('commit')}: {(p['debit_par_s'] / avant - 1) * 100:+.0f} %")
+
+
+# =============================================================================
+# POINT D'ENTRÉE
+# =============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge des API d'extraction")
+    parser.add_argument('cible', choices=['dqe', 'pdf'])
+    parser.add_argument('--url', default=None, help='Serveur existant (défaut: application dans le processus)')
+    parser.add_argument('--concurrence', type=int, default=8, help='Utilisateurs simultanés')
+    parser.add_argument('--parcours', type=int, default=40, help='Nombre total de parcours')
+    parser.add_argument('--mix', default='petit=6,moyen=3,gros=1', help='Poids des tailles de fichier')
+    parser.add_argument('--variantes', type=int, default=4, help='Fichiers distincts par taille')
+    parser.add_argument('--echauffement', type=int, default=1, help='Parcours non mesurés par taille')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--periode-rss', type=float, default=0.5, help='Échantillonnage RSS (s)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Rapport JSON à écrire')
+    parser.add_argument('--baseline', help='Rapport JSON de référence à comparer')
+    args = parser.parse_args()
+
+    rapport = asyncio.run(executer(args))
+    reference = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            reference = json.load(f)
+    afficher_rapport(rapport, reference)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(rapport, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Rapport: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
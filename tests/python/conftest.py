@@ -0,0 +1,14 @@
+"""
+Tests unitaires des services Python: API DQE (racine du dépôt) et
+extracteur PDF (scripts/btp_pdf_extractor, modules importés à plat)
+
+    python -m pytest tests/python
+"""
+
+import sys
+from pathlib import Path
+
+RACINE = Path(__file__).resolve().parents[2]
+for chemin in (RACINE, RACINE / 'scripts' / 'btp_pdf_extractor'):
+    if str(chemin) not in sys.path:
+        sys.path.insert(0, str(chemin))
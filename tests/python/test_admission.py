@@ -0,0 +1,266 @@
+"""Contrôle d'admission et extractions partagées: extracteur PDF et API DQE (même algorithme)"""
+
+import asyncio
+
+import pytest
+
+from fastapi import HTTPException
+
+import api
+import dqe_api
+from admission import AdmissionRefusee, ControleurAdmission
+from dqe_api import AdmissionController
+
+
+async def tours(nombre: int = 10):
+    """Laisse les tâches admises reprendre la main"""
+    for _ in range(nombre):
+        await asyncio.sleep(0)
+
+
+def controleur_service(service: str, penalite_batch: float = 0.0):
+    """Contrôleur d'une place, sans part par client: (acquérir, libérer) de l'un ou l'autre service"""
+    if service == 'pdf':
+        controleur = ControleurAdmission(max_simultanees=1, budget_memoire=100, part_client=1.0,
+                                         penalite_batch=penalite_batch)
+        return (lambda client, cout=0.0, batch=False: controleur.acquerir(client, 1, cout=cout, batch=batch),
+                lambda client: controleur.liberer(client, 1, 0.0))
+    controleur = AdmissionController(max_concurrent=1, memory_budget=100, max_queue=32, client_share=1.0,
+                                     queue_timeout=300, batch_offset=penalite_batch)
+    return (lambda client, cout=0.0, batch=False: controleur.acquire(client, 1, cost=cout, batch=batch),
+            lambda client: controleur.release(client, 1, 0.0))
+
+
+async def ordre_admission(service, demandes):
+    """
+    Ordre d'admission de `demandes` [(client, coût, batch)], mises en file
+    derrière une extraction en cours puis admises une à une
+    """
+    acquerir, liberer = service
+    admises = []
+
+    async def demander(client, cout, batch):
+        await acquerir(client, cout, batch)
+        admises.append((client, cout))
+
+    await acquerir('en-cours')
+    taches = [asyncio.create_task(demander(*demande)) for demande in demandes]
+    await tours()
+    assert admises == []
+    liberer('en-cours')
+    while len(admises) < len(demandes):
+        await tours()
+        liberer(admises[-1][0])
+    await asyncio.gather(*taches)
+    return admises
+
+
+# ============================================================================
+# ORDRE D'ADMISSION
+# ============================================================================
+
+SERVICES = ['pdf', 'dqe']
+
+
+@pytest.mark.parametrize('service', SERVICES)
+def test_cout_croissant(service):
+    demandes = [('a', 200, False), ('b', 2, False), ('c', 20, False)]
+    admises = asyncio.run(ordre_admission(controleur_service(service), demandes))
+    assert [cout for _, cout in admises] == [2, 20, 200]
+
+
+@pytest.mark.parametrize('service', SERVICES)
+def test_penalite_batch(service):
+    demandes = [('import', 5, True), ('web', 30, False)]
+    admises = asyncio.run(ordre_admission(controleur_service(service, penalite_batch=50), demandes))
+    assert admises == [('web', 30), ('import', 5)]
+
+
+def test_vieillissement():
+    async def scenario():
+        controleur = ControleurAdmission(max_simultanees=1, budget_memoire=100, vieillissement=10_000)
+        await controleur.acquerir('en-cours', 1)
+        ancienne = asyncio.create_task(controleur.acquerir('a', 1, cout=200))
+        await asyncio.sleep(0.05)   # 500 pages créditées
+        recente = asyncio.create_task(controleur.acquerir('b', 1, cout=2))
+        await tours()
+        controleur.liberer('en-cours', 1, 0.0)
+        await tours()
+        assert ancienne.done() and not recente.done()
+        recente.cancel()
+
+    asyncio.run(scenario())
+
+
+# ============================================================================
+# PART PAR CLIENT
+# ============================================================================
+
+def test_part_client_admission():
+    async def scenario():
+        controleur = ControleurAdmission(max_simultanees=2, budget_memoire=100, part_client=0.5)
+        await controleur.acquerir('massif', 1)
+        await controleur.acquerir('autre', 1)
+        # Le client massif occupe déjà sa part (1 place sur 2): l'autre client
+        # passe avant lui malgré un coût plus élevé
+        massif = asyncio.create_task(controleur.acquerir('massif', 1, cout=1))
+        interactif = asyncio.create_task(controleur.acquerir('web', 1, cout=100))
+        await tours()
+        controleur.liberer('autre', 1, 0.0)
+        await tours()
+        assert interactif.done() and not massif.done()
+        # Seul en file: la part ne s'applique plus
+        controleur.liberer('web', 1, 0.0)
+        await tours()
+        assert massif.done()
+
+    asyncio.run(scenario())
+
+
+def test_part_client_file():
+    async def scenario():
+        controleur = ControleurAdmission(max_simultanees=1, budget_memoire=100, max_file=4, part_client=0.5)
+        await controleur.acquerir('en-cours', 1)
+        taches = [asyncio.create_task(controleur.acquerir('massif', 1)) for _ in range(2)]
+        await tours()
+        with pytest.raises(AdmissionRefusee) as refus:
+            await controleur.acquerir('massif', 1)
+        assert refus.value.status_code == 429
+        web = asyncio.create_task(controleur.acquerir('web', 1))
+        await tours()
+        assert controleur.en_attente == 3
+        for tache in taches + [web]:
+            tache.cancel()
+
+    asyncio.run(scenario())
+
+
+# ============================================================================
+# RETRY-AFTER
+# ============================================================================
+
+def test_retry_after_file_pleine():
+    async def scenario():
+        controleur = ControleurAdmission(max_simultanees=2, budget_memoire=100, max_file=2, part_client=1.0)
+        await controleur.acquerir('a', 1)
+        await controleur.acquerir('a', 1)
+        controleur._duree_moyenne = 10.0
+        taches = [asyncio.create_task(controleur.acquerir('b', 1)) for _ in range(2)]
+        await tours()
+        with pytest.raises(AdmissionRefusee) as refus:
+            await controleur.acquerir('c', 1)
+        # 3 extractions à écouler sur 2 places de 10 s
+        assert (refus.value.status_code, refus.value.retry_after) == (429, 15)
+        for tache in taches:
+            tache.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_suit_la_duree_moyenne():
+    controleur = ControleurAdmission(max_simultanees=1, budget_memoire=100)
+    assert controleur.retry_after() == 5
+    asyncio.run(controleur.acquerir('a', 1))
+    controleur.liberer('a', 1, 30.0)      # Moyenne glissante: 0.8 × 5 + 0.2 × 30
+    assert controleur.retry_after() == 10
+
+
+def test_dqe_retry_after_en_tete():
+    async def scenario():
+        controleur = AdmissionController(max_concurrent=1, memory_budget=100, max_queue=1,
+                                         client_share=1.0, queue_timeout=300)
+        await controleur.acquire('a', 1)
+        attente = asyncio.create_task(controleur.acquire('b', 1))
+        await tours()
+        with pytest.raises(HTTPException) as refus:
+            await controleur.acquire('c', 1)
+        assert refus.value.status_code == 429
+        assert refus.value.headers['Retry-After'] == '2'   # 2 tâches × 1 s sur 1 place
+        attente.cancel()
+
+    asyncio.run(scenario())
+
+
+# ============================================================================
+# FILE BLOQUÉE PAR UNE ATTENTE RETIRÉE
+# ============================================================================
+
+def test_attente_expiree_libere_la_file():
+    async def scenario():
+        controleur = ControleurAdmission(max_simultanees=2, budget_memoire=100, delai_attente=0.2)
+        await controleur.acquerir('a', 60)
+        # Trop lourde pour le budget restant mais prioritaire: elle bloque la légère
+        lourde = asyncio.create_task(controleur.acquerir('b', 60, cout=1))
+        await asyncio.sleep(0.1)
+        legere = asyncio.create_task(controleur.acquerir('c', 10, cout=100))
+        await asyncio.sleep(0)
+        assert not legere.done()
+
+        with pytest.raises(AdmissionRefusee) as refus:
+            await lourde
+        assert refus.value.status_code == 503
+        await asyncio.wait_for(legere, 0.05)   # Admise sans attendre une libération
+        assert controleur.actives == 2 and controleur.en_attente == 0
+
+    asyncio.run(scenario())
+
+
+def test_attente_annulee_libere_la_file():
+    async def scenario():
+        controleur = ControleurAdmission(max_simultanees=2, budget_memoire=100)
+        await controleur.acquerir('a', 60)
+        lourde = asyncio.create_task(controleur.acquerir('b', 60, cout=1))
+        legere = asyncio.create_task(controleur.acquerir('c', 10, cout=100))
+        await asyncio.sleep(0)
+
+        lourde.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await lourde
+        await asyncio.wait_for(legere, 0.05)
+        assert controleur.actives == 2
+
+    asyncio.run(scenario())
+
+
+def test_dqe_tache_annulee_libere_la_file():
+    async def scenario():
+        controleur = AdmissionController(max_concurrent=2, memory_budget=100, max_queue=8,
+                                         client_share=0.5, queue_timeout=300)
+        await controleur.acquire('a', 60)
+        lourde = asyncio.create_task(controleur.acquire('b', 60, cost=1))
+        legere = asyncio.create_task(controleur.acquire('c', 10, cost=100))
+        await asyncio.sleep(0)
+        assert not legere.done()
+
+        lourde.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await lourde
+        await asyncio.wait_for(legere, 0.05)
+        assert controleur.active == 2 and controleur.queued == 0
+
+    asyncio.run(scenario())
+
+
+# ============================================================================
+# EXTRACTIONS PARTAGÉES
+# ============================================================================
+
+@pytest.mark.parametrize('partager', [api.partager_extraction, dqe_api.single_flight])
+def test_demandeur_annule_ne_coupe_pas_l_extraction_partagee(partager):
+    async def scenario():
+        appels = []
+
+        async def extraction():
+            appels.append(1)
+            await asyncio.sleep(0.01)
+            return 'résultat'
+
+        cle = ('empreinte', 'local')
+        premier = asyncio.create_task(partager(cle, extraction))
+        second = asyncio.create_task(partager(cle, extraction))
+        await tours()
+        premier.cancel()
+        assert await second == 'résultat'
+        assert appels == [1]
+
+    asyncio.run(scenario())
@@ -0,0 +1,346 @@
+"""API DQE: ETag, plages d'octets, curseurs de pagination, index des matériaux, agrégat d'un lot et extraction"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import openpyxl
+import pytest
+from fastapi import HTTPException
+
+import dqe_api
+from dqe_api import (
+    ExtractRequest, _etag_matches, decode_cursor, encode_cursor, parse_range, store_extraction
+)
+from dqe_extractor_v2 import MaterialsIndex
+
+
+def requete(chemin: str, headers: dict = None) -> httpx.Response:
+    """GET sur l'application DQE, sans serveur"""
+    async def envoyer():
+        transport = httpx.ASGITransport(app=dqe_api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.get(chemin, headers=headers or {})
+    return asyncio.run(envoyer())
+
+
+@pytest.fixture
+def session_extraite():
+    """Session DQE dont l'extraction est terminée"""
+    session_id = 'test-session'
+    dqe_api.sessions[session_id] = {
+        'original_filename': 'devis.xlsx',
+        'expires_at': (datetime.now() + timedelta(hours=1)).isoformat(),
+        'extraction_result': {'materiaux': [{'designation': f'Poste {i}', 'quantite': i} for i in range(50)]},
+    }
+    yield session_id
+    dqe_api.sessions.pop(session_id, None)
+
+
+# ============================================================================
+# PLAGES D'OCTETS
+# ============================================================================
+
+@pytest.mark.parametrize('entete, attendu', [
+    ('bytes=0-9', (0, 9)),
+    ('bytes=90-', (90, 99)),
+    ('bytes=-10', (90, 99)),
+    ('bytes=50-500', (50, 99)),       # Fin ramenée à la taille
+    ('bytes=0-1,5-6', None),          # Plages multiples: réponse complète
+    ('items=0-9', None),
+    ('bytes=abc-', None),
+    ('bytes=-0', None),
+])
+def test_parse_range(entete, attendu):
+    assert parse_range(entete, 100) == attendu
+
+
+@pytest.mark.parametrize('entete', ['bytes=100-', 'bytes=150-200', 'bytes=9-5'])
+def test_parse_range_non_satisfaisable(entete):
+    with pytest.raises(HTTPException) as erreur:
+        parse_range(entete, 100)
+    assert erreur.value.status_code == 416
+    assert erreur.value.headers['Content-Range'] == 'bytes */100'
+
+
+def test_telechargement_partiel(session_extraite):
+    complet = requete(f'/dqe/{session_extraite}/download', {'Accept-Encoding': 'identity'})
+    partiel = requete(f'/dqe/{session_extraite}/download', {'Range': 'bytes=10-19'})
+
+    assert partiel.status_code == 206
+    assert partiel.content == complet.content[10:20]
+    assert partiel.headers['Content-Range'] == f'bytes 10-19/{len(complet.content)}'
+
+
+def test_telechargement_plage_hors_contenu(session_extraite):
+    reponse = requete(f'/dqe/{session_extraite}/download', {'Range': 'bytes=100000000-'})
+    assert reponse.status_code == 416
+    assert reponse.headers['Content-Range'].startswith('bytes */')
+
+
+# ============================================================================
+# ETAG
+# ============================================================================
+
+@pytest.mark.parametrize('entete, attendu', [
+    ('"abc"', True),
+    ('W/"abc"', True),                 # If-None-Match: comparaison faible
+    ('"xyz", "abc"', True),
+    ('*', True),
+    ('"abc-gzip"', False),             # Autre encodage: autre représentation
+    ('"ab"', False),
+    (None, False),
+])
+def test_etag_if_none_match(entete, attendu):
+    assert _etag_matches(entete, '"abc"') is attendu
+
+
+def test_etag_variante_compressee():
+    assert _etag_matches('"abc-gzip"', '"abc-gzip"')
+    assert not _etag_matches('"abc"', '"abc-gzip"')
+    assert not _etag_matches('"abc-br"', '"abc-gzip"')
+
+
+@pytest.mark.parametrize('entete, attendu', [
+    ('"abc"', True),
+    ('W/"abc"', False),                # If-Range: comparaison forte
+    ('"abc-gzip"', False),
+    ('*', False),
+])
+def test_etag_if_range(entete, attendu):
+    assert _etag_matches(entete, '"abc"', weak=False) is attendu
+
+
+def test_telechargement_304_par_encodage(session_extraite):
+    chemin = f'/dqe/{session_extraite}/download'
+    identite = requete(chemin, {'Accept-Encoding': 'identity'})
+    gzip = requete(chemin, {'Accept-Encoding': 'gzip'})
+    assert identite.headers['ETag'] != gzip.headers['ETag']
+
+    assert requete(chemin, {'Accept-Encoding': 'gzip', 'If-None-Match': gzip.headers['ETag']}).status_code == 304
+    # L'ETag de la représentation identité ne valide pas la variante gzip
+    assert requete(chemin, {'Accept-Encoding': 'gzip', 'If-None-Match': identite.headers['ETag']}).status_code == 200
+
+
+@pytest.mark.parametrize('variante, statut', [('identite', 206), ('faible', 200), ('gzip', 200)])
+def test_telechargement_if_range(session_extraite, variante, statut):
+    chemin = f'/dqe/{session_extraite}/download'
+    etags = {
+        'identite': requete(chemin, {'Accept-Encoding': 'identity'}).headers['ETag'],
+        'gzip': requete(chemin, {'Accept-Encoding': 'gzip'}).headers['ETag'],
+    }
+    etags['faible'] = 'W/' + etags['identite']
+    reponse = requete(chemin, {'Range': 'bytes=0-9', 'If-Range': etags[variante], 'Accept-Encoding': 'identity'})
+    assert reponse.status_code == statut
+
+
+# ============================================================================
+# CURSEURS
+# ============================================================================
+
+def test_curseur_aller_retour():
+    params = {'sheet': 'LOT 1', 'search': 'béton', 'sort': 'montant'}
+    curseur = encode_cursor('v1', 200, params)
+    assert '=' not in curseur
+    assert decode_cursor(curseur, 'v1', dict(reversed(list(params.items())))) == 200
+
+
+@pytest.mark.parametrize('curseur', ['pas-un-curseur', 'e30', '!!!'])
+def test_curseur_invalide(curseur):
+    with pytest.raises(HTTPException) as erreur:
+        decode_cursor(curseur, 'v1', {})
+    assert erreur.value.status_code == 400
+    assert erreur.value.detail == 'Curseur invalide'
+
+
+@pytest.mark.parametrize('version, params', [('v2', {'sheet': 'LOT 1'}), ('v1', {'sheet': 'LOT 2'})])
+def test_curseur_perime(version, params):
+    curseur = encode_cursor('v1', 100, {'sheet': 'LOT 1'})
+    with pytest.raises(HTTPException) as erreur:
+        decode_cursor(curseur, version, params)
+    assert erreur.value.status_code == 400
+    assert 'périmé' in erreur.value.detail
+
+
+# ============================================================================
+# INDEX DES MATÉRIAUX
+# ============================================================================
+
+LIGNES = [
+    {'designation': 'Béton dosé à 350 kg', 'sheet': 'LOT 1', 'category': 'Béton', 'unite': 'm3',
+     'quantite': 12.0, 'montant_total': 1_200_000},
+    {'designation': 'Agglos de 15 creux', 'sheet': 'LOT 1', 'category': 'Maçonnerie', 'unite': 'm2',
+     'quantite': 80.0, 'montant_total': 600_000},
+    {'designation': 'Béton de propreté', 'sheet': 'Lot 2', 'category': 'Béton', 'unite': 'M3',
+     'quantite': 3.0, 'montant_total': None},
+    {'designation': 'Tube PVC 100', 'sheet': 'Lot 2', 'category': 'Plomberie', 'unite': 'ml',
+     'quantite': None, 'montant_total': 90_000},
+]
+
+
+@pytest.fixture
+def index():
+    return MaterialsIndex(LIGNES)
+
+
+def designations(lignes):
+    return [ligne['designation'] for ligne in lignes]
+
+
+def test_index_filtre_insensible_a_la_casse(index):
+    lignes, total, suivant = index.query(filters={'sheet': 'lot 2'})
+    assert designations(lignes) == ['Béton de propreté', 'Tube PVC 100']
+    assert (total, suivant) == (2, None)
+
+
+def test_index_filtres_combines(index):
+    lignes, total, _ = index.query(filters={'category': 'béton', 'unite': 'm3', 'sheet': None})
+    assert designations(lignes) == ['Béton dosé à 350 kg', 'Béton de propreté']
+    lignes, total, _ = index.query(filters={'category': 'Béton', 'sheet': 'LOT 1'})
+    assert designations(lignes) == ['Béton dosé à 350 kg'] and total == 1
+
+
+def test_index_recherche_fragment(index):
+    lignes, _, _ = index.query(search='BÉT')
+    assert designations(lignes) == ['Béton dosé à 350 kg', 'Béton de propreté']
+    lignes, _, _ = index.query(search='béton dosé', filters={'sheet': 'Lot 2'})
+    assert lignes == []
+
+
+def test_index_tri_valeurs_absentes_en_fin(index):
+    lignes, _, _ = index.query(sort='montant', descending=True)
+    assert designations(lignes) == ['Béton dosé à 350 kg', 'Agglos de 15 creux', 'Tube PVC 100',
+                                    'Béton de propreté']
+    lignes, _, _ = index.query(sort='quantite', filters={'category': 'Béton'})
+    assert designations(lignes) == ['Béton de propreté', 'Béton dosé à 350 kg']
+
+
+def test_index_pagination(index):
+    page, total, suivant = index.query(limit=3)
+    assert (len(page), total, suivant) == (3, 4, 3)
+    page, total, suivant = index.query(offset=suivant, limit=3)
+    assert designations(page) == ['Tube PVC 100'] and suivant is None
+
+
+def test_index_facette_liste():
+    index = MaterialsIndex(
+        [{'designation': 'Ciment', 'sheets': ['LOT 1', 'LOT 3'], 'unite': 'sac', 'total_quantite': 40}],
+        facets={'sheet': 'sheets', 'unite': 'unite'}, sort_fields={'quantite': 'total_quantite'}
+    )
+    assert index.query(filters={'sheet': 'lot 3'})[1] == 1
+    assert index.query(filters={'sheet': 'LOT 2'})[1] == 0
+
+
+def test_index_filtre_ou_tri_inconnu(index):
+    with pytest.raises(ValueError):
+        index.query(filters={'fournisseur': 'X'})
+    with pytest.raises(ValueError):
+        index.query(sort='prix')
+
+
+# ============================================================================
+# AGRÉGAT D'UN LOT
+# ============================================================================
+
+class ExtracteurFactice:
+    """Extracteur DQE réduit à ce que lisent les index de matériaux"""
+
+    def __init__(self, quantite: float):
+        self.quantite = quantite
+
+    def aggregate_by_material(self):
+        return [{'key': 'ciment', 'designation': 'Ciment', 'unite': 'sac', 'total_quantite': self.quantite,
+                 'occurrences': 1, 'sheets': ['LOT 1']}]
+
+    def get_all_materials(self):
+        return [{'designation': 'Ciment', 'sheet': 'LOT 1', 'unite': 'sac', 'quantite': self.quantite}]
+
+    def build_materials_index(self, aggregate: bool = False):
+        return MaterialsIndex(self.get_all_materials())
+
+
+@pytest.fixture
+def lot_extrait():
+    """Lot de deux sessions extraites"""
+    expiration = (datetime.now() + timedelta(hours=1)).isoformat()
+    ids = ['lot-a', 'lot-b']
+    for session_id in ids:
+        dqe_api.sessions[session_id] = {'id': session_id, 'original_filename': f'{session_id}.xlsx',
+                                        'expires_at': expiration, 'extractor': ExtracteurFactice(10)}
+        store_extraction(dqe_api.sessions[session_id], {'materiaux': []}, ExtractRequest())
+    dqe_api.batches['lot'] = {'id': 'lot', 'session_ids': ids, 'expires_at': expiration,
+                              'aggregate_index': None, 'aggregate_members': None}
+    yield 'lot'
+    dqe_api.batches.pop('lot', None)
+    for session_id in ids:
+        dqe_api.sessions.pop(session_id, None)
+
+
+def test_agregat_du_lot_suit_la_reextraction_d_une_session(lot_extrait):
+    assert requete(f'/dqe/batch/{lot_extrait}/materials').json()['materials'][0]['total_quantite'] == 20
+
+    # Extraction à nouveau d'une seule session (/dqe/{id}/extract)
+    session = dqe_api.sessions['lot-b']
+    session['extractor'] = ExtracteurFactice(5)
+    store_extraction(session, {'materiaux': []}, ExtractRequest())
+
+    assert requete(f'/dqe/batch/{lot_extrait}/materials').json()['materials'][0]['total_quantite'] == 15
+
+
+def test_agregat_du_lot_sans_session_expiree(lot_extrait):
+    requete(f'/dqe/batch/{lot_extrait}/materials')
+    del dqe_api.sessions['lot-a']
+    reponse = requete(f'/dqe/batch/{lot_extrait}/materials').json()
+    assert reponse['files_count'] == 1 and reponse['materials'][0]['total_quantite'] == 10
+
+
+
+def test_agregat_du_lot_avec_noms_de_fichiers_identiques(lot_extrait):
+    for session_id in ('lot-a', 'lot-b'):
+        dqe_api.sessions[session_id]['original_filename'] = 'devis.xlsx'
+    materiau = requete(f'/dqe/batch/{lot_extrait}/materials').json()['materials'][0]
+    assert materiau['total_quantite'] == 20
+    assert materiau['files'] == ['devis.xlsx', 'devis (2).xlsx']
+
+
+# ============================================================================
+# EXTRACTION AVANT LA FIN DES APERÇUS
+# ============================================================================
+
+@pytest.fixture
+def classeur_sans_noms_parlants(tmp_path):
+    """Classeur dont l'onglet récapitulatif porte un nom générique"""
+    classeur = openpyxl.Workbook()
+    detail = classeur.active
+    detail.title = 'Feuil1'
+    detail.append(['N°', 'Désignation', 'Unité', 'Quantité', 'Prix unitaire', 'Montant'])
+    detail.append(['1.1', 'Béton de propreté dosé à 150 kg', 'M3', 12, 85000, 1020000])
+    synthese = classeur.create_sheet('Feuil2')
+    synthese.append(['', 'Désignation', 'Unité', 'Quantite', 'Total'])
+    synthese.append(['', 'Ciment CPJ 42.5 en sacs de 50 kg', 'SAC', 120, 120])
+    chemin = tmp_path / 'devis.xlsx'
+    classeur.save(chemin)
+    return chemin
+
+
+def test_extraction_juste_apres_l_upload(classeur_sans_noms_parlants):
+    async def scenario():
+        transport = httpx.ASGITransport(app=dqe_api.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            with open(classeur_sans_noms_parlants, 'rb') as fichier:
+                reponse = await client.post('/dqe/upload', params={'preview_budget': 0},
+                                            files={'file': ('devis.xlsx', fichier)})
+            session_id = reponse.json()['session_id']
+            session = dqe_api.sessions[session_id]
+            # Aperçus encore en cours de calcul en arrière-plan
+            if session.get('preview_task'):
+                session['preview_task'].cancel()
+            assert session['extractor'].pending_previews() == [0, 1]
+            try:
+                return (await client.post(f'/dqe/{session_id}/extract', json={})).json()
+            finally:
+                dqe_api.cleanup_session(session_id)
+
+    resultat = asyncio.run(scenario())
+    types = {onglet['sheet_name']: onglet['sheet_type'] for onglet in resultat['data']['sheets']}
+    assert types == {'Feuil1': 'detailed', 'Feuil2': 'summary'}
@@ -0,0 +1,195 @@
+"""Extracteur PDF: postes reconstitués à partir des mots, titres de lot, budget mémoire"""
+
+import pytest
+
+import extractor
+from extractor import (
+    ExtracteurPDFPlumber, LignePoste, MemoireDepassee, SuiviMemoire, decouper_ligne, repartir_montants
+)
+
+
+@pytest.fixture
+def extracteur():
+    return ExtracteurPDFPlumber('devis.pdf', nb_processus=1)
+
+
+def mots_ligne(haut: float, *champs: str, largeur_car: float = 5.0, ecart_champs: float = 30.0):
+    """
+    Mots [gauche, bas, droite, haut, texte] d'une ligne: un espace entre
+    les mots d'un champ, `ecart_champs` points entre deux champs
+    """
+    mots, gauche = [], 50.0
+    for champ in champs:
+        for mot in champ.split():
+            droite = gauche + largeur_car * len(mot)
+            mots.append([gauche, haut - 10, droite, haut, mot])
+            gauche = droite + largeur_car
+        gauche += ecart_champs
+    return mots
+
+
+def ligne_poste(haut: float, texte: str, *montants: str, colonnes=(300.0, 400.0, 500.0),
+                largeur_car: float = 5.0):
+    """Ligne de poste: texte à gauche, montants ('' = vide) alignés à droite sur les colonnes"""
+    mots = mots_ligne(haut, texte, largeur_car=largeur_car)
+    for montant, droite in zip(montants, colonnes):
+        if montant:
+            groupes = montant.split()
+            largeur = largeur_car * (sum(len(g) for g in groupes) + len(groupes) - 1)
+            gauche = droite - largeur
+            for groupe in groupes:
+                mots.append([gauche, haut - 10, gauche + largeur_car * len(groupe), haut, groupe])
+                gauche += largeur_car * (len(groupe) + 1)
+    return mots
+
+
+# ============================================================================
+# DÉCOUPAGE DES LIGNES DE POSTES
+# ============================================================================
+
+SEUIL = 7.5   # 1.5 × écart de 5 points entre les mots de mots_ligne
+
+
+def test_decouper_ligne_separateur_de_milliers():
+    ligne = decouper_ligne(mots_ligne(700, '1.1 Béton dosé à 350 kg m3', '10', '25 000', '250 000'), SEUIL)
+    assert ligne.numero == '1.1'
+    assert ligne.designation == ['Béton', 'dosé', 'à', '350', 'kg']
+    assert ligne.unite == 'm3'
+    assert [texte for texte, _ in ligne.montants] == ['10', '25 000', '250 000']
+
+
+def test_decouper_ligne_montants_espaces():
+    # Trois chiffres loin du montant précédent: montant distinct
+    ligne = decouper_ligne(mots_ligne(700, '2 Peinture ens', '1', '250'), SEUIL)
+    assert [texte for texte, _ in ligne.montants] == ['1', '250']
+    assert ligne.montants[-1][1] == 210.0   # Bord droit du montant
+
+
+def test_decouper_ligne_nombre_en_fin_de_designation():
+    ligne = decouper_ligne(mots_ligne(700, '3.2 Tube PVC 100', '12', '3 500', '42 000'), SEUIL)
+    assert ligne.unite == ''
+    assert ligne.designation == ['Tube', 'PVC', '100']
+    assert [texte for texte, _ in ligne.montants] == ['12', '3 500', '42 000']
+
+
+@pytest.mark.parametrize('montants, attendu', [
+    ([['10', 0], ['2 500', 0], ['25 000', 0]], ('10', '2 500', '25 000')),
+    ([['10', 0], ['25 000', 0]], ('10', None, '25 000')),     # Quantité et total
+    ([['4', 0]], ('4', None, None)),
+    ([], (None, None, None)),
+])
+def test_repartir_montants_de_droite_a_gauche(montants, attendu):
+    assert repartir_montants(LignePoste('1', ['Poste'], 'u', montants), None) == attendu
+
+
+def test_repartir_montants_par_colonne():
+    colonnes = [300.0, 400.0, 500.0]
+    # P.U vide: le total reste dans sa colonne
+    ligne = LignePoste('1', ['Poste'], 'u', [['10', 302.0], ['25 000', 498.0]])
+    assert repartir_montants(ligne, colonnes) == ('10', None, '25 000')
+    # Montant hors de toute colonne: ignoré
+    ligne = LignePoste('1', ['Poste'], 'u', [['10', 350.0], ['2 500', 401.0]])
+    assert repartir_montants(ligne, colonnes) == (None, '2 500', None)
+
+
+# ============================================================================
+# TITRES DE LOT
+# ============================================================================
+
+@pytest.mark.parametrize('texte', [
+    'LOT 2 - PLOMBERIE',
+    'Lot n° 3 : Electricité',
+    'Chapitre 4',
+    'II. MAÇONNERIE',
+    'IV - Electricité',
+    'XII) GROS OEUVRE',
+    'III. BÉTON DOSÉ À 350 KG',
+])
+def test_titre_lot_reconnu(extracteur, texte):
+    assert extracteur._est_titre_lot(texte)
+
+
+@pytest.mark.parametrize('texte', [
+    'Il est précisé que les prix sont HT',
+    "M. le Maître d'ouvrage",
+    'Civil works',
+    'DI 1 ml',
+    'i. note de calcul',
+    'V. TOTAL 12 500 000',
+    'VI. Les prix comprennent la fourniture, le transport, la pose et toutes sujétions de mise en œuvre',
+])
+def test_prose_non_reconnue_comme_titre(extracteur, texte):
+    assert not extracteur._est_titre_lot(texte)
+
+
+def test_prose_ne_change_pas_le_lot_courant(extracteur):
+    mots = (
+        mots_ligne(700, 'LOT 1 - GROS OEUVRE')
+        + ligne_poste(680, '1.1 Béton dosé à 350 kg m3', '10', '25 000', '250 000')
+        + mots_ligne(660, 'Il est précisé que les prix sont HT')
+        + mots_ligne(640, "M. le Maître d'ouvrage")
+        + ligne_poste(620, '1.2 Agglos de 15 m2', '20', '', '150 000')
+    )
+    extracteur._traiter_mots(mots)
+
+    assert [(e.numero, e.lot_numero, e.lot_nom, e.prix_total) for e in extracteur.elements] == [
+        ('1.1', '1', 'GROS OEUVRE', 250000.0),
+        ('1.2', '1', 'GROS OEUVRE', 150000.0),   # P.U vide: colonnes respectées
+    ]
+
+
+@pytest.mark.parametrize('ligne_titre', [
+    ['II - GROS ŒUVRE', None, None, '1', None, None],
+    ['II - GROS ŒUVRE 1', None, None, None, None, None],   # Quantité fusionnée dans la cellule
+])
+def test_titre_lot_dans_un_tableau(extracteur, ligne_titre):
+    extracteur._traiter_tableau([
+        ['N°', 'Désignation', 'U', 'Qté', 'P.U', 'Total'],
+        ligne_titre,
+        ['2.1', 'Béton dosé à 350 kg', 'm3', '10', '25 000', '250 000'],
+    ])
+    assert [(e.numero, e.lot_nom) for e in extracteur.elements] == [('2.1', ligne_titre[0])]
+
+
+# ============================================================================
+# BUDGET MÉMOIRE
+# ============================================================================
+
+@pytest.fixture
+def rss(monkeypatch):
+    """RSS du processus simulée (Mo), modifiable par le test"""
+    valeur = {'mo': 100.0}
+    monkeypatch.setattr(extractor, 'memoire_processus_mo', lambda: valeur['mo'])
+    return valeur
+
+
+def test_budget_memoire_extraction_seule(rss):
+    suivi = SuiviMemoire(budget_mo=50)
+    suivi.demarrer()
+    rss['mo'] = 200.0
+    try:
+        with pytest.raises(MemoireDepassee):
+            suivi.relever()
+    finally:
+        suivi.terminer()
+
+
+def test_budget_memoire_extractions_simultanees(rss):
+    petit, gros = SuiviMemoire(budget_mo=50), SuiviMemoire(budget_mo=50)
+    petit.demarrer()
+    gros.demarrer()
+    rss['mo'] = 200.0   # Hausse due au gros document
+    petit.relever()
+    gros.terminer()
+    petit.relever()     # Toujours pas seul depuis son début
+    petit.terminer()
+    assert petit.pic_mo == 100.0
+
+    suivant = SuiviMemoire(budget_mo=50)
+    suivant.demarrer()
+    rss['mo'] = 300.0
+    try:
+        with pytest.raises(MemoireDepassee):
+            suivant.relever()
+    finally:
+        suivant.terminer()